@@ -15,6 +15,9 @@ from schemas.ai_model_config import (
     AIModelConfigList
 )
 from db.session import async_session
+from services.intent_router import invalidate_llm_config
+from services.embedding_service import invalidate_embedding_config
+from services.model_cache_service import ModelCacheService
 
 router = APIRouter()
 
@@ -25,6 +28,18 @@ async def get_db():
         yield session
 
 
+async def notify_config_changed(db_config: SysAiModelConfig, db: AsyncSession, deleted: bool = False):
+    """配置写入后使各worker的配置缓存失效"""
+    try:
+        if db_config.model_type == 'embedding':
+            await invalidate_embedding_config()
+        elif db_config.model_type == 'chat':
+            await invalidate_llm_config()
+            await ModelCacheService.sync_model_change(db_config.user_id, db_config.id, db, deleted=deleted)
+    except Exception as e:
+        logging.warning(f"配置缓存失效通知失败: {e}")
+
+
 @router.post("/ai-model-configs", response_model=AIModelConfigResponse, status_code=201)
 async def create_ai_model_config(
     config: AIModelConfigCreate,
@@ -50,6 +65,7 @@ async def create_ai_model_config(
         await db.refresh(db_config)
 
         logging.info(f"AI模型配置创建成功: id={db_config.id}, user_id={config.user_id}")
+        await notify_config_changed(db_config, db)
         return db_config
     except Exception as e:
         await db.rollback()
@@ -177,6 +193,7 @@ async def update_ai_model_config(
         await db.refresh(db_config)
 
         logging.info(f"AI模型配置更新成功: id={config_id}")
+        await notify_config_changed(db_config, db)
         return db_config
     except HTTPException:
         raise
@@ -207,6 +224,7 @@ async def delete_ai_model_config(
         await db.commit()
 
         logging.info(f"AI模型配置删除成功: id={config_id}")
+        await notify_config_changed(config, db, deleted=True)
         return {"message": "配置删除成功"}
     except HTTPException:
         raise
@@ -2,16 +2,19 @@
 对话历史API端点
 提供对话会话和消息的查询接口
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc
+from sqlalchemy import select, desc, tuple_
+from sqlalchemy.orm import defer
 from pydantic import BaseModel
 from api.dependencies.dependencies import get_async_session
-from models.sys_conversation import SysConversation, SysConversationMessage, MessageRoleEnum
-from typing import List, Optional
+from models.sys_conversation import SysConversation, SysConversationMessage
+from services.result_store import result_store
+from typing import List, Optional, Tuple
+from datetime import datetime
 import logging
-import json
 import asyncio
+import base64
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -77,63 +80,88 @@ async def create_conversation(
         )
 
 
+def _encode_cursor(updated_at: datetime, conversation_id: int) -> str:
+    """编码分页游标(上一页最后一条会话的 updated_at + id)"""
+    raw = f"{updated_at.isoformat()}|{conversation_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """解码分页游标"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        updated_at, conversation_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(updated_at), int(conversation_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+
 @router.get("/conversations/{user_id}")
 async def get_user_conversations(
     user_id: int,
-    limit: int = 20,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
     db: AsyncSession = Depends(get_async_session)
 ):
     """
-    获取用户的历史对话列表
+    获取用户的历史对话列表(按更新时间倒序,游标分页)
+
+    最后一条用户消息来自会话表的冗余字段,整个列表只需一次查询
 
     Args:
         user_id: 用户ID
-        limit: 返回数量限制
+        limit: 每页数量
+        cursor: 分页游标(上一页返回的next_cursor),为空时返回第一页
         db: 数据库会话
 
     Returns:
-        对话列表，包含每个对话的基本信息和最后一条消息
+        对话列表，包含每个对话的基本信息和最后一条消息; next_cursor为空表示没有更多数据
     """
     try:
-        # 查询用户的所有对话会话(按更新时间倒序)
-        result = await db.execute(
+        query = (
             select(SysConversation)
             .where(SysConversation.user_id == user_id)
-            .order_by(desc(SysConversation.updated_at))
-            .limit(limit)
+            .order_by(desc(SysConversation.updated_at), desc(SysConversation.id))
+            .limit(limit + 1)
         )
+        if cursor:
+            cursor_updated_at, cursor_id = _decode_cursor(cursor)
+            query = query.where(
+                tuple_(SysConversation.updated_at, SysConversation.id) < tuple_(cursor_updated_at, cursor_id)
+            )
+
+        result = await db.execute(query)
         conversations = result.scalars().all()
 
-        # 为每个对话获取最后一条用户消息
+        has_more = len(conversations) > limit
+        conversations = conversations[:limit]
+
         conversation_list = []
         for conv in conversations:
-            # 获取该对话的最后一条用户消息
-            msg_result = await db.execute(
-                select(SysConversationMessage)
-                .where(
-                    SysConversationMessage.conversation_id == conv.id,
-                    SysConversationMessage.role == MessageRoleEnum.USER
-                )
-                .order_by(desc(SysConversationMessage.created_at))
-                .limit(1)
-            )
-            last_user_msg = msg_result.scalar_one_or_none()
-
             conversation_list.append({
                 "id": conv.id,
                 "title": conv.title,
                 "message_count": conv.message_count,
                 "created_at": conv.created_at.isoformat(),
                 "updated_at": conv.updated_at.isoformat(),
-                "last_user_message": last_user_msg.content if last_user_msg else "",
-                "last_message_time": last_user_msg.created_at.isoformat() if last_user_msg else conv.updated_at.isoformat()
+                "last_user_message": conv.last_user_message or "",
+                "last_message_time": (conv.last_message_at or conv.updated_at).isoformat()
             })
 
+        next_cursor = None
+        if has_more and conversations:
+            last = conversations[-1]
+            next_cursor = _encode_cursor(last.updated_at, last.id)
+
         return {
             "success": True,
-            "conversations": conversation_list
+            "conversations": conversation_list,
+            "has_more": has_more,
+            "next_cursor": next_cursor
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"获取用户对话列表失败: {e}")
         raise HTTPException(
@@ -142,16 +170,48 @@ async def get_user_conversations(
         )
 
 
+def _message_to_dict(msg: SysConversationMessage, chart_mode: str, has_chart: bool) -> dict:
+    """转换消息为响应格式"""
+    message_data = {
+        "id": msg.id,
+        "role": msg.role.value,
+        "content": msg.content,
+        "created_at": msg.created_at.isoformat(),
+        "response_time": msg.response_time,
+        "tokens_used": msg.tokens_used
+    }
+
+    if has_chart:
+        message_data["chart_type"] = msg.chart_type
+        if chart_mode == "ref":
+            # 按引用返回,前端需要渲染时再单独获取
+            message_data["has_chart_data"] = True
+            message_data["chart_data_url"] = f"/api/conversation/message/{msg.id}/chart_data"
+        else:
+            message_data["chart_data"] = msg.chart_data
+
+    return message_data
+
+
 @router.get("/conversation/{conversation_id}/messages")
 async def get_conversation_messages(
     conversation_id: int,
+    limit: Optional[int] = Query(None, ge=1, le=200),
+    before_id: Optional[int] = None,
+    chart_mode: str = Query("inline", pattern="^(inline|ref)$"),
     db: AsyncSession = Depends(get_async_session)
 ):
     """
-    获取指定对话的所有消息
+    获取指定对话的消息
+
+    分页从最新消息向前翻页: 第一页为最新的limit条,下一页传入上一页返回的next_before_id;
+    每一页内的消息按时间正序返回。不传limit时返回全部消息(兼容旧接口)
 
     Args:
         conversation_id: 对话会话ID
+        limit: 每页数量(为空返回全部)
+        before_id: 分页游标,只返回ID小于该值的消息
+        chart_mode: inline - 直接返回图表数据; ref - 只返回图表数据的获取地址
         db: 数据库会话
 
     Returns:
@@ -171,35 +231,44 @@ async def get_conversation_messages(
                 detail="对话会话不存在"
             )
 
-        # 查询该对话的所有消息(按时间正序)
-        msg_result = await db.execute(
-            select(SysConversationMessage)
+        # 消息ID自增,与创建时间同序,作为分页游标
+        query = (
+            select(
+                SysConversationMessage,
+                SysConversationMessage.chart_data.isnot(None).label("has_chart")
+            )
             .where(SysConversationMessage.conversation_id == conversation_id)
-            .order_by(SysConversationMessage.created_at.asc())
+            .order_by(SysConversationMessage.id.desc())
         )
-        messages = msg_result.scalars().all()
-
-        # 转换为响应格式
-        message_list = []
-        for msg in messages:
-            message_data = {
-                "id": msg.id,
-                "role": msg.role.value,
-                "content": msg.content,
-                "created_at": msg.created_at.isoformat(),
-                "response_time": msg.response_time,
-                "tokens_used": msg.tokens_used
-            }
-
-            # 如果有图表数据，解析并添加
-            if msg.chart_data:
-                try:
-                    message_data["chart_data"] = json.loads(msg.chart_data)
-                    message_data["chart_type"] = msg.chart_type
-                except json.JSONDecodeError:
-                    logger.warning(f"消息 {msg.id} 的图表数据解析失败")
-
-            message_list.append(message_data)
+        if chart_mode == "ref":
+            # 不加载可能很大的图表数据
+            query = query.options(defer(SysConversationMessage.chart_data))
+        if before_id:
+            query = query.where(SysConversationMessage.id < before_id)
+        if limit:
+            query = query.limit(limit + 1)
+
+        msg_result = await db.execute(query)
+        rows = msg_result.all()
+
+        has_more = bool(limit) and len(rows) > limit
+        if limit:
+            rows = rows[:limit]
+        rows.reverse()
+
+        message_list = [
+            _message_to_dict(msg, chart_mode, has_chart)
+            for msg, has_chart in rows
+        ]
+
+        # 图表数据只保存了结果引用的消息,按引用加载数据
+        if chart_mode == "inline":
+            with_chart = [m for m in message_list if m.get("chart_data")]
+            hydrated = await asyncio.gather(
+                *(result_store.hydrate_chart_data(m["chart_data"]) for m in with_chart)
+            )
+            for message_data, chart_data in zip(with_chart, hydrated):
+                message_data["chart_data"] = chart_data
 
         return {
             "success": True,
@@ -210,7 +279,9 @@ async def get_conversation_messages(
                 "updated_at": conversation.updated_at.isoformat(),
                 "message_count": conversation.message_count
             },
-            "messages": message_list
+            "messages": message_list,
+            "has_more": has_more,
+            "next_before_id": message_list[0]["id"] if has_more else None
         }
 
     except HTTPException:
@@ -223,6 +294,50 @@ async def get_conversation_messages(
         )
 
 
+@router.get("/conversation/message/{message_id}/chart_data")
+async def get_message_chart_data(
+    message_id: int,
+    db: AsyncSession = Depends(get_async_session)
+):
+    """
+    获取单条消息的图表数据(配合 chart_mode=ref 使用)
+
+    Args:
+        message_id: 消息ID
+        db: 数据库会话
+
+    Returns:
+        图表数据和图表类型
+    """
+    try:
+        result = await db.execute(
+            select(SysConversationMessage.chart_data, SysConversationMessage.chart_type)
+            .where(SysConversationMessage.id == message_id)
+        )
+        row = result.one_or_none()
+
+        if not row:
+            raise HTTPException(status_code=404, detail="消息不存在")
+        if row.chart_data is None:
+            raise HTTPException(status_code=404, detail="该消息没有图表数据")
+
+        return {
+            "success": True,
+            "message_id": message_id,
+            "chart_type": row.chart_type,
+            "chart_data": await result_store.hydrate_chart_data(row.chart_data)
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"获取消息图表数据失败: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"获取消息图表数据失败: {str(e)}"
+        )
+
+
 @router.put("/conversation/{conversation_id}/title")
 async def update_conversation_title(
     conversation_id: int,
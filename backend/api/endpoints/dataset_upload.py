@@ -2,30 +2,168 @@
 数据集文件上传API端点
 支持CSV和Excel文件上传
 """
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, BackgroundTasks
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Request
+from pydantic import BaseModel, Field
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from uuid import uuid4
+from typing import Optional
+from uuid import UUID, uuid4
 from datetime import datetime
+import base64
+import hashlib
 import logging
 import os
-import hashlib
 
 from models.sys_dataset import SysDataset
-from core.minio_client import minio_client
+from core.minio_client import HashingReader, UploadTooLargeError, async_minio, object_name_from_path
 from core.config import settings
 from api.dependencies.dependencies import get_async_session
+from services.dedup_index import RowChunker, delete_chunks, find_append_base, save_chunks, supports_fingerprint
+from services.dataset_jobs import JOB_PARSE, JOB_CHUNK, JOB_VECTORIZE, JOB_EMBEDDING, JOB_APPEND, enqueue_dataset_job
+from services.duckdb_query import dataset_parquet_objects
+from services.rollup_cache import rollup_objects
+from services.job_queue import PRIORITY_HIGH, job_queue
+from services.preview_cache import preview_cache
+from services.upload_sessions import UploadSessionError, upload_sessions
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
+def _job_summary(job: dict) -> dict:
+    """返回给前端的任务状态(不含任务参数)"""
+    return {key: value for key, value in job.items() if key not in ("payload", "score")}
+
+
+async def _get_dataset_jobs(dataset_id: str) -> list:
+    """查询数据集相关的后台任务, 任务队列不可用时返回空列表"""
+    try:
+        return [_job_summary(job) for job in await job_queue.get_dataset_jobs(dataset_id)]
+    except Exception as e:
+        logger.warning(f"查询数据集任务状态失败: {dataset_id}, {e}")
+        return []
+
+
+async def _check_duplicate(session: AsyncSession, file_md5: str):
+    """已存在相同MD5的数据集时返回409"""
+    result = await session.execute(
+        select(SysDataset).where(SysDataset.file_md5 == file_md5)
+    )
+    existing_dataset = result.scalar_one_or_none()
+
+    if existing_dataset:
+        logger.warning(f"重复上传检测: 文件MD5={file_md5} 已存在,数据集ID={existing_dataset.id}")
+        raise HTTPException(
+            status_code=409,
+            detail={
+                "error": "duplicate_file",
+                "message": f"该文件已上传过,文件名: {existing_dataset.name}",
+                "existing_dataset": {
+                    "id": str(existing_dataset.id),
+                    "name": existing_dataset.name,
+                    "created_at": existing_dataset.created_at.isoformat() if existing_dataset.created_at else None
+                }
+            }
+        )
+
+
+async def _create_dataset(
+    session: AsyncSession,
+    dataset_id,
+    filename: str,
+    logical_name: Optional[str],
+    description: Optional[str],
+    file_path: str,
+    file_size: int,
+    file_md5: str,
+    chunks: Optional[list] = None,
+    append_base: Optional[dict] = None
+) -> dict:
+    """
+    创建数据集记录并提交解析任务
+
+    chunks: 原文件的分块指纹(CSV); append_base: 文件是已有数据集追加行的结果时的基础数据集信息,
+    解析任务只解析追加的行
+    """
+    extra_metadata = None
+    if append_base:
+        base = await session.get(SysDataset, UUID(append_base["dataset_id"]))
+        extra_metadata = {"append_base": append_base}
+        # 追加行与基础文件的编码、分隔符相同
+        text_format = (base.extra_metadata or {}).get("text_format") if base else None
+        if text_format:
+            extra_metadata["text_format"] = text_format
+
+    dataset = SysDataset(
+        id=dataset_id,
+        name=filename,
+        logical_name=logical_name or filename.rsplit('.', 1)[0],
+        description=description,
+        original_file_path=file_path,
+        file_size=file_size,
+        file_md5=file_md5,
+        parse_status='pending',
+        embedding_status='pending',
+        extra_metadata=extra_metadata
+    )
+    session.add(dataset)
+    if chunks:
+        save_chunks(session, dataset_id, chunks)
+    await session.commit()
+    await session.refresh(dataset)
+
+    logger.info(f"数据集记录已创建: {dataset_id}")
+
+    # 提交解析任务(由任务worker执行)
+    # 数据集记录已提交, 提交任务失败(如Redis不可用)时保留原文件并标记解析失败, 之后可通过重试解析恢复
+    try:
+        job_id = await enqueue_dataset_job(
+            JOB_PARSE,
+            str(dataset_id),
+            file_path=file_path,
+            filename=filename,
+            append_base=append_base
+        )
+    except Exception as e:
+        logger.error(f"提交解析任务失败: {dataset_id}, {e}")
+        dataset.parse_status = 'failed'
+        dataset.error_message = f"提交解析任务失败: {e}"
+        await session.commit()
+        job_id = None
+
+    return {
+        "dataset_id": str(dataset_id),
+        "job_id": job_id,
+        "status": "parsing" if job_id else "failed",
+        "message": "文件上传成功,正在后台解析..." if job_id else "文件上传成功,但提交解析任务失败,请稍后重试解析",
+        "file_name": filename,
+        "file_size": file_size,
+        "append_of": append_base["dataset_id"] if append_base else None,
+        "new_rows_offset": append_base["offset"] if append_base else None
+    }
+
+
+def _validate_extension(filename: str):
+    """校验文件类型"""
+    file_ext = os.path.splitext(filename)[1].lower()
+    if file_ext not in settings.ALLOWED_EXTENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"不支持的文件格式: {file_ext}. 仅支持: {', '.join(settings.ALLOWED_EXTENSIONS)}"
+        )
+
+
+def _new_object_name(dataset_id, filename: str) -> str:
+    """原始文件在MinIO中的路径"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"uploads/{dataset_id}_{timestamp}_{filename}"
+
+
 @router.post("/upload_dataset")
 async def upload_dataset(
     file: UploadFile = File(...),
     logical_name: str = None,
     description: str = None,
-    background_tasks: BackgroundTasks = None,
     session: AsyncSession = Depends(get_async_session)
 ):
     """
@@ -35,7 +173,6 @@ async def upload_dataset(
         file: 上传的文件
         logical_name: 逻辑名称(可选)
         description: 数据集描述(可选)
-        background_tasks: 后台任务
         session: 数据库会话
 
     Returns:
@@ -46,116 +183,366 @@ async def upload_dataset(
         }
     """
     # 校验文件类型
-    file_ext = os.path.splitext(file.filename)[1].lower()
-    if file_ext not in settings.ALLOWED_EXTENSIONS:
+    _validate_extension(file.filename)
+
+    # 已知大小时提前拒绝过大的文件
+    declared_size = getattr(file, "size", None)
+    if declared_size is not None and declared_size > settings.MAX_UPLOAD_SIZE:
         raise HTTPException(
             status_code=400,
-            detail=f"不支持的文件格式: {file_ext}. 仅支持: {', '.join(settings.ALLOWED_EXTENSIONS)}"
+            detail=f"文件过大: {declared_size / 1024 / 1024:.2f}MB. 最大允许: {settings.MAX_UPLOAD_SIZE / 1024 / 1024}MB"
         )
 
-    # 读取文件数据
+    # 生成数据集ID和存储路径
+    dataset_id = uuid4()
+    object_name = _new_object_name(dataset_id, file.filename)
+
+    # 流式上传到MinIO, 读取过程中同时计算MD5和CSV分块指纹(不把整个文件读入内存)
+    chunker = RowChunker() if supports_fingerprint(file.filename) else None
+    reader = HashingReader(
+        file.file,
+        max_size=settings.MAX_UPLOAD_SIZE,
+        on_data=chunker.feed if chunker else None
+    )
     try:
-        file_data = await file.read()
-        file_size = len(file_data)
+        file_path = await async_minio.upload_stream(
+            reader,
+            object_name,
+            file.content_type or "application/octet-stream"
+        )
+    except UploadTooLargeError:
+        await async_minio.delete_file(object_name)
+        raise HTTPException(
+            status_code=400,
+            detail=f"文件过大: 超过 {settings.MAX_UPLOAD_SIZE / 1024 / 1024}MB"
+        )
+    except Exception as e:
+        logger.error(f"上传文件到MinIO失败: {e}")
+        await async_minio.delete_file(object_name)
+        raise HTTPException(status_code=500, detail=f"文件上传失败: {str(e)}")
 
-        # 检查文件大小
-        if file_size > settings.MAX_UPLOAD_SIZE:
-            raise HTTPException(
-                status_code=400,
-                detail=f"文件过大: {file_size / 1024 / 1024:.2f}MB. 最大允许: {settings.MAX_UPLOAD_SIZE / 1024 / 1024}MB"
-            )
+    file_size = reader.size
+    file_md5 = reader.hexdigest()
+    logger.info(f"文件已上传到MinIO: {file_path}, 大小: {file_size}, MD5: {file_md5}")
 
+    try:
         if file_size == 0:
             raise HTTPException(status_code=400, detail="文件为空")
 
-        # 计算文件MD5哈希值
-        file_md5 = hashlib.md5(file_data).hexdigest()
-        logger.info(f"文件MD5: {file_md5}")
+        # 上传完成后检查是否已存在相同MD5的文件
+        await _check_duplicate(session, file_md5)
 
-        # 检查是否已存在相同MD5的文件
-        result = await session.execute(
-            select(SysDataset).where(SysDataset.file_md5 == file_md5)
-        )
-        existing_dataset = result.scalar_one_or_none()
+        # 只在已有数据集末尾追加了行的文件, 只解析追加的行
+        chunks = chunker.finish() if chunker else None
+        append_base = await find_append_base(session, chunks, object_name) if chunks else None
 
-        if existing_dataset:
-            logger.warning(f"重复上传检测: 文件MD5={file_md5} 已存在,数据集ID={existing_dataset.id}")
-            raise HTTPException(
-                status_code=409,
-                detail={
-                    "error": "duplicate_file",
-                    "message": f"该文件已上传过,文件名: {existing_dataset.name}",
-                    "existing_dataset": {
-                        "id": str(existing_dataset.id),
-                        "name": existing_dataset.name,
-                        "created_at": existing_dataset.created_at.isoformat() if existing_dataset.created_at else None
-                    }
-                }
-            )
+        return await _create_dataset(
+            session,
+            dataset_id=dataset_id,
+            filename=file.filename,
+            logical_name=logical_name,
+            description=description,
+            file_path=file_path,
+            file_size=file_size,
+            file_md5=file_md5,
+            chunks=chunks,
+            append_base=append_base
+        )
 
     except HTTPException:
+        # 空文件或重复文件, 删除已上传的对象
+        await async_minio.delete_file(object_name)
         raise
     except Exception as e:
-        logger.error(f"读取上传文件失败: {e}")
-        raise HTTPException(status_code=500, detail=f"文件读取失败: {str(e)}")
+        logger.error(f"上传数据集失败: {e}")
+        # 清理MinIO中的文件
+        await async_minio.delete_file(object_name)
+        raise HTTPException(status_code=500, detail=f"上传失败: {str(e)}")
 
-    # 生成数据集ID和存储路径
-    dataset_id = uuid4()
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    object_name = f"uploads/{dataset_id}_{timestamp}_{file.filename}"
 
+class InitUploadRequest(BaseModel):
+    """分片上传初始化请求"""
+    filename: str
+    total_size: int = Field(..., gt=0, description="文件总字节数")
+    content_type: Optional[str] = None
+    logical_name: Optional[str] = None
+    description: Optional[str] = None
+    # 客户端预先计算的MD5(可选), 用于在上传前检测重复文件
+    file_md5: Optional[str] = None
+
+
+async def _get_upload_session(upload_id: str) -> dict:
+    upload = await upload_sessions.get(upload_id)
+    if not upload:
+        raise HTTPException(status_code=404, detail="上传会话不存在或已过期")
+    return upload
+
+
+@router.post("/upload_dataset/init")
+async def init_chunked_upload(
+    request: InitUploadRequest,
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    初始化可续传的分片上传
+
+    Args:
+        request: 文件名、总大小等
+        session: 数据库会话
+
+    Returns:
+        upload_id、分片大小、分片数; 客户端随后按序号上传分片(可并行)
+    """
+    _validate_extension(request.filename)
+    if request.file_md5:
+        await _check_duplicate(session, request.file_md5.lower())
+
+    dataset_id = uuid4()
     try:
-        # 上传到MinIO
-        file_path = minio_client.upload_file(
-            file_data,
-            object_name,
-            content_type=file.content_type or "application/octet-stream"
+        upload = await upload_sessions.create(
+            object_name=_new_object_name(dataset_id, request.filename),
+            filename=request.filename,
+            total_size=request.total_size,
+            content_type=request.content_type or "application/octet-stream",
+            metadata={
+                "dataset_id": str(dataset_id),
+                "logical_name": request.logical_name,
+                "description": request.description
+            }
         )
-        logger.info(f"文件已上传到MinIO: {file_path}")
+    except UploadSessionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"初始化分片上传失败: {e}")
+        raise HTTPException(status_code=500, detail=f"初始化上传失败: {str(e)}")
 
-        # 创建数据集记录
-        dataset = SysDataset(
-            id=dataset_id,
-            name=file.filename,
-            logical_name=logical_name or file.filename.rsplit('.', 1)[0],
-            description=description,
-            original_file_path=file_path,
-            file_size=file_size,
-            file_md5=file_md5,
-            parse_status='pending',
-            embedding_status='pending'
-        )
-        session.add(dataset)
-        await session.commit()
-        await session.refresh(dataset)
+    return {
+        "upload_id": upload["upload_id"],
+        "part_size": upload["part_size"],
+        "part_count": upload["part_count"],
+        "total_size": upload["total_size"]
+    }
 
-        logger.info(f"数据集记录已创建: {dataset_id}")
 
-        # 添加后台解析任务
-        from services.dataset_parser import parse_dataset_task
-        background_tasks.add_task(
-            parse_dataset_task,
-            str(dataset_id),
-            file_path,
-            file.filename
-        )
+@router.put("/upload_dataset/{upload_id}/part/{part_number}")
+async def upload_part(upload_id: str, part_number: int, request: Request):
+    """
+    上传一个分片(请求体为分片原始字节, 可选 Content-MD5 头校验完整性)
 
-        return {
-            "dataset_id": str(dataset_id),
-            "status": "parsing",
-            "message": "文件上传成功,正在后台解析...",
-            "file_name": file.filename,
-            "file_size": file_size
-        }
+    同一分片可重复上传(覆盖), 不同分片可并行上传
+
+    Args:
+        upload_id: 上传会话ID
+        part_number: 分片序号(从1开始)
+        request: 请求(流式读取请求体)
 
+    Returns:
+        分片序号、ETag、大小
+    """
+    upload = await _get_upload_session(upload_id)
+    if not 1 <= part_number <= upload["part_count"]:
+        raise HTTPException(status_code=400, detail=f"分片序号超出范围: 1-{upload['part_count']}")
+    expected = upload_sessions.expected_part_size(upload, part_number)
+
+    # 读取分片(最多缓冲一个分片)
+    data = bytearray()
+    md5 = hashlib.md5()
+    async for chunk in request.stream():
+        data.extend(chunk)
+        if len(data) > expected:
+            raise HTTPException(status_code=400, detail=f"分片 {part_number} 超过应有大小 {expected} 字节")
+        md5.update(chunk)
+
+    content_md5 = request.headers.get("content-md5")
+    if content_md5 and base64.b64encode(md5.digest()).decode() != content_md5:
+        raise HTTPException(status_code=400, detail=f"分片 {part_number} 校验失败(Content-MD5不匹配)")
+
+    try:
+        return await upload_sessions.put_part(upload, part_number, bytes(data), md5.hexdigest())
+    except UploadSessionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"上传数据集失败: {e}")
-        # 清理MinIO中的文件
+        logger.error(f"上传分片失败: {upload_id} #{part_number}, {e}")
+        raise HTTPException(status_code=500, detail=f"上传分片失败: {str(e)}")
+
+
+@router.get("/upload_dataset/{upload_id}")
+async def get_chunked_upload(upload_id: str):
+    """
+    查询上传进度(断点续传时获取缺失的分片)
+
+    Args:
+        upload_id: 上传会话ID
+
+    Returns:
+        已上传分片和缺失分片序号
+    """
+    upload = await _get_upload_session(upload_id)
+    parts = await upload_sessions.list_parts(upload_id)
+    uploaded_size = sum(part["size"] for part in parts.values())
+    return {
+        "upload_id": upload_id,
+        "filename": upload["filename"],
+        "total_size": upload["total_size"],
+        "part_size": upload["part_size"],
+        "part_count": upload["part_count"],
+        "uploaded_parts": sorted(parts),
+        "missing_parts": [n for n in range(1, upload["part_count"] + 1) if n not in parts],
+        "uploaded_size": uploaded_size
+    }
+
+
+@router.post("/upload_dataset/{upload_id}/complete")
+async def complete_chunked_upload(
+    upload_id: str,
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    合并分片并创建数据集
+
+    合并后流式计算文件MD5进行重复检测, 重复文件会被删除
+
+    Args:
+        upload_id: 上传会话ID
+        session: 数据库会话
+
+    Returns:
+        与 /upload_dataset 相同的结果
+    """
+    upload = await _get_upload_session(upload_id)
+    if not await upload_sessions.acquire_complete_lock(upload_id):
+        raise HTTPException(status_code=409, detail="该上传正在合并中")
+
+    object_name = upload["object_name"]
+    try:
         try:
-            minio_client.delete_file(object_name)
-        except:
-            pass
-        raise HTTPException(status_code=500, detail=f"上传失败: {str(e)}")
+            file_path = await upload_sessions.complete(upload)
+        except UploadSessionError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        await upload_sessions.discard(upload_id)
+
+        try:
+            chunker = RowChunker() if supports_fingerprint(upload["filename"]) else None
+            file_md5 = await async_minio.compute_md5(object_name, on_data=chunker.feed if chunker else None)
+            logger.info(f"分片上传完成: {file_path}, 大小: {upload['total_size']}, MD5: {file_md5}")
+
+            await _check_duplicate(session, file_md5)
+
+            chunks = chunker.finish() if chunker else None
+            append_base = await find_append_base(session, chunks, object_name) if chunks else None
+
+            metadata = upload["metadata"]
+            return await _create_dataset(
+                session,
+                dataset_id=UUID(metadata["dataset_id"]),
+                filename=upload["filename"],
+                logical_name=metadata.get("logical_name"),
+                description=metadata.get("description"),
+                file_path=file_path,
+                file_size=upload["total_size"],
+                file_md5=file_md5,
+                chunks=chunks,
+                append_base=append_base
+            )
+        except HTTPException:
+            # 重复文件, 删除已合并的对象
+            await async_minio.delete_file(object_name)
+            raise
+        except Exception as e:
+            logger.error(f"创建数据集失败: {e}")
+            await async_minio.delete_file(object_name)
+            raise HTTPException(status_code=500, detail=f"上传失败: {str(e)}")
+    finally:
+        await upload_sessions.release_complete_lock(upload_id)
+
+
+@router.delete("/upload_dataset/{upload_id}")
+async def abort_chunked_upload(upload_id: str):
+    """
+    取消分片上传并清理已上传的分片
+
+    Args:
+        upload_id: 上传会话ID
+    """
+    upload = await _get_upload_session(upload_id)
+    await upload_sessions.abort(upload)
+    return {"success": True, "upload_id": upload_id}
+
+
+@router.post("/dataset/{dataset_id}/append")
+async def append_dataset(
+    dataset_id: str,
+    file: UploadFile = File(...),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    向已解析的数据集追加数据(如每月新增的数据)
+
+    追加文件的列名须与数据集一致(顺序可以不同), 在后台解析为新的Parquet分片,
+    列统计增量合并, 数据版本加1, 只对描述变化的列重新生成向量
+
+    Args:
+        dataset_id: 数据集ID
+        file: 追加的CSV/Excel文件
+        session: 数据库会话
+
+    Returns:
+        {"dataset_id", "job_id", "status": "appending", "version"(追加前的版本)}
+    """
+    _validate_extension(file.filename)
+
+    result = await session.execute(
+        select(SysDataset).where(SysDataset.id == dataset_id)
+    )
+    dataset = result.scalar_one_or_none()
+    if not dataset:
+        raise HTTPException(status_code=404, detail="数据集不存在")
+    if dataset.parse_status != 'parsed':
+        raise HTTPException(status_code=400, detail=f"数据集尚未解析完成: {dataset.parse_status}")
+    version = dataset.version
+    # 上传期间不占用数据库连接
+    await session.close()
+
+    object_name = _new_object_name(dataset_id, f"append_{file.filename}")
+    reader = HashingReader(file.file, max_size=settings.MAX_UPLOAD_SIZE)
+    try:
+        file_path = await async_minio.upload_stream(
+            reader,
+            object_name,
+            file.content_type or "application/octet-stream"
+        )
+    except UploadTooLargeError:
+        await async_minio.delete_file(object_name)
+        raise HTTPException(
+            status_code=400,
+            detail=f"文件过大: 超过 {settings.MAX_UPLOAD_SIZE / 1024 / 1024}MB"
+        )
+    except Exception as e:
+        logger.error(f"上传追加文件到MinIO失败: {e}")
+        await async_minio.delete_file(object_name)
+        raise HTTPException(status_code=500, detail=f"文件上传失败: {str(e)}")
+
+    if reader.size == 0:
+        await async_minio.delete_file(object_name)
+        raise HTTPException(status_code=400, detail="文件为空")
+
+    logger.info(f"追加文件已上传: {file_path}, 数据集: {dataset_id}, 大小: {reader.size}")
+    job_id = await enqueue_dataset_job(
+        JOB_APPEND,
+        dataset_id,
+        file_path=file_path,
+        filename=file.filename
+    )
+
+    return {
+        "dataset_id": dataset_id,
+        "job_id": job_id,
+        "status": "appending",
+        "message": "文件上传成功,正在后台追加数据...",
+        "version": version,
+        "file_name": file.filename,
+        "file_size": reader.size
+    }
 
 
 @router.get("/dataset/{dataset_id}/status")
@@ -200,9 +587,12 @@ async def get_dataset_status(
             "embedding_error": dataset.embedding_error,
             "row_count": dataset.row_count,
             "column_count": dataset.column_count,
+            "version": dataset.version,
             "error_message": dataset.error_message,
             "created_at": dataset.created_at.isoformat() if dataset.created_at else None,
-            "updated_at": dataset.updated_at.isoformat() if dataset.updated_at else None
+            "updated_at": dataset.updated_at.isoformat() if dataset.updated_at else None,
+            # 后台任务状态(最新在前): 排队/执行中/等待重试/完成/失败
+            "jobs": await _get_dataset_jobs(str(dataset.id))
         }
 
     except HTTPException:
@@ -212,6 +602,23 @@ async def get_dataset_status(
         raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
 
 
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """
+    查询后台任务状态
+
+    Args:
+        job_id: 任务ID
+
+    Returns:
+        任务类型、状态、执行次数、错误信息等
+    """
+    job = await job_queue.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return _job_summary(job)
+
+
 @router.get("/datasets")
 async def list_datasets(
     skip: int = 0,
@@ -264,7 +671,6 @@ async def list_datasets(
 @router.post("/dataset/{dataset_id}/retry_parse")
 async def retry_parse_dataset(
     dataset_id: str,
-    background_tasks: BackgroundTasks,
     session: AsyncSession = Depends(get_async_session)
 ):
     """
@@ -272,7 +678,6 @@ async def retry_parse_dataset(
 
     Args:
         dataset_id: 数据集ID
-        background_tasks: 后台任务
         session: 数据库会话
 
     Returns:
@@ -299,19 +704,20 @@ async def retry_parse_dataset(
         dataset.error_message = None
         await session.commit()
 
-        # 添加后台解析任务
-        from services.dataset_parser import parse_dataset_task
-        background_tasks.add_task(
-            parse_dataset_task,
+        # 提交解析任务(手动重试优先执行)
+        job_id = await enqueue_dataset_job(
+            JOB_PARSE,
             str(dataset.id),
-            dataset.original_file_path,
-            dataset.name
+            PRIORITY_HIGH,
+            file_path=dataset.original_file_path,
+            filename=dataset.name
         )
 
         return {
             "success": True,
             "message": "已开始重新解析",
-            "dataset_id": dataset_id
+            "dataset_id": dataset_id,
+            "job_id": job_id
         }
 
     except HTTPException:
@@ -324,7 +730,6 @@ async def retry_parse_dataset(
 @router.post("/dataset/{dataset_id}/retry_embedding")
 async def retry_embedding(
     dataset_id: str,
-    background_tasks: BackgroundTasks,
     session: AsyncSession = Depends(get_async_session)
 ):
     """
@@ -332,7 +737,6 @@ async def retry_embedding(
 
     Args:
         dataset_id: 数据集ID
-        background_tasks: 后台任务
         session: 数据库会话
 
     Returns:
@@ -365,67 +769,14 @@ async def retry_embedding(
         dataset.embedding_error = None
         await session.commit()
 
-        # 添加后台任务生成embedding
-        async def retry_embedding_task():
-            from db.session import async_session
-            from services.embedding_service import generate_column_embeddings
-            from sqlalchemy import select as sql_select
-            from models.sys_dataset import SysDatasetColumn
-
-            async with async_session() as sess:
-                # 获取列信息
-                col_result = await sess.execute(
-                    sql_select(SysDatasetColumn)
-                    .where(SysDatasetColumn.dataset_id == dataset_id)
-                    .order_by(SysDatasetColumn.col_index)
-                )
-                columns = col_result.scalars().all()
-
-                if not columns:
-                    logger.error(f"数据集 {dataset_id} 没有列信息")
-                    return
-
-                # 构造schema_info
-                schema_info = []
-                for col in columns:
-                    schema_info.append({
-                        'name': col.col_name,
-                        'type': col.col_type,
-                        'stats': col.stats or {},
-                        'samples': col.sample_values or []
-                    })
-
-                # 更新状态为embedding
-                ds_result = await sess.execute(
-                    sql_select(SysDataset).where(SysDataset.id == dataset_id)
-                )
-                ds = ds_result.scalar_one()
-                ds.embedding_status = 'embedding'
-                ds.embedding_progress = 0
-                await sess.commit()
-
-                try:
-                    # 生成embedding
-                    await generate_column_embeddings(str(dataset_id), schema_info)
-
-                    # 更新为完成
-                    ds.embedding_status = 'completed'
-                    ds.embedding_progress = 100
-                    await sess.commit()
-                    logger.info(f"数据集 {dataset_id} embedding重新生成成功")
-
-                except Exception as e:
-                    logger.error(f"数据集 {dataset_id} embedding重新生成失败: {e}")
-                    ds.embedding_status = 'failed'
-                    ds.embedding_error = str(e)
-                    await sess.commit()
-
-        background_tasks.add_task(retry_embedding_task)
+        # 提交任务(手动重试优先执行)
+        job_id = await enqueue_dataset_job(JOB_EMBEDDING, dataset_id, PRIORITY_HIGH)
 
         return {
             "success": True,
             "message": "已开始重新生成embedding",
-            "dataset_id": dataset_id
+            "dataset_id": dataset_id,
+            "job_id": job_id
         }
 
     except HTTPException:
@@ -475,42 +826,36 @@ async def delete_dataset(
         except Exception as e:
             logger.warning(f"删除Qdrant embeddings失败 (继续执行): {e}")
 
-        # 2. 删除MinIO中的文件
-        minio_errors = []
-
-        # 删除原始文件
+        # 2. 并发删除MinIO中的文件(原始文件、追加的文件、Parquet文件及追加的分片)
+        object_names = []
         if dataset.original_file_path:
+            object_names.append(object_name_from_path(dataset.original_file_path, "uploads"))
+        for fragment in (dataset.extra_metadata or {}).get("parquet_fragments") or []:
+            if fragment.get("source"):
+                object_names.append(object_name_from_path(fragment["source"], "uploads"))
+        object_names.extend(dataset_parquet_objects(dataset))
+        object_names.extend(rollup_objects(dataset))
+
+        minio_errors = []
+        if object_names:
             try:
-                # 从完整路径提取对象名称
-                # 例如: uploads/xxx_file.csv -> xxx_file.csv
-                if '/' in dataset.original_file_path:
-                    object_name = dataset.original_file_path
-                else:
-                    object_name = f"uploads/{dataset.original_file_path}"
-
-                minio_client.delete_file(object_name)
-                logger.info(f"原始文件删除成功: {object_name}")
+                minio_errors = await async_minio.delete_files(object_names)
             except Exception as e:
-                error_msg = f"删除原始文件失败: {e}"
-                logger.warning(error_msg)
-                minio_errors.append(error_msg)
+                minio_errors = [str(e)]
+            if minio_errors:
+                logger.warning(f"删除MinIO文件失败: {minio_errors}")
+            else:
+                logger.info(f"MinIO文件删除成功: {object_names}")
 
-        # 删除Parquet文件
-        if dataset.parsed_path:
+        # 清理原文件的预览缓存
+        if dataset.original_file_path:
             try:
-                if '/' in dataset.parsed_path:
-                    object_name = dataset.parsed_path
-                else:
-                    object_name = f"parquet/{dataset.parsed_path}"
-
-                minio_client.delete_file(object_name)
-                logger.info(f"Parquet文件删除成功: {object_name}")
+                await preview_cache.delete_for_object(object_name_from_path(dataset.original_file_path, "uploads"))
             except Exception as e:
-                error_msg = f"删除Parquet文件失败: {e}"
-                logger.warning(error_msg)
-                minio_errors.append(error_msg)
+                logger.warning(f"删除预览缓存失败 (继续执行): {e}")
 
-        # 3. 删除数据库记录
+        # 3. 删除数据库记录(含分块指纹)
+        await delete_chunks(session, dataset.id)
         await session.delete(dataset)
         await session.commit()
         logger.info(f"数据库记录删除成功: {dataset_id}")
@@ -545,7 +890,6 @@ async def delete_dataset(
 @router.post("/dataset/{dataset_id}/retry_chunk")
 async def retry_chunk(
     dataset_id: str,
-    background_tasks: BackgroundTasks,
     session: AsyncSession = Depends(get_async_session)
 ):
     """
@@ -553,7 +897,6 @@ async def retry_chunk(
 
     Args:
         dataset_id: 数据集ID
-        background_tasks: 后台任务
         session: 数据库会话
 
     Returns:
@@ -590,93 +933,14 @@ async def retry_chunk(
         dataset.vectorize_error = None
         await session.commit()
 
-        # 添加后台任务
-        async def retry_chunk_task():
-            from db.session import async_session
-            from models.sys_dataset import SysDatasetColumn
-            from sqlalchemy import select as sql_select
-            from services.embedding_service import build_column_description, vectorize_columns
-
-            async with async_session() as sess:
-                # 获取列信息
-                col_result = await sess.execute(
-                    sql_select(SysDatasetColumn)
-                    .where(SysDatasetColumn.dataset_id == dataset_id)
-                    .order_by(SysDatasetColumn.col_index)
-                )
-                columns = col_result.scalars().all()
-
-                if not columns:
-                    logger.error(f"数据集 {dataset_id} 没有列信息")
-                    return
-
-                # 构造schema_info
-                schema_info = []
-                for col in columns:
-                    schema_info.append({
-                        'name': col.col_name,
-                        'type': col.col_type,
-                        'stats': col.stats or {},
-                        'samples': col.sample_values or []
-                    })
-
-                # 更新为chunking状态
-                ds_result = await sess.execute(
-                    sql_select(SysDataset).where(SysDataset.id == dataset_id)
-                )
-                ds = ds_result.scalar_one()
-
-                try:
-                    # 执行分片
-                    ds.chunk_status = 'chunking'
-                    ds.chunk_progress = 0
-                    await sess.commit()
-
-                    chunked_data = []
-                    for idx, col_info in enumerate(schema_info):
-                        description = build_column_description(col_info)
-                        chunked_data.append({
-                            'index': idx,
-                            'col_info': col_info,
-                            'description': description
-                        })
-                        progress = int((idx + 1) / len(schema_info) * 100)
-                        ds.chunk_progress = progress
-                        await sess.commit()
-
-                    ds.chunk_status = 'completed'
-                    ds.chunk_progress = 100
-                    await sess.commit()
-                    logger.info(f"数据集 {dataset_id} 分片重试完成")
-
-                    # 自动执行向量化
-                    ds.vectorize_status = 'vectorizing'
-                    ds.vectorize_progress = 0
-                    await sess.commit()
-
-                    await vectorize_columns(str(dataset_id), chunked_data)
-
-                    ds.vectorize_status = 'completed'
-                    ds.vectorize_progress = 100
-                    await sess.commit()
-                    logger.info(f"数据集 {dataset_id} 向量化完成")
-
-                except Exception as e:
-                    logger.error(f"重试失败: {e}")
-                    if ds.chunk_status != 'completed':
-                        ds.chunk_status = 'failed'
-                        ds.chunk_error = str(e)
-                    else:
-                        ds.vectorize_status = 'failed'
-                        ds.vectorize_error = str(e)
-                    await sess.commit()
-
-        background_tasks.add_task(retry_chunk_task)
+        # 提交任务(手动重试优先执行)
+        job_id = await enqueue_dataset_job(JOB_CHUNK, dataset_id, PRIORITY_HIGH)
 
         return {
             "success": True,
             "message": "已开始重新分片和向量化",
-            "dataset_id": dataset_id
+            "dataset_id": dataset_id,
+            "job_id": job_id
         }
 
     except HTTPException:
@@ -689,7 +953,6 @@ async def retry_chunk(
 @router.post("/dataset/{dataset_id}/retry_vectorize")
 async def retry_vectorize(
     dataset_id: str,
-    background_tasks: BackgroundTasks,
     session: AsyncSession = Depends(get_async_session)
 ):
     """
@@ -697,7 +960,6 @@ async def retry_vectorize(
 
     Args:
         dataset_id: 数据集ID
-        background_tasks: 后台任务
         session: 数据库会话
 
     Returns:
@@ -736,72 +998,14 @@ async def retry_vectorize(
         dataset.vectorize_error = None
         await session.commit()
 
-        # 添加后台任务
-        async def retry_vectorize_task():
-            from db.session import async_session
-            from models.sys_dataset import SysDatasetColumn
-            from sqlalchemy import select as sql_select
-            from services.embedding_service import build_column_description, vectorize_columns
-
-            async with async_session() as sess:
-                # 获取列信息
-                col_result = await sess.execute(
-                    sql_select(SysDatasetColumn)
-                    .where(SysDatasetColumn.dataset_id == dataset_id)
-                    .order_by(SysDatasetColumn.col_index)
-                )
-                columns = col_result.scalars().all()
-
-                if not columns:
-                    logger.error(f"数据集 {dataset_id} 没有列信息")
-                    return
-
-                # 重新构造chunked_data
-                chunked_data = []
-                for idx, col in enumerate(columns):
-                    col_info = {
-                        'name': col.col_name,
-                        'type': col.col_type,
-                        'stats': col.stats or {},
-                        'samples': col.sample_values or []
-                    }
-                    description = build_column_description(col_info)
-                    chunked_data.append({
-                        'index': idx,
-                        'col_info': col_info,
-                        'description': description
-                    })
-
-                # 更新为vectorizing状态
-                ds_result = await sess.execute(
-                    sql_select(SysDataset).where(SysDataset.id == dataset_id)
-                )
-                ds = ds_result.scalar_one()
-
-                try:
-                    ds.vectorize_status = 'vectorizing'
-                    ds.vectorize_progress = 0
-                    await sess.commit()
-
-                    await vectorize_columns(str(dataset_id), chunked_data)
-
-                    ds.vectorize_status = 'completed'
-                    ds.vectorize_progress = 100
-                    await sess.commit()
-                    logger.info(f"数据集 {dataset_id} 向量化重试成功")
-
-                except Exception as e:
-                    logger.error(f"向量化重试失败: {e}")
-                    ds.vectorize_status = 'failed'
-                    ds.vectorize_error = str(e)
-                    await sess.commit()
-
-        background_tasks.add_task(retry_vectorize_task)
+        # 提交任务(手动重试优先执行)
+        job_id = await enqueue_dataset_job(JOB_VECTORIZE, dataset_id, PRIORITY_HIGH)
 
         return {
             "success": True,
             "message": "已开始重新向量化",
-            "dataset_id": dataset_id
+            "dataset_id": dataset_id,
+            "job_id": job_id
         }
 
     except HTTPException:
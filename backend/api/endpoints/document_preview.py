@@ -14,9 +14,20 @@ import tempfile
 import base64
 from pathlib import Path
 
+import pandas as pd
+
 from models.sys_dataset import SysDataset
-from core.minio_client import minio_client
+from core.minio_client import async_minio, object_name_from_path
 from api.dependencies.dependencies import get_async_session
+from api.endpoints.file_preview import preview_parsed_dataset, split_columns
+from services.preview_cache import preview_cache
+from services.text_format import csv_read_options, ensure_text_format
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:
+    # 未安装pypdf时PDF整体预览, 不按页拆分
+    PdfReader = PdfWriter = None
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -142,7 +153,7 @@ async def get_document_info(
                 object_name = parts[1]
         
         # 检查文件是否存在并获取大小
-        if not minio_client.file_exists(object_name):
+        if not await async_minio.file_exists(object_name):
             raise HTTPException(status_code=404, detail="原文件不存在")
         
         # 获取文件大小（这里需要MinIO客户端支持）
@@ -172,11 +183,15 @@ async def get_document_preview(
     method: str = Query("auto", description="预览方法: auto, table_view, html_preview, pdf_viewer, text_view, image_view等"),
     page: int = Query(1, description="页码（适用于PDF等多页文档）"),
     lines: int = Query(100, description="预览行数（适用于表格和文本）"),
+    offset: int = Query(0, ge=0, description="起始行（适用于已解析的表格）"),
+    columns: Optional[str] = Query(None, description="逗号分隔的列名（适用于已解析的表格）"),
     session: AsyncSession = Depends(get_async_session)
 ):
     """
     通用文档预览接口
     根据文档类型和指定方法返回预览内容
+    已解析的表格直接从Parquet文件分页读取, 不下载原文件;
+    其他预览结果按 (原文件, ETag, 预览方法, 页码/行数) 缓存, 多页文档按页生成
     """
     try:
         # 查询数据集信息
@@ -191,32 +206,76 @@ async def get_document_preview(
         if not dataset.original_file_path:
             raise HTTPException(status_code=404, detail="原文件路径不存在")
         
-        # 获取文件
-        object_name = dataset.original_file_path
-        if '/' in object_name and object_name.count('/') > 1:
-            parts = object_name.split('/', 1)
-            if len(parts) > 1:
-                object_name = parts[1]
-        
-        if not minio_client.file_exists(object_name):
-            raise HTTPException(status_code=404, detail="原文件不存在")
-        
-        file_data = minio_client.download_file(object_name)
         doc_type = get_document_type(dataset.name)
         
         # 根据文档类型和方法选择预览策略
         if method == "auto":
             method = get_default_preview_method(doc_type)
-        
-        # 调用相应的预览处理器
-        preview_result = await process_document_preview(
-            file_data=file_data,
-            filename=dataset.name,
-            doc_type=doc_type,
-            method=method,
-            page=page,
-            lines=lines
+
+        if doc_type == 'spreadsheet' and dataset.parse_status == 'parsed' and dataset.parsed_path:
+            preview = await preview_parsed_dataset(dataset, lines, offset, split_columns(columns))
+            message = f"显示第 {offset + 1}-{offset + len(preview['data'])} 行数据 (共 {preview['dataset_rows']} 行)"
+            if method == 'table_view':
+                # preview["data"] 已可直接JSON序列化(空值为None), 不经过DataFrame, 避免整数列带空值时变成NaN
+                preview_result = {
+                    'content_type': 'table',
+                    'columns': preview["columns"],
+                    'data': preview["data"],
+                    'total_rows': len(preview["data"]),
+                    'total_columns': len(preview["columns"]),
+                    'message': message
+                }
+            else:
+                preview_result = format_table_preview(
+                    pd.DataFrame(preview["data"], columns=preview["columns"]), method, message
+                )
+            return {
+                "success": True,
+                "dataset_id": dataset_id,
+                "document_type": doc_type,
+                "preview_method": method,
+                "page": page,
+                "source": "parquet",
+                "all_columns": preview["all_columns"],
+                "dataset_rows": preview["dataset_rows"],
+                "offset": offset,
+                **preview_result
+            }
+
+        # 获取文件
+        object_name = object_name_from_path(dataset.original_file_path, "uploads")
+        filename = dataset.name
+        # 文本和CSV使用识别好的编码和分隔符(首次预览时识别并保存)
+        text_format = None
+        if doc_type == 'text' or filename.lower().endswith('.csv'):
+            text_format = await ensure_text_format(session, dataset, object_name)
+        # 生成预览可能较慢, 提前归还数据库连接
+        await session.close()
+
+        stat = await async_minio.stat(object_name)
+        if stat is None:
+            raise HTTPException(status_code=404, detail="原文件不存在")
+
+        async def generate() -> Dict[str, Any]:
+            # 缓存未命中时才下载原文件
+            file_data = await async_minio.download_file(object_name)
+            return await process_document_preview(
+                file_data=file_data,
+                filename=filename,
+                doc_type=doc_type,
+                method=method,
+                page=page,
+                lines=lines,
+                text_format=text_format
+            )
+
+        cache_key = preview_cache.preview_key(
+            object_name,
+            stat.etag,
+            method,
+            **get_preview_variant(doc_type, method, page, lines)
         )
+        preview_result = await preview_cache.get_or_create(cache_key, generate)
         
         return {
             "success": True,
@@ -228,12 +287,21 @@ async def get_document_preview(
         }
         
     except HTTPException:
-        raise HTTPException(status_code=500, detail=f"文档预览失败: {str(e)}")
+        raise
     except Exception as e:
         logger.error(f"文档预览失败: {e}")
         raise HTTPException(status_code=500, detail=f"文档预览失败: {str(e)}")
 
 
+def get_preview_variant(doc_type: str, method: str, page: int, lines: int) -> Dict[str, Any]:
+    """影响预览结果的参数(作为缓存键的一部分)"""
+    if doc_type in ('spreadsheet', 'text'):
+        return {'lines': lines}
+    if doc_type == 'presentation' or (doc_type == 'pdf' and (method != 'pdf_viewer' or PdfReader is not None)):
+        return {'page': page}
+    return {}
+
+
 def get_default_preview_method(doc_type: str) -> str:
     """获取文档类型的默认预览方法"""
     defaults = {
@@ -253,7 +321,8 @@ async def process_document_preview(
     doc_type: str,
     method: str,
     page: int = 1,
-    lines: int = 100
+    lines: int = 100,
+    text_format: Optional[Dict[str, Any]] = None
 ) -> Dict[str, Any]:
     """
     处理文档预览
@@ -261,7 +330,7 @@ async def process_document_preview(
     """
     
     if doc_type == 'spreadsheet':
-        return await process_spreadsheet_preview(file_data, filename, method, lines)
+        return await process_spreadsheet_preview(file_data, filename, method, lines, text_format)
     elif doc_type == 'pdf':
         return await process_pdf_preview(file_data, filename, method, page)
     elif doc_type == 'document':
@@ -269,14 +338,42 @@ async def process_document_preview(
     elif doc_type == 'presentation':
         return await process_presentation_preview(file_data, filename, method, page)
     elif doc_type == 'text':
-        return await process_text_preview(file_data, filename, method, lines)
+        return await process_text_preview(file_data, filename, method, lines, text_format)
     elif doc_type == 'image':
         return await process_image_preview(file_data, filename, method)
     else:
         raise HTTPException(status_code=400, detail=f"不支持的文档类型: {doc_type}")
 
 
-async def process_spreadsheet_preview(file_data: bytes, filename: str, method: str, lines: int) -> Dict[str, Any]:
+def format_table_preview(df, method: str, message: str) -> Dict[str, Any]:
+    """根据预览方法返回表格数据或HTML表格"""
+    if method == 'table_view':
+        return {
+            'content_type': 'table',
+            'columns': list(df.columns),
+            'data': df.to_dict('records'),
+            'total_rows': len(df),
+            'total_columns': len(df.columns),
+            'message': message
+        }
+    elif method == 'html_preview':
+        html_content = df.to_html(classes='table table-striped', table_id='preview-table')
+        return {
+            'content_type': 'html',
+            'html_content': html_content,
+            'message': f'HTML表格预览 ({len(df)} 行)'
+        }
+    else:
+        raise HTTPException(status_code=400, detail=f"表格文档不支持预览方法: {method}")
+
+
+async def process_spreadsheet_preview(
+    file_data: bytes,
+    filename: str,
+    method: str,
+    lines: int,
+    text_format: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
     """处理表格文档预览"""
     import pandas as pd
     
@@ -332,15 +429,10 @@ async def process_spreadsheet_preview(file_data: bytes, filename: str, method: s
         
         elif filename.lower().endswith('.csv'):
             # CSV文件处理
-            encodings = ['utf-8', 'gbk', 'gb2312', 'utf-8-sig', 'latin1']
-            for encoding in encodings:
-                try:
-                    df = pd.read_csv(io.BytesIO(file_data), encoding=encoding, nrows=lines)
-                    break
-                except UnicodeDecodeError:
-                    continue
-                except Exception as e:
-                    errors.append(f"CSV读取失败({encoding}): {str(e)}")
+            try:
+                df = pd.read_csv(io.BytesIO(file_data), nrows=lines, **csv_read_options(text_format))
+            except Exception as e:
+                errors.append(f"CSV读取失败: {str(e)}")
         
         if df is None:
             raise ValueError(f"表格解析失败: {'; '.join(errors)}")
@@ -361,42 +453,56 @@ async def process_spreadsheet_preview(file_data: bytes, filename: str, method: s
         # 确保所有NaN值都被替换为None
         df = df.where(pd.notnull(df), None)
         
-        # 根据预览方法返回不同格式
-        if method == 'table_view':
-            return {
-                'content_type': 'table',
-                'columns': list(df.columns),
-                'data': df.to_dict('records'),
-                'total_rows': len(df),
-                'total_columns': len(df.columns),
-                'message': f'显示前 {len(df)} 行数据'
-            }
-        elif method == 'html_preview':
-            html_content = df.to_html(classes='table table-striped', table_id='preview-table')
-            return {
-                'content_type': 'html',
-                'html_content': html_content,
-                'message': f'HTML表格预览 ({len(df)} 行)'
-            }
-        else:
-            raise HTTPException(status_code=400, detail=f"表格文档不支持预览方法: {method}")
-            
+        return format_table_preview(df, method, f'显示前 {len(df)} 行数据')
+
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"表格预览处理失败: {e}")
         raise HTTPException(status_code=500, detail=f"表格预览失败: {str(e)}")
 
 
+def extract_pdf_page(file_data: bytes, page: int):
+    """
+    提取PDF的一页为单页PDF
+
+    Returns:
+        (单页PDF字节, 总页数)
+    """
+    reader = PdfReader(io.BytesIO(file_data))
+    total_pages = len(reader.pages)
+    if not 1 <= page <= total_pages:
+        raise HTTPException(status_code=400, detail=f"页码超出范围: 1-{total_pages}")
+
+    writer = PdfWriter()
+    writer.add_page(reader.pages[page - 1])
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue(), total_pages
+
+
 async def process_pdf_preview(file_data: bytes, filename: str, method: str, page: int) -> Dict[str, Any]:
     """处理PDF文档预览"""
     try:
         if method == 'pdf_viewer':
-            # 返回PDF的base64编码，供前端PDF查看器使用
-            pdf_base64 = base64.b64encode(file_data).decode('utf-8')
+            if PdfReader is None:
+                # 返回PDF的base64编码，供前端PDF查看器使用
+                pdf_base64 = base64.b64encode(file_data).decode('utf-8')
+                return {
+                    'content_type': 'pdf',
+                    'pdf_data': pdf_base64,
+                    'current_page': page,
+                    'message': 'PDF文档预览'
+                }
+
+            # 只返回当前页(单页PDF), 其他页在翻页时按需生成
+            page_data, total_pages = extract_pdf_page(file_data, page)
             return {
                 'content_type': 'pdf',
-                'pdf_data': pdf_base64,
+                'pdf_data': base64.b64encode(page_data).decode('utf-8'),
                 'current_page': page,
-                'message': 'PDF文档预览'
+                'total_pages': total_pages,
+                'message': f'PDF文档预览 (第 {page}/{total_pages} 页)'
             }
         elif method == 'image_preview':
             # 这里需要安装pdf2image库来将PDF转换为图片
@@ -408,7 +514,9 @@ async def process_pdf_preview(file_data: bytes, filename: str, method: str, page
             }
         else:
             raise HTTPException(status_code=400, detail=f"PDF文档不支持预览方法: {method}")
-            
+
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"PDF预览处理失败: {e}")
         raise HTTPException(status_code=500, detail=f"PDF预览失败: {str(e)}")
@@ -457,24 +565,17 @@ async def process_presentation_preview(file_data: bytes, filename: str, method:
         raise HTTPException(status_code=500, detail=f"PowerPoint预览失败: {str(e)}")
 
 
-async def process_text_preview(file_data: bytes, filename: str, method: str, lines: int) -> Dict[str, Any]:
+async def process_text_preview(
+    file_data: bytes,
+    filename: str,
+    method: str,
+    lines: int,
+    text_format: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
     """处理文本文档预览"""
     try:
-        # 尝试不同编码解码文本
-        encodings = ['utf-8', 'gbk', 'gb2312', 'utf-8-sig', 'latin1']
-        text_content = None
-        used_encoding = None
-        
-        for encoding in encodings:
-            try:
-                text_content = file_data.decode(encoding)
-                used_encoding = encoding
-                break
-            except UnicodeDecodeError:
-                continue
-        
-        if text_content is None:
-            raise ValueError("无法解码文本文件，可能是二进制文件")
+        used_encoding = (text_format or {}).get('encoding', 'utf-8')
+        text_content = file_data.decode(used_encoding, errors='replace')
         
         # 限制行数
         text_lines = text_content.split('\n')
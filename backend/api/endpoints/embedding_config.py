@@ -77,6 +77,10 @@ async def update_embedding_config(config: EmbeddingConfig):
 
         logger.info(f"Embedding 配置已更新: {config.model} ({config.dimension}维)")
 
+        # 通知所有worker刷新embedding配置缓存
+        from services.embedding_service import invalidate_embedding_config
+        await invalidate_embedding_config()
+
         return {
             "success": True,
             "message": "配置已保存，重启服务器后生效",
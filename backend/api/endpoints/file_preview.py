@@ -2,36 +2,86 @@
 文件预览API端点
 提供MinIO中原文件的内容预览功能
 """
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import Response
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from typing import Optional
+from typing import List, Optional, Tuple
+from email.utils import format_datetime
 import logging
+import urllib.parse
 import io
 import pandas as pd
 import json
 
 from models.sys_dataset import SysDataset
-from core.minio_client import minio_client
+from core.config import settings
+from core.minio_client import async_minio, object_name_from_path
+from services.duckdb_query import dataset_parquet_objects, preview_parquet
+from services.result_encoding import to_json_records
+from services.text_format import SNIFF_BYTES, csv_read_options, ensure_text_format, sniff_text_format
 from api.dependencies.dependencies import get_async_session
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
+def split_columns(columns: Optional[str]) -> Optional[List[str]]:
+    """逗号分隔的列名参数"""
+    if not columns:
+        return None
+    return [col.strip() for col in columns.split(',') if col.strip()] or None
+
+
+async def preview_parsed_dataset(
+    dataset: SysDataset,
+    lines: int,
+    offset: int,
+    columns: Optional[List[str]]
+) -> dict:
+    """
+    从已解析的Parquet文件(含追加的分片)分页预览(本地缓存 + DuckDB, 只读取选中的列)
+
+    Returns:
+        {"columns", "all_columns", "data", "dataset_rows", "offset"}
+    """
+    try:
+        page = await preview_parquet(
+            dataset_parquet_objects(dataset), columns=columns, limit=lines, offset=offset
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    df = page["df"]
+    return {
+        "columns": list(df.columns),
+        "all_columns": page["all_columns"],
+        "data": to_json_records(df),
+        "dataset_rows": page["total_rows"],
+        "offset": offset,
+    }
+
+
 @router.get("/datasets/{dataset_id}/original-file-preview")
 async def get_original_file_preview(
     dataset_id: str,
-    lines: int = 100,
+    lines: int = Query(100, ge=1, le=10000, description="预览行数"),
+    offset: int = Query(0, ge=0, description="起始行(仅已解析的数据集支持)"),
+    columns: Optional[str] = Query(None, description="逗号分隔的列名(仅已解析的数据集支持)"),
     session: AsyncSession = Depends(get_async_session)
 ):
     """
     获取数据集原文件的预览内容
-    
+
+    已解析的数据集直接从Parquet文件分页读取(支持 offset/columns), 只有未解析的上传文件才读取原文件
+
     Args:
         dataset_id: 数据集ID
         lines: 预览行数，默认100行
+        offset: 起始行
+        columns: 只返回这些列
         session: 数据库会话
         
     Returns:
@@ -47,48 +97,46 @@ async def get_original_file_preview(
         if not dataset:
             raise HTTPException(status_code=404, detail="数据集不存在")
             
+        file_name = dataset.name.lower()
+
+        if dataset.parse_status == 'parsed' and dataset.parsed_path:
+            preview = await preview_parsed_dataset(dataset, lines, offset, split_columns(columns))
+            return {
+                "success": True,
+                "file_type": "csv" if file_name.endswith('.csv') else "excel",
+                "source": "parquet",
+                "total_rows": len(preview["data"]),
+                **preview,
+                "message": f"显示第 {offset + 1}-{offset + len(preview['data'])} 行数据 (共 {preview['dataset_rows']} 行)"
+            }
+
         if not dataset.original_file_path:
             raise HTTPException(status_code=404, detail="原文件路径不存在")
             
         # 从MinIO路径中提取对象名称
         # 例如: chatbi-datasets/uploads/xxx_file.csv -> uploads/xxx_file.csv
-        object_name = dataset.original_file_path
-        if '/' in object_name and object_name.count('/') > 1:
-            # 如果包含bucket名称，去掉bucket部分
-            parts = object_name.split('/', 1)
-            if len(parts) > 1:
-                object_name = parts[1]
+        object_name = object_name_from_path(dataset.original_file_path, "uploads")
         
         logger.info(f"正在预览文件: {object_name}")
+
+        # 文本类文件使用识别好的编码和分隔符(首次预览时识别并保存)
+        text_format = None
+        if not file_name.endswith(('.xlsx', '.xls', '.et')):
+            text_format = await ensure_text_format(session, dataset, object_name)
         
         # 从MinIO下载文件
-        file_data = minio_client.download_file(object_name)
+        file_data = await async_minio.download_file(object_name)
         
         # 根据文件扩展名解析内容
-        file_name = dataset.name.lower()
-        
         if file_name.endswith('.csv'):
             # CSV文件预览
             try:
-                # 尝试不同的编码
-                encodings = ['utf-8', 'gbk', 'gb2312', 'utf-8-sig']
-                df = None
-                used_encoding = None
-                
-                for encoding in encodings:
-                    try:
-                        df = pd.read_csv(
-                            io.BytesIO(file_data),
-                            encoding=encoding,
-                            nrows=lines
-                        )
-                        used_encoding = encoding
-                        break
-                    except UnicodeDecodeError:
-                        continue
-                
-                if df is None:
-                    raise HTTPException(status_code=500, detail="无法解析CSV文件编码")
+                df = pd.read_csv(
+                    io.BytesIO(file_data),
+                    nrows=lines,
+                    **csv_read_options(text_format)
+                )
+                used_encoding = text_format["encoding"]
                 
                 # 转换为JSON格式返回
                 preview_data = df.to_dict('records')
@@ -97,6 +145,7 @@ async def get_original_file_preview(
                     "success": True,
                     "file_type": "csv",
                     "encoding": used_encoding,
+                    "delimiter": text_format.get("delimiter"),
                     "total_rows": len(preview_data),
                     "columns": list(df.columns),
                     "data": preview_data,
@@ -223,20 +272,14 @@ async def get_original_file_preview(
                 # 策略4: 尝试CSV格式读取（某些Excel文件可能是CSV格式）
                 if df is None:
                     try:
-                        # 尝试不同编码
-                        encodings = ['utf-8', 'gbk', 'gb2312', 'utf-8-sig', 'latin1']
-                        for encoding in encodings:
-                            try:
-                                df = pd.read_csv(
-                                    io.BytesIO(file_data),
-                                    encoding=encoding,
-                                    nrows=lines
-                                )
-                                success_method = f"CSV格式读取({encoding})"
-                                logger.info(f"策略4成功: {success_method}")
-                                break
-                            except UnicodeDecodeError:
-                                continue
+                        csv_format = sniff_text_format(file_data[:SNIFF_BYTES])
+                        df = pd.read_csv(
+                            io.BytesIO(file_data),
+                            nrows=lines,
+                            **csv_read_options(csv_format)
+                        )
+                        success_method = f"CSV格式读取({csv_format['encoding']})"
+                        logger.info(f"策略4成功: {success_method}")
                         
                     except Exception as e4:
                         errors.append(f"CSV格式读取: {str(e4)}")
@@ -283,20 +326,10 @@ async def get_original_file_preview(
         else:
             # 其他文件类型，返回原始文本内容
             try:
-                # 尝试以文本形式读取
-                encodings = ['utf-8', 'gbk', 'gb2312', 'utf-8-sig']
-                content = None
-                used_encoding = None
-                
-                for encoding in encodings:
-                    try:
-                        content = file_data.decode(encoding)
-                        used_encoding = encoding
-                        break
-                    except UnicodeDecodeError:
-                        continue
+                # 识别结果为latin1说明不是UTF-8/GB18030等常见编码的文本
+                used_encoding = text_format["encoding"]
                 
-                if content is None:
+                if used_encoding == "latin1":
                     # 如果无法解码为文本，返回二进制信息
                     return {
                         "success": True,
@@ -305,6 +338,8 @@ async def get_original_file_preview(
                         "message": "该文件为二进制文件，无法预览文本内容"
                     }
                 
+                content = file_data.decode(used_encoding, errors="replace")
+
                 # 限制预览行数
                 lines_list = content.split('\n')[:lines]
                 preview_content = '\n'.join(lines_list)
@@ -329,20 +364,89 @@ async def get_original_file_preview(
         raise HTTPException(status_code=500, detail=f"预览失败: {str(e)}")
 
 
+def _parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单个字节范围 Range: bytes=start-end / bytes=start- / bytes=-suffix
+
+    Returns:
+        (起始字节, 结束字节(含)); 多个范围或格式不支持时返回None(返回完整文件)
+
+    Raises:
+        ValueError: 范围无法满足(416)
+    """
+    unit, _, ranges = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+    start_text, _, end_text = ranges.strip().partition("-")
+    try:
+        if start_text == "":
+            suffix = int(end_text)
+            if suffix <= 0:
+                raise ValueError("无效的范围")
+            start, end = max(size - suffix, 0), size - 1
+        else:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+    except (TypeError, ValueError):
+        raise ValueError("无效的范围")
+    if start >= size or start > end:
+        raise ValueError("范围超出文件大小")
+    return start, min(end, size - 1)
+
+
+def _etag_matches(header: str, etag: str, strong: bool = False) -> bool:
+    """
+    请求头中的ETag是否与当前ETag匹配
+
+    If-None-Match 使用弱比较(忽略 W/ 前缀, 可以是列表或 *);
+    If-Range 使用强比较(strong=True, RFC 9110): 只接受单个强ETag, 弱ETag和日期都视为不匹配
+    """
+    if strong:
+        tag = header.strip()
+        return not tag.startswith("W/") and tag == etag
+    candidates = [tag.strip() for tag in header.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def _content_type_for(filename: str) -> str:
+    """确定MIME类型"""
+    name = filename.lower()
+    if name.endswith('.csv'):
+        return "text/csv"
+    if name.endswith(('.xlsx', '.xls')):
+        return "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    if name.endswith('.et'):
+        return "application/vnd.ms-excel"
+    if name.endswith('.pdf'):
+        return "application/pdf"
+    if name.endswith(('.docx', '.doc')):
+        return "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+    if name.endswith(('.pptx', '.ppt')):
+        return "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+    return "application/octet-stream"
+
+
 @router.get("/datasets/{dataset_id}/download-original")
 async def download_original_file(
     dataset_id: str,
+    request: Request,
+    redirect: Optional[bool] = Query(None, description="重定向到MinIO预签名URL(默认取 DOWNLOAD_PRESIGNED_REDIRECT)"),
     session: AsyncSession = Depends(get_async_session)
 ):
     """
     下载数据集的原文件
-    
+
+    从MinIO分块流式返回, 支持 Range(断点续传/分段下载) 和 If-None-Match(ETag缓存校验);
+    也可以重定向到预签名URL, 由客户端直接从MinIO下载
+
     Args:
         dataset_id: 数据集ID
+        request: 请求(读取 Range / If-None-Match / If-Range 头)
+        redirect: 是否重定向到预签名URL
         session: 数据库会话
-        
+
     Returns:
-        文件下载响应
+        文件下载响应(200/206/304/307/416)
     """
     try:
         # 查询数据集信息
@@ -350,57 +454,87 @@ async def download_original_file(
             select(SysDataset).where(SysDataset.id == dataset_id)
         )
         dataset = result.scalar_one_or_none()
-        
+
         if not dataset:
             raise HTTPException(status_code=404, detail="数据集不存在")
-            
+
         if not dataset.original_file_path:
             raise HTTPException(status_code=404, detail="原文件路径不存在")
-            
-        # 从MinIO路径中提取对象名称
-        object_name = dataset.original_file_path
-        if '/' in object_name and object_name.count('/') > 1:
-            parts = object_name.split('/', 1)
-            if len(parts) > 1:
-                object_name = parts[1]
-        
-        # 检查文件是否存在
-        if not minio_client.file_exists(object_name):
-            raise HTTPException(status_code=404, detail="原文件不存在")
-            
-        # 从MinIO下载文件
-        file_data = minio_client.download_file(object_name)
-        
-        # 确定MIME类型
-        content_type = "application/octet-stream"
-        if dataset.name.lower().endswith('.csv'):
-            content_type = "text/csv"
-        elif dataset.name.lower().endswith(('.xlsx', '.xls')):
-            content_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        elif dataset.name.lower().endswith('.et'):
-            content_type = "application/vnd.ms-excel"
-        elif dataset.name.lower().endswith('.pdf'):
-            content_type = "application/pdf"
-        elif dataset.name.lower().endswith(('.docx', '.doc')):
-            content_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-        elif dataset.name.lower().endswith(('.pptx', '.ppt')):
-            content_type = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
-            
+
+        object_name = object_name_from_path(dataset.original_file_path, "uploads")
+        filename = dataset.name
+        # 下载可能持续很久, 提前归还数据库连接
+        await session.close()
+
         # 处理文件名编码问题 - 使用URL编码
-        import urllib.parse
-        encoded_filename = urllib.parse.quote(dataset.name.encode('utf-8'))
-            
-        return Response(
-            content=file_data,
-            media_type=content_type,
+        encoded_filename = urllib.parse.quote(filename.encode('utf-8'))
+        content_disposition = f"attachment; filename*=UTF-8''{encoded_filename}"
+        media_type = _content_type_for(filename)
+
+        use_redirect = settings.DOWNLOAD_PRESIGNED_REDIRECT if redirect is None else redirect
+        if use_redirect:
+            url = await async_minio.get_file_url(
+                object_name,
+                expires=settings.DOWNLOAD_PRESIGNED_EXPIRES,
+                response_headers={
+                    "response-content-disposition": content_disposition,
+                    "response-content-type": media_type
+                }
+            )
+            if not url:
+                raise HTTPException(status_code=500, detail="生成下载链接失败")
+            return RedirectResponse(url, status_code=307)
+
+        stat = await async_minio.stat(object_name)
+        if stat is None:
+            raise HTTPException(status_code=404, detail="原文件不存在")
+
+        etag = f'"{stat.etag}"'
+        headers = {
+            "ETag": etag,
+            "Accept-Ranges": "bytes",
+            "Content-Disposition": content_disposition,
+            "Cache-Control": "private, no-cache",
+        }
+        if stat.last_modified:
+            headers["Last-Modified"] = format_datetime(stat.last_modified, usegmt=True)
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+
+        byte_range = None
+        range_header = request.headers.get("range")
+        if_range = request.headers.get("if-range")
+        # If-Range 与当前ETag不一致(文件已变化)时返回完整文件
+        if range_header and (not if_range or _etag_matches(if_range, etag, strong=True)):
+            try:
+                byte_range = _parse_range(range_header, stat.size)
+            except ValueError:
+                return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{stat.size}"})
+
+        if byte_range is None:
+            return StreamingResponse(
+                async_minio.iter_object(object_name),
+                media_type=media_type,
+                headers={**headers, "Content-Length": str(stat.size)}
+            )
+
+        start, end = byte_range
+        length = end - start + 1
+        return StreamingResponse(
+            async_minio.iter_object(object_name, offset=start, length=length),
+            status_code=206,
+            media_type=media_type,
             headers={
-                "Content-Disposition": f'attachment; filename*=UTF-8\'\'{encoded_filename}',
-                "Content-Length": str(len(file_data))
+                **headers,
+                "Content-Range": f"bytes {start}-{end}/{stat.size}",
+                "Content-Length": str(length)
             }
         )
-        
+
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"下载原文件失败: {e}")
-        raise HTTPException(status_code=500, detail=f"下载失败: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"下载失败: {str(e)}")
@@ -1,6 +1,8 @@
 from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Tuple
 from api.schemas.user_input import UserInput
 from api.utils.ai_utils import (
     analyze_user_intent_and_generate_sql,
@@ -10,17 +12,26 @@ from api.utils.ai_utils import (
 )
 from api.utils.db_utils import execute_sql_query
 from api.dependencies.dependencies import get_async_session, redis_client
+from db.session import async_session as session_factory
 from services.intent_router import classify_intent, IntentType
 from services.embedding_service import search_relevant_columns
 from services.duckdb_query import query_parquet_with_duckdb
 from services.multi_dataset_query import smart_multi_dataset_query
 from services.conversation_service import (
-    save_user_message,
-    save_assistant_message,
-    save_error_message,
+    queue_user_message,
+    queue_assistant_message,
+    queue_error_message,
     update_conversation_summary
 )
 from services.agents import judge_visualization_type
+from services.result_store import result_store
+from services.result_encoding import (
+    DATA_FORMAT_RECORDS,
+    ResultJSONResponse,
+    dumps,
+    to_json_data,
+    to_json_records
+)
 from api.utils.error_utils import format_error_message
 from api.utils.logger import error_logger
 from api.endpoints.progress_stream import get_progress_manager  # 导入进度管理器
@@ -28,38 +39,42 @@ import logging
 import asyncio
 import pandas as pd
 import time
-import math
-import numpy as np
 import uuid  # 用于生成任务ID
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# 判断图表类型时提供给模型的样例行数(无需发送完整结果)
+CHART_TYPE_SAMPLE_ROWS = 50
 
-@router.post("/generate_chart")
-async def generate_chart(
+
+async def generate_chart_events(
     user_input: UserInput,
     background_tasks: BackgroundTasks,
-    async_session: AsyncSession = Depends(get_async_session),
-):
+    async_session: AsyncSession,
+    task_id: str
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
     """
-    生成图表 - 支持固定Schema和用户上传数据集
+    图表生成流程,每完成一个阶段产出一个事件 (事件名, 数据)
 
     流程:
-    1. 保存用户消息到数据库
-    2. 意图识别(闲聊/查询/可视化)
+    1. 保存用户消息(放入写入队列,后台批量提交)
+    2. 意图识别(闲聊/查询/可视化)            -> intent
     3. 向量检索相关列
-    4. 判断查询固定表还是用户表
-    5. 执行查询并返回图表数据
-    6. 保存AI回复消息到数据库(包含图表数据和错误信息)
+    4. 判断查询固定表还是用户表,生成SQL        -> sql
+    5. 执行查询,结果立即返回                   -> data
+    6. 启动洞察分析                            -> insight
+    7. 判断展示方式/图表类型/数据精炼          -> presentation
+    8. 保存AI回复消息(包含图表数据和错误信息)  -> result (完整结果,与非流式接口返回一致)
+
+    出错时直接产出 result(包含 is_error/error 字段)
     """
     logger.info("Received user input for generating chart: %s", user_input)
 
-    # 生成任务ID用于进度跟踪
-    task_id = str(uuid.uuid4())
     progress_manager = get_progress_manager()
     
     start_time = time.time()
+    conversation = None
     conversation_id = None
 
     try:
@@ -67,12 +82,12 @@ async def generate_chart(
         await progress_manager.update_progress(task_id, "intent", 10, "开始处理用户请求...")
         
         try:
-            conversation, user_message = await save_user_message(
+            conversation = await queue_user_message(
                 async_session,
                 user_input.user_input
             )
             conversation_id = conversation.id
-            logger.info(f"用户消息已保存: conversation_id={conversation_id}, message_id={user_message.id}")
+            logger.info(f"用户消息已加入写入队列: conversation_id={conversation_id}")
         except Exception as e:
             logger.warning(f"保存用户消息失败(不影响主流程): {e}")
 
@@ -81,6 +96,21 @@ async def generate_chart(
         
         intent_result = await classify_intent(user_input.user_input)
         logger.info(f"意图分类: {intent_result['intent']} (置信度: {intent_result['confidence']})")
+        yield "intent", {
+            "intent": intent_result['intent'],
+            "confidence": intent_result['confidence'],
+            "source": intent_result.get('source')
+        }
+
+        # 后台任务: 记录意图标注(高置信度规则和LLM结果作为本地分类器的训练数据, 低置信度回退结果不记录)
+        if intent_result.get('source') in ('rules', 'llm'):
+            background_tasks.add_task(
+                record_intent_action,
+                user_input.user_input,
+                intent_result['intent'],
+                user_input.user_id,
+                conversation_id
+            )
 
         # 如果是闲聊,直接返回文本响应
         if intent_result['intent'] == IntentType.CHITCHAT:
@@ -92,8 +122,7 @@ async def generate_chart(
             if conversation_id:
                 try:
                     response_time = int((time.time() - start_time) * 1000)
-                    await save_assistant_message(
-                        async_session,
+                    queue_assistant_message(
                         conversation_id,
                         chitchat_message,
                         response_time=response_time
@@ -109,7 +138,7 @@ async def generate_chart(
                 except Exception as e:
                     logger.warning(f"保存AI回复失败: {e}")
 
-            return {
+            yield "result", {
                 "type": "text",
                 "message": chitchat_message,
                 "data": [],
@@ -117,6 +146,7 @@ async def generate_chart(
                 "chart_type": "bar",
                 "task_id": task_id  # 返回任务ID供前端订阅进度
             }
+            return
 
         # 步骤3: 数据检索
         await progress_manager.update_progress(task_id, "retrieval", 30, "正在检索相关数据...")
@@ -140,6 +170,8 @@ async def generate_chart(
                     user_id=user_input.user_id
                 )
 
+                yield "sql", {"sql": None, "data_source": data_source, "description": data_source_desc}
+
                 if df is not None and not df.empty:
                     logger.info(f"智能多数据集查询成功: {len(df)} 行, {len(df.columns)} 列")
                     logger.info(f"{data_source_desc}")
@@ -178,8 +210,10 @@ async def generate_chart(
                     )
 
                     if sql_query:
+                        yield "sql", {"sql": sql_query, "data_source": data_source, "dataset_id": dataset_id}
+
                         # 使用DuckDB查询Parquet
-                        df = await query_parquet_with_duckdb(dataset_id, sql_query)
+                        df = await query_parquet_with_duckdb(dataset_id, sql_query, question=user_input.user_input)
                         logger.info(f"DuckDB查询成功: {len(df) if df is not None else 0} 行")
 
                 except Exception as e:
@@ -196,8 +230,7 @@ async def generate_chart(
                 # 保存错误消息到数据库
                 if conversation_id:
                     try:
-                        await save_error_message(
-                            async_session,
+                        queue_error_message(
                             conversation_id,
                             "用户数据集查询失败",
                             user_input.user_input
@@ -205,7 +238,7 @@ async def generate_chart(
                     except Exception as e:
                         logger.warning(f"保存错误消息失败: {e}")
 
-                return {
+                yield "result", {
                     "error": "用户数据集查询失败",
                     "message": error_msg,
                     "data": [],
@@ -213,6 +246,7 @@ async def generate_chart(
                     "chart_type": "bar",
                     "is_error": True
                 }
+                return
 
             # 只有在用户未指定数据集且向量检索未找到时，才回退到固定Schema
             logger.info("回退到固定Schema查询")
@@ -235,8 +269,7 @@ async def generate_chart(
                 # 保存错误消息到数据库
                 if conversation_id:
                     try:
-                        await save_error_message(
-                            async_session,
+                        queue_error_message(
                             conversation_id,
                             "无法生成SQL查询语句",
                             user_input.user_input
@@ -245,7 +278,7 @@ async def generate_chart(
                         logger.warning(f"保存错误消息失败: {e}")
 
                 await progress_manager.update_progress(task_id, "sql_generation", 0, "SQL生成失败", error=True)
-                return {
+                yield "result", {
                     "error": "无法生成SQL查询语句",
                     "message": error_msg,
                     "data": [],
@@ -254,6 +287,9 @@ async def generate_chart(
                     "is_error": True,
                     "task_id": task_id
                 }
+                return
+
+            yield "sql", {"sql": sql_query, "data_source": data_source}
 
             # 步骤5: 查询执行
             await progress_manager.update_progress(task_id, "query_execution", 70, "正在执行数据查询...")
@@ -270,8 +306,7 @@ async def generate_chart(
             # 保存错误消息到数据库
             if conversation_id:
                 try:
-                    await save_error_message(
-                        async_session,
+                    queue_error_message(
                         conversation_id,
                         "SQL查询失败或返回空数据",
                         user_input.user_input
@@ -280,7 +315,7 @@ async def generate_chart(
                     logger.warning(f"保存错误消息失败: {e}")
 
             await progress_manager.update_progress(task_id, "query_execution", 0, "查询执行失败", error=True)
-            return {
+            yield "result", {
                 "error": "SQL查询失败或返回空数据",
                 "message": error_msg,
                 "data": [],
@@ -288,6 +323,49 @@ async def generate_chart(
                 "chart_type": "bar",
                 "task_id": task_id
             }
+            return
+
+        logger.info(f"查询完成: {len(df)} 行 x {len(df.columns)} 列")
+        # 结果只序列化一次(Arrow IPC),洞察分析和对话历史通过内容引用读取
+        result_artifact = None
+        try:
+            result_artifact = await result_store.put(df)
+        except Exception as e:
+            logger.warning(f"保存查询结果失败,对话历史将内联保存数据: {e}")
+
+        # 返回给前端的数据(按列向量化转换, 支持 records / columns 两种形状)
+        response_data = to_json_data(df, user_input.data_format)
+
+        yield "data", {
+            "data": response_data,
+            "data_format": user_input.data_format,
+            "columns": [str(col) for col in df.columns],
+            "rows": len(df),
+            "data_source": data_source,
+            "result_ref": result_artifact.to_ref() if result_artifact else None
+        }
+
+        # 生成洞察分析任务ID
+        insight_task_id = str(uuid.uuid4())
+
+        # 同时开始洞察分析（后台任务，与展示方式判断并行）
+        insight_analysis_task = asyncio.create_task(
+            generate_insight_analysis(
+                user_input.user_input,
+                df,
+                user_id=user_input.user_id
+            )
+        )
+
+        # 洞察分析结果写入Redis(响应结束后执行,等待已经开始的任务)
+        background_tasks.add_task(
+            store_insight_analysis_with_task_id,
+            user_input.user_input,
+            insight_analysis_task,
+            insight_task_id
+        )
+
+        yield "insight", {"insight_task_id": insight_task_id}
 
         # 步骤6: 数据处理和可视化分析
         await progress_manager.update_progress(task_id, "query_execution", 90, "正在分析数据和生成图表...")
@@ -316,7 +394,7 @@ async def generate_chart(
                 )
                 chart_type_task = determine_chart_type(
                     user_input.user_input,
-                    df.to_json(orient="records"),
+                    df.head(CHART_TYPE_SAMPLE_ROWS).to_json(orient="records"),
                     user_id=user_input.user_id
                 )
 
@@ -343,43 +421,21 @@ async def generate_chart(
             refined_data = None
             chart_type = None
 
-        # 生成洞察分析任务ID
-        insight_task_id = str(uuid.uuid4())
-
-        # 同时开始洞察分析（后台任务）
-        insight_analysis_task = asyncio.create_task(
-            generate_insight_analysis(
-                user_input.user_input,
-                df,
-                user_id=user_input.user_id
-            )
-        )
-
         logger.info(f"数据处理完成: visualization_type={visualization_type}, refined_data={refined_data}, chart_type={chart_type}")
-
-        # 将日期对象转换为字符串格式，并处理无效的float值
-        data_records = df.to_dict(orient="records")
-        for record in data_records:
-            for key, value in record.items():
-                if isinstance(value, datetime):
-                    record[key] = value.strftime("%Y-%m-%d")
-                elif isinstance(value, (float, np.float64, np.float32)):
-                    # 处理无效的float值
-                    if math.isnan(value) or math.isinf(value):
-                        record[key] = None
-                    else:
-                        record[key] = float(value)
-                elif isinstance(value, (np.int64, np.int32)):
-                    record[key] = int(value)
-                elif pd.isna(value):
-                    record[key] = None
+        yield "presentation", {
+            "visualization_type": visualization_type,
+            "viz_metadata": viz_judgment.get("metadata", {}),
+            "chart_type": chart_type,
+            "refined_data": refined_data
+        }
 
         # 步骤7: 完成处理
         await progress_manager.update_progress(task_id, "query_execution", 100, "数据处理完成")
 
         # 构建返回结果
         result = {
-            "data": data_records,
+            "data": response_data,
+            "data_format": user_input.data_format,
             "refined_data": refined_data,  # chart类型时才有值
             "chart_type": chart_type,      # chart类型时才有值
             "visualization_type": visualization_type,  # 新增：展示类型
@@ -388,17 +444,11 @@ async def generate_chart(
             "intent": intent_result['intent'],
             "insight_analysis": None,  # 添加洞察分析字段，初始为None
             "insight_task_id": insight_task_id,  # 返回洞察分析任务ID
-            "task_id": task_id  # 返回任务ID供前端订阅进度
+            "task_id": task_id,  # 返回任务ID供前端订阅进度
+            "result_ref": result_artifact.to_ref() if result_artifact else None
         }
 
-        # 将数据存储到Redis供流式分析使用
-        await redis_client.set(
-            f"chart_data:{user_input.user_input}",
-            df.to_json(orient="records"),
-            ex=3600  # 1小时过期
-        )
-
-        logger.info("Successfully generated chart data:\n %s", result)
+        logger.info(f"Successfully generated chart data: {len(df)} rows x {len(df.columns)} columns, visualization_type={visualization_type}")
 
         # 保存AI回复到数据库(包含图表数据)
         if conversation_id:
@@ -411,32 +461,38 @@ async def generate_chart(
                 elif visualization_type == "card":
                     assistant_content = "数据详情已准备就绪"
                 elif visualization_type == "table":
-                    assistant_content = f"已查询到{len(data_records)}条数据"
+                    assistant_content = f"已查询到{len(df)}条数据"
                 else:
                     assistant_content = "数据已准备就绪"
 
-                await save_assistant_message(
-                    async_session,
+                # 有结果引用时不重复保存数据,读取历史时按引用加载
+                if result_artifact:
+                    background_tasks.add_task(result_store.persist, result_artifact.digest)
+                    chart_data = {k: v for k, v in result.items() if k not in ("data", "data_format")}
+                elif user_input.data_format == DATA_FORMAT_RECORDS:
+                    chart_data = result
+                else:
+                    # 对话历史统一保存记录格式
+                    chart_data = {**result, "data": to_json_records(df), "data_format": DATA_FORMAT_RECORDS}
+
+                queue_assistant_message(
                     conversation_id,
                     content=assistant_content,
-                    chart_data=result,  # 保存完整的数据
+                    chart_data=chart_data,
                     chart_type=chart_type if chart_type else "none",
                     response_time=response_time
                     # 注意: generate_chart的token使用量难以准确统计(多个AI调用),
                     # 主要的token记录在insight_analysis_stream中完成
                 )
-                logger.info(f"AI回复已保存: conversation_id={conversation_id}, 可视化类型={visualization_type}")
-
-                # 检查是否需要生成标题（新对话的第二条消息）
-                from models.sys_conversation import SysConversation
-                from sqlalchemy import select
-                
-                conv_result = await async_session.execute(
-                    select(SysConversation).where(SysConversation.id == conversation_id)
-                )
-                conversation = conv_result.scalar_one_or_none()
-                
-                if conversation and conversation.message_count == 2 and conversation.title == "新对话":
+                logger.info(f"AI回复已加入写入队列: conversation_id={conversation_id}, 可视化类型={visualization_type}")
+
+                # 检查是否需要生成标题（新对话的第一轮: 入队前没有消息）
+                # 批量写入前 message_count 不会更新, 并发的首轮请求通过Redis标记只生成一次
+                if (
+                    conversation.message_count == 0
+                    and conversation.title == "新对话"
+                    and await claim_title_generation(conversation_id)
+                ):
                     # 后台任务: 生成会话标题
                     background_tasks.add_task(
                         generate_title_for_conversation,
@@ -455,15 +511,7 @@ async def generate_chart(
             except Exception as e:
                 logger.warning(f"保存AI回复失败: {e}")
 
-        # 将洞察分析任务添加到后台任务，但使用已经开始的任务
-        background_tasks.add_task(
-            store_insight_analysis_with_task_id, 
-            user_input.user_input, 
-            insight_analysis_task,
-            insight_task_id
-        )
-
-        return result
+        yield "result", result
 
     except Exception as e:
         logger.exception("An error occurred while generating chart")
@@ -510,8 +558,7 @@ async def generate_chart(
         # 保存错误消息到数据库
         if conversation_id:
             try:
-                await save_error_message(
-                    async_session,
+                queue_error_message(
                     conversation_id,
                     f"{formatted_error['message']}: {error_message}",
                     user_input.user_input
@@ -520,7 +567,7 @@ async def generate_chart(
                 logger.warning(f"保存错误消息失败: {save_err}")
 
         # 返回更友好的错误信息而不是抛出异常
-        return {
+        yield "result", {
             "error": formatted_error['message'],
             "message": error_message,
             "data": [],
@@ -530,6 +577,80 @@ async def generate_chart(
             "error_id": error_id,
             "task_id": task_id  # 确保错误情况下也返回task_id
         }
+        return
+
+def _sse_event(event: str, payload: Dict[str, Any]) -> bytes:
+    """编码为SSE事件"""
+    return b"event: " + event.encode() + b"\ndata: " + dumps(payload) + b"\n\n"
+
+
+@router.post("/generate_chart")
+async def generate_chart(
+    user_input: UserInput,
+    background_tasks: BackgroundTasks,
+    async_session: AsyncSession = Depends(get_async_session),
+):
+    """
+    生成图表 - 支持固定Schema和用户上传数据集
+
+    等待全部阶段完成后一次性返回结果,流程见 generate_chart_events
+    """
+    # 生成任务ID用于进度跟踪
+    task_id = str(uuid.uuid4())
+
+    result = None
+    async for event, payload in generate_chart_events(user_input, background_tasks, async_session, task_id):
+        if event == "result":
+            result = payload
+
+    # 使用orjson直接编码,避免FastAPI逐个值转换
+    return ResultJSONResponse(result, background=background_tasks)
+
+
+@router.post("/generate_chart/stream")
+async def generate_chart_stream(
+    user_input: UserInput,
+    background_tasks: BackgroundTasks,
+):
+    """
+    流式生成图表(SSE)
+
+    每个阶段完成后立即推送事件, 查询结果在SQL执行完成后即返回, 不等待展示方式判断等LLM调用:
+        task          任务ID(可用于订阅进度)
+        intent        意图识别结果
+        sql           生成的SQL和数据源
+        data          查询结果数据
+        insight       洞察分析任务ID
+        presentation  展示方式、图表类型、精炼数据
+        done          完整结果(已推送过的 data 不再重复)
+    """
+    task_id = str(uuid.uuid4())
+
+    async def event_stream():
+        yield _sse_event("task", {"task_id": task_id})
+
+        # 流式响应期间依赖注入的数据库会话已关闭,这里单独创建
+        async with session_factory() as session:
+            data_sent = False
+            async for event, payload in generate_chart_events(user_input, background_tasks, session, task_id):
+                if event == "data":
+                    data_sent = True
+                elif event == "result":
+                    event = "done"
+                    if data_sent:
+                        payload = {k: v for k, v in payload.items() if k != "data"}
+                yield _sse_event(event, payload)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        },
+        background=background_tasks
+    )
 
 
 async def generate_sql_for_dataset(
@@ -759,6 +880,19 @@ async def store_insight_analysis_with_task_id(user_input, insight_task, task_id)
         await redis_client.set(f"insight_task:{task_id}", json.dumps(task_data, ensure_ascii=False), ex=86400)
 
 
+# 会话标题生成标记的过期时间(秒)
+TITLE_CLAIM_TTL = 300
+
+
+async def claim_title_generation(conversation_id: int) -> bool:
+    """标记会话正在生成标题, 已被其他请求标记时返回False(Redis不可用时放行, 写入标题时仍会再次检查)"""
+    try:
+        return bool(await redis_client.set(f"conversation_title:{conversation_id}", 1, nx=True, ex=TITLE_CLAIM_TTL))
+    except Exception as e:
+        logger.warning(f"标记会话标题生成失败: {e}")
+        return True
+
+
 async def generate_title_for_conversation(conversation_id: int, user_question: str):
     """
     后台任务: 生成会话标题
@@ -771,7 +905,7 @@ async def generate_title_for_conversation(conversation_id: int, user_question: s
         from services.model_cache_service import ModelCacheService
         from models.sys_conversation import SysConversation
         from db.session import async_session
-        from sqlalchemy import select
+        from sqlalchemy import select, update
         import aiohttp
 
         async with async_session() as db:
@@ -884,11 +1018,18 @@ async def generate_title_for_conversation(conversation_id: int, user_question: s
                 logger.error(f"标题生成过程异常: {e}")
                 generated_title = user_question[:50] + ("..." if len(user_question) > 50 else "")
 
-            # 更新会话标题
+            # 更新会话标题(只在仍为默认标题时写入, 避免覆盖期间已生成或用户修改的标题)
             if generated_title:
-                conversation.title = generated_title
+                result = await db.execute(
+                    update(SysConversation)
+                    .where(SysConversation.id == conversation_id, SysConversation.title == "新对话")
+                    .values(title=generated_title)
+                )
                 await db.commit()
-                logger.info(f"会话 {conversation_id} 标题已自动生成: {generated_title}")
+                if result.rowcount:
+                    logger.info(f"会话 {conversation_id} 标题已自动生成: {generated_title}")
+                else:
+                    logger.info(f"会话 {conversation_id} 标题已被更新，跳过写入")
             else:
                 logger.error(f"会话 {conversation_id} 标题生成失败，保持原标题")
 
@@ -940,3 +1081,37 @@ async def update_summary_for_conversation(conversation_id: int, user_question: s
 
     except Exception as e:
         logger.error(f"后台更新会话摘要失败: {e}")
+
+
+async def record_intent_action(
+    user_question: str,
+    intent: str,
+    user_id: int,
+    conversation_id: int = None
+):
+    """
+    后台任务: 记录意图分类结果到SysDatasetAction
+
+    这些记录是train_intent_classifier.py训练本地意图分类器的数据来源
+
+    Args:
+        user_question: 用户问题
+        intent: 意图类型
+        user_id: 用户ID
+        conversation_id: 对话会话ID
+    """
+    try:
+        from models.sys_dataset import SysDatasetAction
+        from db.session import async_session
+
+        async with async_session() as db:
+            db.add(SysDatasetAction(
+                user_id=user_id,
+                session_id=str(conversation_id) if conversation_id else None,
+                input_text=user_question,
+                intent=intent
+            ))
+            await db.commit()
+
+    except Exception as e:
+        logger.warning(f"记录意图分类结果失败: {e}")
@@ -5,17 +5,23 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 import json
 import logging
+import re
 import asyncio
 import aiohttp
 import time
 
 from models.sys_ai_model_config import SysAiModelConfig
 from db.session import async_session
+from services.result_store import result_store
+from services.result_encoding import dumps
 from services.conversation_service import save_user_message, save_assistant_message, update_conversation_summary
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# 查询结果句柄格式(sha256十六进制)
+RESULT_ID_PATTERN = re.compile(r"[0-9a-f]{64}")
+
 
 async def generate_title_async(conversation_id: int, user_question: str):
     """异步生成会话标题"""
@@ -427,21 +433,26 @@ async def insight_analysis_stream(request: StreamInsightRequest):
     )
 
 
-@router.get("/insight_analysis_stream/{user_input}")
-async def insight_analysis_stream_get(user_input: str):
-    """通过GET方式获取流式洞察分析"""
+@router.get("/insight_analysis_stream/result/{result_id}")
+async def insight_analysis_stream_get(result_id: str, user_input: str):
+    """
+    通过GET方式获取流式洞察分析
+
+    Args:
+        result_id: 查询结果句柄(generate_chart 返回的 result_ref.digest)
+        user_input: 用户问题
+    """
+    if not RESULT_ID_PATTERN.fullmatch(result_id):
+        raise HTTPException(status_code=400, detail="无效的结果句柄")
 
     async def generate_stream():
         try:
-            # 从Redis获取相关数据
-            from api.dependencies.dependencies import redis_client
-
-            data_key = f"chart_data:{user_input}"
-            data_json = await redis_client.get(data_key)
-
-            if not data_json:
+            # 按结果句柄加载数据
+            records = await result_store.get_records(result_id)
+            if records is None:
                 yield f"data: {json.dumps({'error': '未找到相关数据'})}\n\n"
                 return
+            data_json = dumps(records).decode()
 
             # 创建请求对象
             request = StreamInsightRequest(user_input=user_input, data=data_json)
@@ -6,9 +6,8 @@ from fastapi import APIRouter, HTTPException
 from fastapi.responses import StreamingResponse
 from typing import Optional
 import logging
-import io
 
-from core.minio_client import minio_client
+from core.minio_client import async_minio
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -27,7 +26,7 @@ async def list_minio_files(prefix: str = "", recursive: bool = True):
         文件列表，包含文件名、大小、修改时间等信息
     """
     try:
-        files = minio_client.list_files(prefix=prefix, recursive=recursive)
+        files = await async_minio.list_files(prefix=prefix, recursive=recursive)
 
         # 计算总大小
         total_size = sum(f['size'] for f in files)
@@ -55,13 +54,13 @@ async def get_file_info(file_path: str):
         文件详细信息
     """
     try:
-        stats = minio_client.get_file_stats(file_path)
+        stats = await async_minio.get_file_stats(file_path)
 
         if not stats:
             raise HTTPException(status_code=404, detail="文件不存在")
 
         # 生成临时下载链接
-        download_url = minio_client.get_file_url(file_path, expires=3600)
+        download_url = await async_minio.get_file_url(file_path, expires=3600)
         stats['download_url'] = download_url
 
         return {
@@ -87,19 +86,20 @@ async def download_file(file_path: str):
         文件流
     """
     try:
-        if not minio_client.file_exists(file_path):
+        stat = await async_minio.stat(file_path)
+        if stat is None:
             raise HTTPException(status_code=404, detail="文件不存在")
 
-        file_data = minio_client.download_file(file_path)
-
         # 从路径中提取文件名
         filename = file_path.split('/')[-1]
 
+        # 分块流式返回,不把整个文件读入内存
         return StreamingResponse(
-            io.BytesIO(file_data),
+            async_minio.iter_object(file_path),
             media_type="application/octet-stream",
             headers={
-                "Content-Disposition": f'attachment; filename="{filename}"'
+                "Content-Disposition": f'attachment; filename="{filename}"',
+                "Content-Length": str(stat.size)
             }
         )
     except HTTPException:
@@ -121,10 +121,10 @@ async def delete_minio_file(file_path: str):
         删除结果
     """
     try:
-        if not minio_client.file_exists(file_path):
+        if not await async_minio.file_exists(file_path):
             raise HTTPException(status_code=404, detail="文件不存在")
 
-        success = minio_client.delete_file(file_path)
+        success = await async_minio.delete_file(file_path)
 
         if not success:
             raise HTTPException(status_code=500, detail="文件删除失败")
@@ -149,7 +149,7 @@ async def get_minio_stats():
         存储统计信息
     """
     try:
-        all_files = minio_client.list_files(prefix="", recursive=True)
+        all_files = await async_minio.list_files(prefix="", recursive=True)
 
         # 按目录分组统计
         stats_by_dir = {}
@@ -1,5 +1,11 @@
 from fastapi import APIRouter, HTTPException, Query
 from api.utils.monitoring import error_monitor
+from services.intent_cache import IntentCacheService
+from db.session import get_pool_stats
+from services.conversation_writer import conversation_writer
+from services.result_store import result_store
+from api.endpoints.progress_stream import get_progress_manager
+from services.job_queue import job_queue
 from typing import Optional
 
 router = APIRouter()
@@ -70,6 +76,100 @@ async def get_performance_statistics(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取性能统计失败: {str(e)}")
 
+@router.get("/intent-cache-stats")
+async def get_intent_cache_statistics():
+    """
+    获取意图分类缓存命中率统计
+    
+    Returns:
+        命中次数、未命中次数和命中率(所有worker累计)
+    """
+    try:
+        stats = await IntentCacheService.get_stats()
+        return {
+            "success": True,
+            "data": stats
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取意图缓存统计失败: {str(e)}")
+
+@router.get("/db-pool-stats")
+async def get_db_pool_statistics():
+    """
+    获取数据库连接池使用情况(当前worker进程)
+    
+    Returns:
+        连接池大小、已借出连接数、溢出连接数、获取连接的平均/最大等待时间等
+    """
+    try:
+        return {
+            "success": True,
+            "data": get_pool_stats()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取连接池统计失败: {str(e)}")
+
+@router.get("/conversation-writer-stats")
+async def get_conversation_writer_statistics():
+    """
+    获取对话消息写入队列统计(当前worker进程)
+    
+    Returns:
+        待写入条数、已写入条数、批次数、失败次数、丢弃条数
+    """
+    try:
+        return {
+            "success": True,
+            "data": conversation_writer.stats()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取对话写入队列统计失败: {str(e)}")
+
+@router.get("/result-store-stats")
+async def get_result_store_statistics():
+    """
+    获取查询结果缓存占用情况
+    
+    Returns:
+        缓存项数量、已用字节数、容量上限、使用率
+    """
+    try:
+        return {
+            "success": True,
+            "data": await result_store.get_stats()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取查询结果缓存统计失败: {str(e)}")
+
+@router.get("/progress-stats")
+async def get_progress_statistics():
+    """
+    获取进度推送订阅情况(当前worker进程)
+    
+    Returns:
+        订阅中的任务数、SSE连接数、待发布进度数、监听连接状态
+    """
+    return {
+        "success": True,
+        "data": get_progress_manager().stats()
+    }
+
+@router.get("/job-queue-stats")
+async def get_job_queue_statistics():
+    """
+    获取后台任务队列情况
+    
+    Returns:
+        各任务类型的排队数、执行中数量、等待重试数量和并发上限
+    """
+    try:
+        return {
+            "success": True,
+            "data": await job_queue.get_stats()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取任务队列统计失败: {str(e)}")
+
 @router.get("/health-check")
 async def health_check():
     """
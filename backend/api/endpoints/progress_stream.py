@@ -5,20 +5,70 @@ from fastapi import APIRouter, Depends
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from api.dependencies.dependencies import get_async_session, redis_client
+from core.config import settings
 import asyncio
 import json
 import logging
-from typing import AsyncGenerator
+import time
+from typing import AsyncGenerator, Dict, Optional, Set
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 class ProgressManager:
-    """进度管理器 - 使用Redis存储和广播进度信息"""
-    
-    def __init__(self, redis_client):
+    """
+    进度管理器 - 使用Redis存储和广播进度信息
+
+    发布: 同一任务在 PROGRESS_COALESCE_MS 窗口内的多次更新只发布最后一次(完成/出错立即发布),
+          存储和发布通过一次pipeline完成
+    订阅: 每个worker进程只建立一个Redis pubsub连接(模式订阅 progress_channel:*),
+          按任务ID分发到各SSE连接的进程内队列,任务完成/出错后自动清理
+    """
+
+    CHANNEL_PREFIX = "progress_channel:"
+    QUEUE_SIZE = 100
+    MAX_TRACKED_TASKS = 1000
+
+    def __init__(self, redis_client, coalesce_ms: int = 100, stream_timeout: int = 300):
         self.redis = redis_client
-    
+        self.coalesce_window = coalesce_ms / 1000
+        self.stream_timeout = stream_timeout
+        # 发布端: 任务ID -> 最近一次发布时间 / 窗口内待发布的最新进度 / 延迟发布任务
+        self._last_published: Dict[str, float] = {}
+        self._pending: Dict[str, dict] = {}
+        self._flush_tasks: Dict[str, asyncio.Task] = {}
+        # 订阅端: 任务ID -> 该任务的SSE连接队列
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._listener_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def is_terminal(progress_data: dict) -> bool:
+        """任务是否已结束(完成或出错)"""
+        return (progress_data.get('progress') or 0) >= 100 or bool(progress_data.get('error'))
+
+    async def _publish(self, task_id: str, progress_data: dict):
+        """存储当前进度并发布(一次往返)"""
+        payload = json.dumps(progress_data)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.setex(f"progress:{task_id}", 300, payload)  # 5分钟过期
+        pipe.publish(f"{self.CHANNEL_PREFIX}{task_id}", payload)
+        await pipe.execute()
+        self._last_published[task_id] = time.monotonic()
+
+    async def _flush_later(self, task_id: str, delay: float):
+        """窗口结束后发布最新的待发布进度"""
+        try:
+            await asyncio.sleep(delay)
+            progress_data = self._pending.pop(task_id, None)
+            if progress_data:
+                await self._publish(task_id, progress_data)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"发布进度失败: {task_id}, {e}")
+        finally:
+            self._flush_tasks.pop(task_id, None)
+
     async def update_progress(self, task_id: str, step: str, progress: int, message: str = "", error: str = ""):
         """更新任务进度"""
         progress_data = {
@@ -29,14 +79,35 @@ class ProgressManager:
             "error": error,
             "timestamp": asyncio.get_event_loop().time()
         }
-        
-        # 存储到Redis
-        await self.redis.setex(f"progress:{task_id}", 300, json.dumps(progress_data))  # 5分钟过期
-        
-        # 发布到频道供SSE订阅
-        await self.redis.publish(f"progress_channel:{task_id}", json.dumps(progress_data))
-        
         logger.info(f"进度更新: {task_id} - {step} ({progress}%) - {message}")
+
+        if self.is_terminal(progress_data):
+            # 结束状态立即发布,并清理该任务的发布状态
+            flush_task = self._flush_tasks.pop(task_id, None)
+            if flush_task:
+                flush_task.cancel()
+            self._pending.pop(task_id, None)
+            await self._publish(task_id, progress_data)
+            self._last_published.pop(task_id, None)
+            return
+
+        if len(self._last_published) > self.MAX_TRACKED_TASKS:
+            # 未发送结束状态的任务不会被清理,定期移除早已过了合并窗口的记录
+            now = time.monotonic()
+            for stale_id in [t for t, ts in self._last_published.items() if now - ts > self.coalesce_window]:
+                self._last_published.pop(stale_id, None)
+
+        elapsed = time.monotonic() - self._last_published.get(task_id, 0.0)
+        if elapsed >= self.coalesce_window and task_id not in self._flush_tasks:
+            await self._publish(task_id, progress_data)
+            return
+
+        # 窗口内的更新合并,只保留最新一次
+        self._pending[task_id] = progress_data
+        if task_id not in self._flush_tasks:
+            self._flush_tasks[task_id] = asyncio.create_task(
+                self._flush_later(task_id, max(self.coalesce_window - elapsed, 0))
+            )
     
     async def get_progress(self, task_id: str) -> dict:
         """获取任务当前进度"""
@@ -44,36 +115,108 @@ class ProgressManager:
         if progress_json:
             return json.loads(progress_json)
         return None
-    
+
+    def _dispatch(self, task_id: str, data: bytes):
+        """分发进度消息到该任务的所有订阅队列"""
+        for queue in self._subscribers.get(task_id, ()):
+            if queue.full():
+                # 消费过慢时丢弃最旧的进度,只保留最新状态
+                queue.get_nowait()
+            queue.put_nowait(data)
+
+    async def _listen(self):
+        """单连接模式订阅所有任务的进度频道,断线后重连"""
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.psubscribe(f"{self.CHANNEL_PREFIX}*")
+                logger.info("进度订阅监听已启动")
+                async for message in pubsub.listen():
+                    if message['type'] != 'pmessage':
+                        continue
+                    channel = message['channel'].decode()
+                    self._dispatch(channel[len(self.CHANNEL_PREFIX):], message['data'])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"进度订阅监听中断,1秒后重连: {e}")
+                await asyncio.sleep(1)
+            finally:
+                try:
+                    await pubsub.punsubscribe()
+                    await pubsub.close()
+                except Exception:
+                    pass
+
+    def _ensure_listener(self):
+        if self._listener_task is None or self._listener_task.done():
+            self._listener_task = asyncio.create_task(self._listen())
+
+    async def stop_listener(self):
+        """停止订阅监听和待发布任务(应用关闭时调用)"""
+        for flush_task in list(self._flush_tasks.values()):
+            flush_task.cancel()
+        self._flush_tasks.clear()
+        if self._listener_task:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+
+    def _unregister(self, task_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(task_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                self._subscribers.pop(task_id, None)
+
     async def subscribe_progress(self, task_id: str) -> AsyncGenerator[str, None]:
         """订阅任务进度更新"""
-        pubsub = self.redis.pubsub()
-        await pubsub.subscribe(f"progress_channel:{task_id}")
-        
+        self._ensure_listener()
+        # 先注册队列再读取当前进度,避免漏掉两者之间发布的更新
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        self._subscribers.setdefault(task_id, set()).add(queue)
+
         try:
             # 首先发送当前进度（如果存在）
             current_progress = await self.get_progress(task_id)
             if current_progress:
                 yield f"data: {json.dumps(current_progress)}\n\n"
-            
+                if self.is_terminal(current_progress):
+                    return
+
             # 监听新的进度更新
-            async for message in pubsub.listen():
-                if message['type'] == 'message':
-                    yield f"data: {message['data'].decode()}\n\n"
-                    
-                    # 如果任务完成或出错，结束流
-                    try:
-                        data = json.loads(message['data'].decode())
-                        if data.get('progress') >= 100 or data.get('error'):
-                            break
-                    except:
-                        pass
-                        
+            while True:
+                try:
+                    data = await asyncio.wait_for(queue.get(), timeout=self.stream_timeout)
+                except asyncio.TimeoutError:
+                    logger.info(f"进度订阅超时: {task_id}")
+                    break
+                yield f"data: {data.decode()}\n\n"
+
+                # 如果任务完成或出错，结束流
+                try:
+                    if self.is_terminal(json.loads(data)):
+                        break
+                except ValueError:
+                    pass
+
         except asyncio.CancelledError:
             logger.info(f"进度订阅被取消: {task_id}")
         finally:
-            await pubsub.unsubscribe(f"progress_channel:{task_id}")
-            await pubsub.close()
+            self._unregister(task_id, queue)
+
+    def stats(self) -> dict:
+        """订阅与发布状态(当前worker进程)"""
+        return {
+            "subscribed_tasks": len(self._subscribers),
+            "subscribers": sum(len(queues) for queues in self._subscribers.values()),
+            "pending_publish": len(self._pending),
+            "listener_running": self._listener_task is not None and not self._listener_task.done(),
+            "coalesce_ms": int(self.coalesce_window * 1000)
+        }
 
 # 全局进度管理器实例
 progress_manager = None
@@ -82,7 +225,11 @@ def get_progress_manager():
     """获取进度管理器实例"""
     global progress_manager
     if progress_manager is None:
-        progress_manager = ProgressManager(redis_client)
+        progress_manager = ProgressManager(
+            redis_client,
+            coalesce_ms=settings.PROGRESS_COALESCE_MS,
+            stream_timeout=settings.PROGRESS_STREAM_TIMEOUT
+        )
     return progress_manager
 
 @router.get("/progress/{task_id}")
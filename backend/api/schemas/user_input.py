@@ -1,10 +1,11 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Literal
 
 class UserInput(BaseModel):
     user_input: str
     user_id: int = 1  # 默认为1,临时使用固定用户ID
     dataset_ids: Optional[List[str]] = None  # 用户选中的数据集ID列表，支持多数据集查询
+    data_format: Literal["records", "columns"] = "records"  # 返回数据形状: 记录列表 或 列式 {columns, data}
 
 class FilePathInput(BaseModel):
     file_path: str
\ No newline at end of file
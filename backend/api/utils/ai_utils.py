@@ -164,8 +164,8 @@ async def get_configured_ai_model(user_id: int = 1):
     """
     获取配置的AI模型
 
-    优先从Redis获取用户选择的模型配置
-    如果Redis中没有,则从数据库获取默认配置
+    优先从进程内配置注册表获取用户选择的模型配置
+    过期或失效后再从Redis/数据库加载
 
     Args:
         user_id: 用户ID,默认为1
@@ -174,28 +174,22 @@ async def get_configured_ai_model(user_id: int = 1):
         模型配置字典,包含apiKey, baseUrl, model等信息
     """
     try:
-        from sqlalchemy.ext.asyncio import AsyncSession
         from services.model_cache_service import ModelCacheService
-        from db.session import async_session
-
-        async with async_session() as db:
-            # 从Redis/数据库获取用户选择的模型配置
-            model_config = await ModelCacheService.get_user_selected_model(
-                user_id=user_id,
-                db=db
-            )
-
-            if model_config:
-                return {
-                    'apiKey': model_config.get('api_key', ''),
-                    'baseUrl': model_config.get('api_url', ''),
-                    'model': model_config.get('model_name', ''),
-                    'temperature': model_config.get('temperature', 0.7),
-                    'maxTokens': model_config.get('max_tokens', 2000)
-                }
-
-            logging.warning(f"用户{user_id}没有可用的AI模型配置")
-            return None
+
+        # 进程内缓存命中时不访问Redis/数据库
+        model_config = await ModelCacheService.get_cached_user_model(user_id)
+
+        if model_config:
+            return {
+                'apiKey': model_config.get('api_key', ''),
+                'baseUrl': model_config.get('api_url', ''),
+                'model': model_config.get('model_name', ''),
+                'temperature': model_config.get('temperature', 0.7),
+                'maxTokens': model_config.get('max_tokens', 2000)
+            }
+
+        logging.warning(f"用户{user_id}没有可用的AI模型配置")
+        return None
     except Exception as e:
         logging.error(f"获取AI配置失败: {e}")
         return None
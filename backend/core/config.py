@@ -31,6 +31,15 @@ class Settings:
 
     # 组合生成 DATABASE_URL
     DATABASE_URL: str = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+    # 数据库连接池配置(每个worker进程一个连接池,总连接数 = workers * (pool_size + max_overflow))
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    DB_POOL_TIMEOUT: int = int(os.getenv("DB_POOL_TIMEOUT", 30))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", 1800))
+    # asyncpg预编译语句缓存大小(使用PgBouncer事务模式时设为0)
+    DB_STATEMENT_CACHE_SIZE: int = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 500))
+    DB_ECHO: bool = os.getenv("DB_ECHO", "False").lower() in ("true", "1", "t")
     
     REDIS_URL = os.getenv('REDIS_URL', 'redis://redis:6379/0')
 
@@ -40,6 +49,19 @@ class Settings:
     MINIO_SECRET_KEY: str = os.getenv("MINIO_SECRET_KEY", "minioadmin123")
     MINIO_BUCKET: str = os.getenv("MINIO_BUCKET", "chatbi-datasets")
     MINIO_SECURE: bool = os.getenv("MINIO_SECURE", "False").lower() in ("true", "1", "t")
+    # MinIO连接池大小(同时也是异步封装的线程数)、连接/读取超时(秒)
+    MINIO_POOL_SIZE: int = int(os.getenv("MINIO_POOL_SIZE", 32))
+    MINIO_CONNECT_TIMEOUT: float = float(os.getenv("MINIO_CONNECT_TIMEOUT", 10))
+    MINIO_READ_TIMEOUT: float = float(os.getenv("MINIO_READ_TIMEOUT", 300))
+    # 去重索引的内容定义分块(按CSV行切分)大小: 最小、平均、最大(字节), 修改后已有索引无法与新上传匹配
+    DEDUP_CHUNK_MIN_BYTES: int = int(os.getenv("DEDUP_CHUNK_MIN_BYTES", 256 * 1024))
+    DEDUP_CHUNK_AVG_BYTES: int = int(os.getenv("DEDUP_CHUNK_AVG_BYTES", 1024 * 1024))
+    DEDUP_CHUNK_MAX_BYTES: int = int(os.getenv("DEDUP_CHUNK_MAX_BYTES", 4 * 1024 * 1024))
+    # 原文件下载是否默认重定向到MinIO预签名URL(需要客户端能访问 MINIO_ENDPOINT)、预签名URL有效期(秒)
+    DOWNLOAD_PRESIGNED_REDIRECT: bool = os.getenv("DOWNLOAD_PRESIGNED_REDIRECT", "False").lower() in ("true", "1", "t")
+    DOWNLOAD_PRESIGNED_EXPIRES: int = int(os.getenv("DOWNLOAD_PRESIGNED_EXPIRES", 3600))
+    # 流式上传的分片大小(字节, 不小于5MB), 上传内存占用约为一个分片
+    MINIO_UPLOAD_PART_SIZE: int = int(os.getenv("MINIO_UPLOAD_PART_SIZE", 10 * 1024 * 1024))
 
     # Qdrant向量数据库配置
     QDRANT_URL: str = os.getenv("QDRANT_URL", "http://localhost:6333")
@@ -53,8 +75,80 @@ class Settings:
 
     # 文件上传配置
     MAX_UPLOAD_SIZE: int = int(os.getenv("MAX_UPLOAD_SIZE", 100 * 1024 * 1024))  # 100MB
+    # 分片上传: 单个文件大小上限、分片大小、会话有效期(秒, 有分片上传时延长)
+    CHUNKED_UPLOAD_MAX_SIZE: int = int(os.getenv("CHUNKED_UPLOAD_MAX_SIZE", 10 * 1024 * 1024 * 1024))  # 10GB
+    UPLOAD_PART_SIZE: int = int(os.getenv("UPLOAD_PART_SIZE", 16 * 1024 * 1024))
+    UPLOAD_SESSION_TTL: int = int(os.getenv("UPLOAD_SESSION_TTL", 24 * 3600))
     ALLOWED_EXTENSIONS: list = [".csv", ".xlsx", ".xls", ".et"]  # 支持CSV和Excel (.et为WPS格式，可能需要转换)
 
+    # 本地意图分类器配置
+    INTENT_CLASSIFIER_PATH: str = os.getenv("INTENT_CLASSIFIER_PATH", "config/intent_classifier.json")
+    # 本地分类器置信度低于该阈值时回退到LLM分类
+    INTENT_CLASSIFIER_THRESHOLD: float = float(os.getenv("INTENT_CLASSIFIER_THRESHOLD", 0.85))
+    # 意图分类结果缓存过期时间(秒)
+    INTENT_CACHE_TTL: int = int(os.getenv("INTENT_CACHE_TTL", 24 * 3600))
+
+    # 模型配置进程内缓存有效期(秒),配置写入时会通过Redis广播立即失效
+    CONFIG_CACHE_TTL: int = int(os.getenv("CONFIG_CACHE_TTL", 300))
+
+    # 对话消息批量写入: 写入间隔(毫秒)、每批最大条数、队列最大积压条数
+    CONVERSATION_FLUSH_INTERVAL_MS: int = int(os.getenv("CONVERSATION_FLUSH_INTERVAL_MS", 200))
+    CONVERSATION_FLUSH_BATCH_SIZE: int = int(os.getenv("CONVERSATION_FLUSH_BATCH_SIZE", 200))
+    CONVERSATION_WRITE_MAX_PENDING: int = int(os.getenv("CONVERSATION_WRITE_MAX_PENDING", 10000))
+
+    # 任务进度发布合并窗口(毫秒),窗口内同一任务的多次更新只发布最后一次
+    PROGRESS_COALESCE_MS: int = int(os.getenv("PROGRESS_COALESCE_MS", 100))
+    # 进度SSE连接无更新的最长等待时间(秒)
+    PROGRESS_STREAM_TIMEOUT: int = int(os.getenv("PROGRESS_STREAM_TIMEOUT", 300))
+
+    # 查询结果(Arrow IPC)在Redis中的缓存时间(秒),持久化副本保存在MinIO
+    RESULT_ARTIFACT_TTL: int = int(os.getenv("RESULT_ARTIFACT_TTL", 3600))
+    # Redis中查询结果缓存总大小上限(字节),超过后按最近最少访问淘汰
+    RESULT_ARTIFACT_MAX_BYTES: int = int(os.getenv("RESULT_ARTIFACT_MAX_BYTES", 256 * 1024 * 1024))
+    # 单个结果超过该大小(字节)时不进入Redis,直接保存到MinIO
+    RESULT_ARTIFACT_MAX_ITEM_BYTES: int = int(os.getenv("RESULT_ARTIFACT_MAX_ITEM_BYTES", 16 * 1024 * 1024))
+    # 数据集查询结果缓存时间(秒), 按 (数据集, 数据版本, SQL) 缓存, 0表示不缓存
+    DATASET_QUERY_CACHE_TTL: int = int(os.getenv("DATASET_QUERY_CACHE_TTL", 600))
+    # 聚合物化缓存: 是否启用; 最近 ROLLUP_LOOKBACK 次查询中同一GROUP BY形状出现 ROLLUP_MIN_QUERIES 次以上时物化
+    ROLLUP_ENABLED: bool = os.getenv("ROLLUP_ENABLED", "True").lower() in ("true", "1", "t")
+    ROLLUP_MIN_QUERIES: int = int(os.getenv("ROLLUP_MIN_QUERIES", 3))
+    ROLLUP_LOOKBACK: int = int(os.getenv("ROLLUP_LOOKBACK", 500))
+    # 每个数据集最多保存的物化结果数、同一数据集两次规划的最小间隔(秒)
+    ROLLUP_MAX_PER_DATASET: int = int(os.getenv("ROLLUP_MAX_PER_DATASET", 8))
+    ROLLUP_PLAN_INTERVAL: int = int(os.getenv("ROLLUP_PLAN_INTERVAL", 300))
+    # 物化结果行数上限: 不超过 ROLLUP_MAX_ROWS 且不超过原始行数的 ROLLUP_MAX_RATIO, 否则不保存
+    ROLLUP_MAX_ROWS: int = int(os.getenv("ROLLUP_MAX_ROWS", 100000))
+    ROLLUP_MAX_RATIO: float = float(os.getenv("ROLLUP_MAX_RATIO", 0.2))
+
+    # 后台任务队列(解析/分片/向量化/Embedding), memory:// 使用进程内fakeredis(仅限本地开发)
+    JOB_QUEUE_REDIS_URL: str = os.getenv("JOB_QUEUE_REDIS_URL", REDIS_URL)
+    # 每种任务类型的全局并发上限(所有worker进程合计)
+    JOB_CONCURRENCY: str = os.getenv("JOB_CONCURRENCY", "parse=4,chunk=2,vectorize=2,embedding=2,append=2,rollup=1")
+    # 任务最大执行次数、重试退避基数(秒, 每次翻倍)
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+    JOB_RETRY_BACKOFF: float = float(os.getenv("JOB_RETRY_BACKOFF", 10))
+    # 执行中任务的租约时长(秒), worker失联超过该时间后任务重新入队
+    JOB_LEASE_SECONDS: int = int(os.getenv("JOB_LEASE_SECONDS", 120))
+    # 已结束任务状态的保留时间(秒)
+    JOB_RESULT_TTL: int = int(os.getenv("JOB_RESULT_TTL", 7 * 24 * 3600))
+    # worker空闲时的轮询间隔(秒)
+    JOB_POLL_INTERVAL: float = float(os.getenv("JOB_POLL_INTERVAL", 1.0))
+    # 数据集解析进程池: 进程数(0表示CPU核数)、每个解析进程的内存上限(MB, 0表示不限制)
+    PARSE_POOL_WORKERS: int = int(os.getenv("PARSE_POOL_WORKERS", 0))
+    PARSE_MEMORY_LIMIT_MB: int = int(os.getenv("PARSE_MEMORY_LIMIT_MB", 4096))
+    # 列数超过该值的宽表按列分批,在多个解析进程中并行推断Schema
+    PARSE_COLUMN_BATCH_SIZE: int = int(os.getenv("PARSE_COLUMN_BATCH_SIZE", 32))
+    # 宽表分批中间文件目录(默认系统临时目录)
+    PARSE_TMP_DIR: str = os.getenv("PARSE_TMP_DIR", "")
+    # 文档预览生成锁的超时时间(秒), 并发请求等待同一预览生成的最长时间
+    PREVIEW_LOCK_TIMEOUT: int = int(os.getenv("PREVIEW_LOCK_TIMEOUT", 60))
+    # Parquet本地缓存目录(默认系统临时目录下 chatbi_parquet_cache)、缓存总大小上限(字节)
+    PARQUET_CACHE_DIR: str = os.getenv("PARQUET_CACHE_DIR", "")
+    PARQUET_CACHE_MAX_BYTES: int = int(os.getenv("PARQUET_CACHE_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+    # 是否在API进程内运行任务worker(生产环境使用 python job_worker.py 独立运行);
+    # 未设置时 python main.py 单进程启动会自动开启, 多worker/生产模式需单独启动 job_worker.py
+    JOB_WORKER_EMBEDDED: bool = os.getenv("JOB_WORKER_EMBEDDED", "False").lower() in ("true", "1", "t")
+
     @property
     def RELOAD(self) -> bool:
         return self.FASTAPI_ENV == "development"
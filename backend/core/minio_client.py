@@ -3,14 +3,60 @@ MinIO对象存储客户端封装
 用于文件上传、下载和管理
 """
 from minio import Minio
+from minio.datatypes import Part
+from minio.deleteobjects import DeleteObject
 from minio.error import S3Error
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
 from core.config import settings
+import asyncio
+import certifi
+import hashlib
 import io
 import logging
-from typing import Optional
+import os
+import urllib3
+from typing import Any, AsyncIterator, Callable, List, Optional
 
 logger = logging.getLogger(__name__)
 
+# 分片上传的最小分片大小(S3协议限制)
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class UploadTooLargeError(ValueError):
+    """流式上传超过大小上限"""
+
+
+class HashingReader:
+    """
+    边读边计算MD5和大小的只读流包装
+
+    put_object 以未知长度(-1)分片上传时逐块调用 read, 内存占用仅为一个分片
+    """
+
+    def __init__(self, raw, max_size: Optional[int] = None, on_data: Optional[Callable[[bytes], None]] = None):
+        self.raw = raw
+        self.max_size = max_size
+        self.on_data = on_data
+        self.size = 0
+        self._md5 = hashlib.md5()
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.raw.read(size)
+        if chunk:
+            self.size += len(chunk)
+            if self.max_size is not None and self.size > self.max_size:
+                raise UploadTooLargeError(f"文件超过大小上限 {self.max_size} 字节")
+            self._md5.update(chunk)
+            if self.on_data is not None:
+                self.on_data(chunk)
+        return chunk
+
+    def hexdigest(self) -> str:
+        return self._md5.hexdigest()
+
 
 class MinIOClient:
     """MinIO客户端封装类"""
@@ -22,7 +68,8 @@ class MinIOClient:
                 settings.MINIO_ENDPOINT,
                 access_key=settings.MINIO_ACCESS_KEY,
                 secret_key=settings.MINIO_SECRET_KEY,
-                secure=settings.MINIO_SECURE
+                secure=settings.MINIO_SECURE,
+                http_client=self._create_http_client()
             )
             self._ensure_bucket(settings.MINIO_BUCKET)
             logger.info(f"MinIO客户端初始化成功: {settings.MINIO_ENDPOINT}")
@@ -30,6 +77,21 @@ class MinIOClient:
             logger.error(f"MinIO客户端初始化失败: {e}")
             raise
 
+    @staticmethod
+    def _create_http_client() -> urllib3.PoolManager:
+        """
+        连接池: 每个主机最多 MINIO_POOL_SIZE 个连接(默认urllib3只保留10个,
+        并发传输超过后会不断新建/丢弃连接)
+        """
+        return urllib3.PoolManager(
+            maxsize=settings.MINIO_POOL_SIZE,
+            block=False,
+            timeout=urllib3.Timeout(connect=settings.MINIO_CONNECT_TIMEOUT, read=settings.MINIO_READ_TIMEOUT),
+            cert_reqs="CERT_REQUIRED",
+            ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+            retries=urllib3.Retry(total=5, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504])
+        )
+
     def _ensure_bucket(self, bucket_name: str):
         """确保bucket存在,不存在则创建"""
         try:
@@ -69,6 +131,153 @@ class MinIOClient:
             logger.error(f"文件上传失败: {e}")
             raise
 
+    def upload_stream(
+        self,
+        stream,
+        object_name: str,
+        content_type: str = "application/octet-stream",
+        part_size: int = None
+    ) -> str:
+        """
+        流式上传(未知长度, 使用分片上传)
+
+        Args:
+            stream: 提供 read(size) 的文件对象, 如 HashingReader
+            object_name: 对象名称(路径)
+            content_type: 文件MIME类型
+            part_size: 分片大小(字节, 不小于5MB)
+
+        Returns:
+            文件的完整路径
+        """
+        try:
+            self.client.put_object(
+                settings.MINIO_BUCKET,
+                object_name,
+                stream,
+                length=-1,
+                part_size=max(part_size or settings.MINIO_UPLOAD_PART_SIZE, MIN_PART_SIZE),
+                content_type=content_type
+            )
+            file_path = f"{settings.MINIO_BUCKET}/{object_name}"
+            logger.info(f"文件流式上传成功: {file_path}")
+            return file_path
+        except S3Error as e:
+            logger.error(f"文件上传失败: {e}")
+            raise
+
+    def create_multipart_upload(self, object_name: str, content_type: str = "application/octet-stream") -> str:
+        """创建分片上传, 返回MinIO的upload_id"""
+        return self.client._create_multipart_upload(
+            settings.MINIO_BUCKET,
+            object_name,
+            {"Content-Type": content_type}
+        )
+
+    def upload_part(self, object_name: str, upload_id: str, part_number: int, data: bytes) -> str:
+        """上传一个分片, 返回分片ETag"""
+        return self.client._upload_part(
+            settings.MINIO_BUCKET,
+            object_name,
+            data,
+            None,
+            upload_id,
+            part_number
+        )
+
+    def complete_multipart_upload(self, object_name: str, upload_id: str, parts: List[tuple]) -> str:
+        """
+        合并分片
+
+        Args:
+            parts: [(分片序号, ETag), ...], 按分片序号升序
+
+        Returns:
+            文件的完整路径
+        """
+        self.client._complete_multipart_upload(
+            settings.MINIO_BUCKET,
+            object_name,
+            upload_id,
+            [Part(part_number, etag) for part_number, etag in parts]
+        )
+        file_path = f"{settings.MINIO_BUCKET}/{object_name}"
+        logger.info(f"分片上传合并成功: {file_path} ({len(parts)} 个分片)")
+        return file_path
+
+    def abort_multipart_upload(self, object_name: str, upload_id: str):
+        """取消分片上传并清理已上传的分片"""
+        try:
+            self.client._abort_multipart_upload(settings.MINIO_BUCKET, object_name, upload_id)
+        except S3Error as e:
+            logger.warning(f"取消分片上传失败: {object_name}, {e}")
+
+    def compute_md5(
+        self,
+        object_name: str,
+        chunk_size: int = 1024 * 1024,
+        on_data: Optional[Callable[[bytes], None]] = None
+    ) -> str:
+        """流式读取对象计算MD5(内存占用为一个读取块), on_data 同时接收每个读取块"""
+        md5 = hashlib.md5()
+        response = self.client.get_object(settings.MINIO_BUCKET, object_name)
+        try:
+            for chunk in response.stream(chunk_size):
+                md5.update(chunk)
+                if on_data is not None:
+                    on_data(chunk)
+        finally:
+            response.close()
+            response.release_conn()
+        return md5.hexdigest()
+
+    def get_object(self, object_name: str, offset: int = 0, length: Optional[int] = None):
+        """
+        获取对象的响应流(调用方负责 close/release_conn)
+
+        Args:
+            object_name: 对象名称(路径)
+            offset: 起始字节
+            length: 读取长度(None表示读到末尾)
+        """
+        return self.client.get_object(settings.MINIO_BUCKET, object_name, offset=offset, length=length or 0)
+
+    def read_range(self, object_name: str, offset: int, length: Optional[int]) -> bytes:
+        """读取对象的一段字节(length为None时读到末尾)"""
+        response = self.get_object(object_name, offset, length)
+        try:
+            return response.read()
+        finally:
+            response.close()
+            response.release_conn()
+
+    def download_to_file(self, object_name: str, file_path: str):
+        """下载对象到本地文件(流式写入,不占用内存)"""
+        self.client.fget_object(settings.MINIO_BUCKET, object_name, file_path)
+        logger.debug(f"文件下载成功: {object_name} -> {file_path}")
+
+    def stat(self, object_name: str):
+        """获取对象元数据, 不存在时返回None"""
+        try:
+            return self.client.stat_object(settings.MINIO_BUCKET, object_name)
+        except S3Error:
+            return None
+
+    def delete_files(self, object_names: List[str]) -> List[str]:
+        """
+        批量删除(一次请求最多1000个对象)
+
+        Returns:
+            删除失败的错误信息
+        """
+        errors = self.client.remove_objects(
+            settings.MINIO_BUCKET,
+            [DeleteObject(name) for name in object_names]
+        )
+        failed = [f"{error.name}: {error.message}" for error in errors]
+        logger.info(f"批量删除文件: {len(object_names)} 个, 失败 {len(failed)} 个")
+        return failed
+
     def download_file(self, object_name: str) -> bytes:
         """
         从MinIO下载文件
@@ -124,13 +333,14 @@ class MinIOClient:
         except S3Error:
             return False
 
-    def get_file_url(self, object_name: str, expires: int = 3600) -> Optional[str]:
+    def get_file_url(self, object_name: str, expires: int = 3600, response_headers: Optional[dict] = None) -> Optional[str]:
         """
         获取文件的预签名URL
 
         Args:
             object_name: 对象名称(路径)
             expires: 过期时间(秒)
+            response_headers: 覆盖下载响应头, 如 {"response-content-disposition": "..."}
 
         Returns:
             预签名URL
@@ -139,7 +349,8 @@ class MinIOClient:
             url = self.client.presigned_get_object(
                 settings.MINIO_BUCKET,
                 object_name,
-                expires=expires
+                expires=timedelta(seconds=expires),
+                response_headers=response_headers
             )
             return url
         except S3Error as e:
@@ -205,5 +416,141 @@ class MinIOClient:
             return None
 
 
+def object_name_from_path(path: str, default_prefix: str = "") -> str:
+    """
+    数据库中保存的文件路径转换为对象名称
+
+    upload_file 返回 "{bucket}/{object}", 早期数据只保存了文件名
+    """
+    bucket_prefix = f"{settings.MINIO_BUCKET}/"
+    if path.startswith(bucket_prefix):
+        return path[len(bucket_prefix):]
+    if '/' not in path and default_prefix:
+        return f"{default_prefix.rstrip('/')}/{path}"
+    return path
+
+
+class AsyncMinIOClient:
+    """
+    MinIO异步封装
+
+    MinIO SDK是同步的, 所有调用在专用线程池(大小与连接池一致)中执行, 不阻塞事件循环,
+    也不占用 asyncio.to_thread 的默认线程池
+    """
+
+    # S3批量删除接口每次最多1000个对象
+    DELETE_BATCH_SIZE = 1000
+
+    def __init__(self, client: MinIOClient, max_workers: int):
+        self.sync = client
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="minio")
+
+    async def _run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    async def upload_file(self, file_data: bytes, object_name: str, content_type: str = "application/octet-stream") -> str:
+        return await self._run(self.sync.upload_file, file_data, object_name, content_type)
+
+    async def upload_stream(self, stream, object_name: str, content_type: str = "application/octet-stream") -> str:
+        return await self._run(self.sync.upload_stream, stream, object_name, content_type)
+
+    async def download_file(self, object_name: str) -> bytes:
+        return await self._run(self.sync.download_file, object_name)
+
+    async def download_to_file(self, object_name: str, file_path: str):
+        await self._run(self.sync.download_to_file, object_name, file_path)
+
+    async def read_range(self, object_name: str, offset: int, length: Optional[int]) -> bytes:
+        """读取对象的一段字节(length为None时读到末尾)"""
+        return await self._run(self.sync.read_range, object_name, offset, length)
+
+    async def iter_object(
+        self,
+        object_name: str,
+        offset: int = 0,
+        length: Optional[int] = None,
+        chunk_size: int = 256 * 1024
+    ) -> AsyncIterator[bytes]:
+        """
+        流式读取对象(异步迭代器), 内存占用为一个块
+
+        Args:
+            object_name: 对象名称(路径)
+            offset: 起始字节
+            length: 读取长度(None表示读到末尾)
+            chunk_size: 每块字节数
+        """
+        response = await self._run(self.sync.get_object, object_name, offset, length)
+        try:
+            chunks = response.stream(chunk_size)
+            while True:
+                chunk = await self._run(next, chunks, None)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            response.close()
+            response.release_conn()
+
+    async def stat(self, object_name: str):
+        return await self._run(self.sync.stat, object_name)
+
+    async def file_exists(self, object_name: str) -> bool:
+        return await self._run(self.sync.file_exists, object_name)
+
+    async def get_file_stats(self, object_name: str) -> Optional[dict]:
+        return await self._run(self.sync.get_file_stats, object_name)
+
+    async def get_file_url(self, object_name: str, expires: int = 3600, response_headers: Optional[dict] = None) -> Optional[str]:
+        return await self._run(self.sync.get_file_url, object_name, expires, response_headers)
+
+    async def list_files(self, prefix: str = "", recursive: bool = True) -> List[dict]:
+        return await self._run(self.sync.list_files, prefix, recursive)
+
+    async def delete_file(self, object_name: str) -> bool:
+        return await self._run(self.sync.delete_file, object_name)
+
+    async def delete_files(self, object_names: List[str]) -> List[str]:
+        """
+        并发批量删除
+
+        Returns:
+            删除失败的错误信息
+        """
+        batches = [
+            object_names[i:i + self.DELETE_BATCH_SIZE]
+            for i in range(0, len(object_names), self.DELETE_BATCH_SIZE)
+        ]
+        results = await asyncio.gather(
+            *(self._run(self.sync.delete_files, batch) for batch in batches),
+            return_exceptions=True
+        )
+        errors = []
+        for batch, result in zip(batches, results):
+            if isinstance(result, Exception):
+                errors.extend(f"{name}: {result}" for name in batch)
+            else:
+                errors.extend(result)
+        return errors
+
+    async def compute_md5(self, object_name: str, on_data: Optional[Callable[[bytes], None]] = None) -> str:
+        return await self._run(self.sync.compute_md5, object_name, on_data=on_data)
+
+    async def create_multipart_upload(self, object_name: str, content_type: str = "application/octet-stream") -> str:
+        return await self._run(self.sync.create_multipart_upload, object_name, content_type)
+
+    async def upload_part(self, object_name: str, upload_id: str, part_number: int, data: bytes) -> str:
+        return await self._run(self.sync.upload_part, object_name, upload_id, part_number, data)
+
+    async def complete_multipart_upload(self, object_name: str, upload_id: str, parts: List[tuple]) -> str:
+        return await self._run(self.sync.complete_multipart_upload, object_name, upload_id, parts)
+
+    async def abort_multipart_upload(self, object_name: str, upload_id: str):
+        await self._run(self.sync.abort_multipart_upload, object_name, upload_id)
+
+
 # 全局单例
 minio_client = MinIOClient()
+# 异步接口(在async代码中使用)
+async_minio = AsyncMinIOClient(minio_client, max_workers=settings.MINIO_POOL_SIZE)
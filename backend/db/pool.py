@@ -0,0 +1,61 @@
+"""
+带使用统计的数据库连接池
+在SQLAlchemy异步连接池基础上记录连接获取次数、等待时间、超时次数和其他获取失败(连接/认证错误)次数
+"""
+import threading
+import time
+from typing import Any, Dict
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """记录连接获取等待时间的异步连接池"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self._checkout_count = 0
+        self._timeout_count = 0
+        self._error_count = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            # 连接池已满, 等待超过 pool_timeout
+            with self._stats_lock:
+                self._timeout_count += 1
+            raise
+        except Exception:
+            # 新建连接失败(数据库不可达、认证失败等)
+            with self._stats_lock:
+                self._error_count += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self._checkout_count += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+
+    def stats(self) -> Dict[str, Any]:
+        """连接池当前状态与累计统计"""
+        with self._stats_lock:
+            checkouts = self._checkout_count
+            return {
+                "pool_size": self.size(),
+                "checked_out": self.checkedout(),
+                "checked_in": self.checkedin(),
+                "overflow": max(self.overflow(), 0),
+                "max_overflow": self._max_overflow,
+                "checkouts_total": checkouts,
+                "timeouts_total": self._timeout_count,
+                "errors_total": self._error_count,
+                "avg_wait_ms": round(self._wait_total / checkouts * 1000, 3) if checkouts else 0.0,
+                "max_wait_ms": round(self._wait_max * 1000, 3),
+            }
@@ -1,16 +1,54 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncSession, AsyncEngine, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from core.config import settings
+from db.pool import InstrumentedAsyncQueuePool
 
 # 从配置中获取 DATABASE_URL
 DATABASE_URL = settings.DATABASE_URL
 
-# 创建异步引擎 (echo=False 减少日志输出)
-engine = create_async_engine(DATABASE_URL, echo=False)
+
+def create_engine_from_settings(database_url: str = DATABASE_URL, **overrides) -> AsyncEngine:
+    """
+    数据库引擎工厂
+
+    应用内所有数据库访问(请求处理、后台任务、脚本)都应使用本模块的engine/async_session,
+    不要再单独调用create_async_engine,以免产生多个互相独立的连接池
+
+    Args:
+        database_url: 数据库连接地址
+        overrides: 覆盖默认的引擎参数
+    """
+    options = dict(
+        echo=settings.DB_ECHO,  # 默认关闭,避免生产环境记录每条SQL
+        poolclass=InstrumentedAsyncQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+        connect_args={
+            # asyncpg预编译语句缓存(经PgBouncer事务模式连接时需设为0)
+            "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        },
+    )
+    options.update(overrides)
+    return create_async_engine(database_url, **options)
+
+
+def get_pool_stats(db_engine: AsyncEngine = None) -> dict:
+    """获取连接池使用统计"""
+    pool = (db_engine or engine).pool
+    if isinstance(pool, InstrumentedAsyncQueuePool):
+        return pool.stats()
+    return {"status": pool.status()}
+
+
+# 创建异步引擎(每个进程只创建一个,所有请求和后台任务共享同一个连接池)
+engine = create_engine_from_settings()
 
 # 创建异步会话
 async_session = sessionmaker(
     bind=engine,
     class_=AsyncSession,
     expire_on_commit=False
-)
\ No newline at end of file
+)
@@ -0,0 +1,46 @@
+"""
+Gunicorn 生产部署配置(uvicorn worker + 预加载应用)
+
+执行方式:
+    gunicorn -c gunicorn_conf.py main:app
+
+说明:
+    - preload_app: 主进程导入应用后再fork worker,模块只加载一次,worker启动更快、共享只读内存页
+    - 数据库初始化只在主进程执行一次
+    - fork后每个worker丢弃继承的连接池,各自建立连接(连接不能跨进程共享)
+"""
+import asyncio
+import os
+from core.config import settings
+
+bind = f"{settings.FASTAPI_HOST}:{settings.FASTAPI_PORT}"
+workers = settings.FASTAPI_WORKERS
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+loglevel = settings.FASTAPI_LOG_LEVEL
+# 生成图表等请求包含多次LLM调用,超时时间需要足够长
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 300))
+graceful_timeout = 30
+keepalive = 5
+
+
+def on_starting(server):
+    """主进程启动时执行一次数据库初始化"""
+    from main import prepare_database, DB_PREPARED_ENV
+    from db.session import engine
+
+    async def prepare():
+        try:
+            await prepare_database()
+        finally:
+            await engine.dispose()
+
+    asyncio.run(prepare())
+    os.environ[DB_PREPARED_ENV] = "1"
+    server.log.info("数据库初始化完成")
+
+
+def post_fork(server, worker):
+    """worker进程fork后丢弃从主进程继承的连接池"""
+    from db.session import engine
+    engine.sync_engine.dispose(close=False)
@@ -0,0 +1,58 @@
+"""
+后台任务worker - 消费Redis任务队列(数据集解析/分片/向量化/Embedding)
+
+每种任务类型启动 JOB_CONCURRENCY 中配置数量的消费协程, 任务类型的全局并发上限由Redis统一控制,
+可以在多台机器上启动多个worker进程
+
+执行方式:
+    python job_worker.py                                  # 消费所有任务类型
+    python job_worker.py --types parse                    # 只消费解析任务(CPU密集型,可单独部署)
+    python job_worker.py --types chunk,vectorize,embedding
+
+收到 SIGTERM/SIGINT 后停止接收新任务, 等待执行中的任务完成(超过 --shutdown-timeout 秒时放回队列)
+"""
+import argparse
+import asyncio
+import logging
+import signal
+
+from core.logging import setup_logging
+from api.dependencies.dependencies import redis_client, engine
+from services.job_queue import JobWorker, job_queue
+from services import parse_pool
+from services.dataset_jobs import JOB_HANDLERS
+
+setup_logging()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="ChatBI 后台任务worker")
+    parser.add_argument("--types", default=None, help=f"逗号分隔的任务类型(默认全部: {','.join(JOB_HANDLERS)})")
+    parser.add_argument("--shutdown-timeout", type=float, default=60, help="关闭时等待执行中任务的最长时间(秒)")
+    args = parser.parse_args()
+
+    job_types = [t.strip() for t in args.types.split(",")] if args.types else None
+    unknown = [t for t in job_types or [] if t not in JOB_HANDLERS]
+    if unknown:
+        parser.error(f"未知的任务类型: {', '.join(unknown)}")
+
+    worker = JobWorker(job_queue, JOB_HANDLERS, job_types)
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
+
+    worker.start()
+    await stopping.wait()
+    logging.info("收到停止信号,等待执行中的任务完成...")
+    await worker.stop(timeout=args.shutdown_timeout)
+    parse_pool.shutdown()
+
+    await job_queue.close()
+    await redis_client.close()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
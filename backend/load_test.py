@@ -0,0 +1,156 @@
+"""
+后端压测脚本 - 对比不同worker数量下的吞吐量
+
+用途:
+    依次以不同worker数启动服务(python main.py --workers N),
+    对指定接口发起并发请求,输出 QPS 与延迟分位数,观察吞吐量随worker数的扩展情况
+
+执行方式:
+    python load_test.py --workers 1,2,4 --concurrency 64 --requests 2000
+    python load_test.py --url http://127.0.0.1:11434 --path /api/datasets   # 压测已运行的服务
+
+注意: 需要先启动依赖服务(PostgreSQL / Redis), 默认压测 /api/conversations/1 (会访问数据库)
+"""
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+import aiohttp
+
+
+async def wait_until_ready(base_url: str, timeout: float = 60) -> bool:
+    """等待服务可用"""
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f"{base_url}/docs") as response:
+                    if response.status == 200:
+                        return True
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.5)
+    return False
+
+
+async def run_load(base_url: str, path: str, concurrency: int, total_requests: int) -> dict:
+    """并发请求指定接口,返回吞吐量与延迟统计"""
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(total_requests))
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=60)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+
+        async def worker():
+            nonlocal errors
+            for _ in counter:
+                start = time.perf_counter()
+                try:
+                    async with session.get(f"{base_url}{path}") as response:
+                        await response.read()
+                        if response.status >= 400:
+                            errors += 1
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        # 预热
+        async with session.get(f"{base_url}{path}") as response:
+            await response.read()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    def percentile(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "elapsed": elapsed,
+        "qps": len(latencies) / elapsed,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+    }
+
+
+def start_server(workers: int, port: int) -> subprocess.Popen:
+    """以指定worker数启动服务"""
+    env = dict(os.environ, FASTAPI_ENV="production", FASTAPI_LOG_LEVEL="warning")
+    return subprocess.Popen(
+        [sys.executable, "main.py", "--workers", str(workers), "--host", "127.0.0.1", "--port", str(port)],
+        env=env,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        start_new_session=True
+    )
+
+
+def stop_server(process: subprocess.Popen):
+    """停止服务(包括所有worker进程)"""
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+    except Exception:
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+def print_row(label: str, result: dict, baseline: Optional[float]):
+    scaling = f"{result['qps'] / baseline:.2f}x" if baseline else "1.00x"
+    print(
+        f"{label:>8} {result['qps']:>10.1f} {scaling:>8} {result['p50_ms']:>9.1f} "
+        f"{result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f} {result['errors']:>7}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="ChatBI 后端压测")
+    parser.add_argument("--workers", default="1,2,4", help="逗号分隔的worker数量列表")
+    parser.add_argument("--port", type=int, default=18080, help="压测服务端口")
+    parser.add_argument("--url", default=None, help="压测已运行的服务(不自动启动)")
+    parser.add_argument("--path", default="/api/conversations/1", help="压测接口路径")
+    parser.add_argument("--concurrency", type=int, default=64, help="并发连接数")
+    parser.add_argument("--requests", type=int, default=2000, help="总请求数")
+    args = parser.parse_args()
+
+    header = f"{'workers':>8} {'QPS':>10} {'scaling':>8} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9} {'errors':>7}"
+
+    if args.url:
+        result = await run_load(args.url.rstrip("/"), args.path, args.concurrency, args.requests)
+        print(header)
+        print_row("-", result, None)
+        return
+
+    rows = []
+    for workers in [int(w) for w in args.workers.split(",")]:
+        process = start_server(workers, args.port)
+        base_url = f"http://127.0.0.1:{args.port}"
+        try:
+            if not await wait_until_ready(base_url):
+                print(f"workers={workers}: 服务启动超时")
+                continue
+            result = await run_load(base_url, args.path, args.concurrency, args.requests)
+            rows.append((str(workers), result))
+            print(f"workers={workers}: {result['qps']:.1f} req/s")
+        finally:
+            stop_server(process)
+
+    print()
+    print(f"接口: {args.path}  并发: {args.concurrency}  请求数: {args.requests}")
+    print(header)
+    for label, result in rows:
+        print_row(label, result, rows[0][1]["qps"])
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -24,17 +24,47 @@ from contextlib import asynccontextmanager
 from api.dependencies.dependencies import redis_client, engine
 from core.logging import setup_logging
 from db.init_db import init_db, insert_default_data  # 导入数据库初始化和插入默认数据函数
+from services.config_registry import config_registry
+from services.conversation_writer import conversation_writer
+from api.endpoints.progress_stream import get_progress_manager
+from services.job_queue import JobWorker, job_queue
+from services.dataset_jobs import JOB_HANDLERS
+from services import parse_pool
 
 # 设置日志记录
 setup_logging()
 
+# 多worker模式下由主进程预先完成数据库初始化,worker启动时跳过
+DB_PREPARED_ENV = "CHATBI_DB_PREPARED"
+
+
+async def prepare_database():
+    """初始化数据库表并插入默认数据"""
+    await init_db()  # 调用数据库初始化函数
+    await insert_default_data()  # 插入默认数据
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # 在应用启动时执行的代码
-    await init_db()  # 调用数据库初始化函数
-    await insert_default_data()  # 插入默认数据
+    if os.getenv(DB_PREPARED_ENV) != "1":
+        await prepare_database()
+    config_registry.start_listener()  # 监听配置失效广播
+    conversation_writer.start()  # 对话消息后台批量写入
+    job_worker = None
+    if settings.JOB_WORKER_EMBEDDED:
+        # 本地开发: 在API进程内消费任务队列(生产环境使用 python job_worker.py)
+        job_worker = JobWorker(job_queue, JOB_HANDLERS)
+        job_worker.start()
     yield
     # 在应用关闭时执行的代码
+    if job_worker:
+        await job_worker.stop()  # 未完成的任务放回队列
+        parse_pool.shutdown()
+    await conversation_writer.stop()  # 写入所有剩余消息后再关闭连接池
+    await config_registry.stop_listener()
+    await get_progress_manager().stop_listener()
+    await job_queue.close()
     await redis_client.close()
     await engine.dispose()
 
@@ -72,5 +102,56 @@ app.include_router(model_selection.router, prefix="/api", tags=["模型选择"])
 app.include_router(insight_task.router, prefix="/api", tags=["洞察任务"])
 app.include_router(monitoring.router, prefix="/api/monitoring", tags=["监控"])
 
+def run_server():
+    """
+    启动服务
+
+    开发模式: 单进程 + 自动重载
+    生产模式(FASTAPI_ENV=production 或 --workers > 1): 多worker进程,
+    数据库初始化只在主进程执行一次; 每个worker拥有独立的数据库连接池和Redis连接
+
+    也可以使用gunicorn启动(预加载应用):
+        gunicorn -c gunicorn_conf.py main:app
+    """
+    import argparse
+    import asyncio
+
+    parser = argparse.ArgumentParser(description="ChatBI 后端服务")
+    parser.add_argument("--host", default=settings.FASTAPI_HOST)
+    parser.add_argument("--port", type=int, default=settings.FASTAPI_PORT)
+    parser.add_argument("--workers", type=int, default=None, help="worker进程数(默认读取FASTAPI_WORKERS)")
+    args = parser.parse_args()
+
+    production = settings.FASTAPI_ENV == "production"
+    workers = args.workers or (settings.FASTAPI_WORKERS if production else 1)
+
+    if workers > 1 or production:
+        async def prepare():
+            try:
+                await prepare_database()
+            finally:
+                await engine.dispose()
+
+        asyncio.run(prepare())
+        os.environ[DB_PREPARED_ENV] = "1"
+        logging.info(f"以生产模式启动: workers={workers}")
+        uvicorn.run(
+            app='main:app',
+            host=args.host,
+            port=args.port,
+            workers=workers,
+            log_level=settings.FASTAPI_LOG_LEVEL,
+            access_log=False
+        )
+    else:
+        if not os.getenv("JOB_WORKER_EMBEDDED"):
+            # 单进程开发模式未单独启动 job_worker.py 时, 在API进程内消费任务队列, 否则上传的数据集不会被解析
+            # (环境变量供 reload 子进程读取, settings 供当前进程导入 main:app 时使用)
+            os.environ["JOB_WORKER_EMBEDDED"] = "true"
+            settings.JOB_WORKER_EMBEDDED = True
+            logging.info("未设置 JOB_WORKER_EMBEDDED, 在API进程内运行任务worker")
+        uvicorn.run(app='main:app', host=args.host, port=args.port, reload=settings.RELOAD)
+
+
 if __name__ == "__main__":
-    uvicorn.run(app='main:app', host=settings.FASTAPI_HOST, port=settings.FASTAPI_PORT, reload=settings.RELOAD)
\ No newline at end of file
+    run_server()
\ No newline at end of file
@@ -0,0 +1,82 @@
+"""
+数据库迁移脚本: 会话列表去除N+1查询
+1. 为 sys_conversation 添加冗余字段 last_user_message / last_message_at 并回填
+2. 添加复合索引:
+   - sys_conversation_message (conversation_id, role, created_at)
+   - sys_conversation (user_id, updated_at)
+
+执行方式:
+    python migrate_add_conversation_last_message.py
+"""
+import asyncio
+from sqlalchemy import text
+from db.session import async_session, engine
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def migrate():
+    """执行数据库迁移"""
+    async with engine.begin() as conn:
+        logger.info("开始迁移: 添加会话最后一条用户消息字段...")
+
+        await conn.execute(text("""
+            ALTER TABLE sys_conversation
+            ADD COLUMN IF NOT EXISTS last_user_message TEXT,
+            ADD COLUMN IF NOT EXISTS last_message_at TIMESTAMP WITH TIME ZONE
+        """))
+        logger.info("✓ 冗余字段已添加")
+
+        # 复合索引(先建消息索引,回填时可以使用)
+        await conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_sys_conversation_message_conv_role_created
+            ON sys_conversation_message (conversation_id, role, created_at)
+        """))
+        await conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_sys_conversation_user_updated
+            ON sys_conversation (user_id, updated_at)
+        """))
+        logger.info("✓ 复合索引已创建")
+
+        # 回填已有会话的最后一条用户消息
+        await conn.execute(text("""
+            UPDATE sys_conversation AS c
+            SET last_user_message = LEFT(m.content, 500),
+                last_message_at = m.created_at
+            FROM (
+                SELECT DISTINCT ON (conversation_id) conversation_id, content, created_at
+                FROM sys_conversation_message
+                WHERE role = 'USER'
+                ORDER BY conversation_id, created_at DESC
+            ) AS m
+            WHERE c.id = m.conversation_id AND c.last_message_at IS NULL
+        """))
+        logger.info("✓ 已有会话数据已回填")
+
+        comments = [
+            "COMMENT ON COLUMN sys_conversation.last_user_message IS '最后一条用户消息(截断)'",
+            "COMMENT ON COLUMN sys_conversation.last_message_at IS '最后一条用户消息时间'"
+        ]
+        for comment_sql in comments:
+            await conn.execute(text(comment_sql))
+        logger.info("✓ 字段注释已添加")
+
+        logger.info("迁移完成!")
+
+
+async def verify():
+    """验证迁移结果"""
+    async with async_session() as session:
+        result = await session.execute(text("""
+            SELECT COUNT(*) AS total, COUNT(last_message_at) AS filled
+            FROM sys_conversation
+        """))
+        row = result.one()
+        logger.info(f"\n验证结果: 会话总数 {row.total}, 已回填 {row.filled}")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
+    asyncio.run(verify())
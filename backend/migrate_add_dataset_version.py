@@ -0,0 +1,49 @@
+"""
+数据库迁移脚本: 数据集追加数据
+为 sys_dataset 添加数据版本字段 version(追加数据后递增, 查询结果缓存以此为键)
+
+执行方式:
+    python migrate_add_dataset_version.py
+"""
+import asyncio
+from sqlalchemy import text
+from db.session import async_session, engine
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def migrate():
+    """执行数据库迁移"""
+    async with engine.begin() as conn:
+        logger.info("开始迁移: 添加数据集版本字段...")
+
+        await conn.execute(text("""
+            ALTER TABLE sys_dataset
+            ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1
+        """))
+        logger.info("✓ version 字段已添加")
+
+        await conn.execute(text(
+            "COMMENT ON COLUMN sys_dataset.version IS '数据版本(追加数据后递增)'"
+        ))
+        logger.info("✓ 字段注释已添加")
+
+        logger.info("迁移完成!")
+
+
+async def verify():
+    """验证迁移结果"""
+    async with async_session() as session:
+        result = await session.execute(text("""
+            SELECT COUNT(*) AS total, MAX(version) AS max_version
+            FROM sys_dataset
+        """))
+        row = result.one()
+        logger.info(f"\n验证结果: 数据集总数 {row.total}, 最大版本 {row.max_version}")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
+    asyncio.run(verify())
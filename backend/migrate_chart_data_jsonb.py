@@ -0,0 +1,82 @@
+"""
+数据库迁移脚本: sys_conversation_message.chart_data 从 TEXT(JSON字符串) 改为 JSONB
+读取消息历史时不再逐条 json.loads,并支持按引用延迟加载图表数据
+
+执行方式:
+    python migrate_chart_data_jsonb.py
+"""
+import asyncio
+from sqlalchemy import text
+from db.session import async_session, engine
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def migrate():
+    """执行数据库迁移"""
+    async with engine.begin() as conn:
+        result = await conn.execute(text("""
+            SELECT data_type FROM information_schema.columns
+            WHERE table_name = 'sys_conversation_message' AND column_name = 'chart_data'
+        """))
+        data_type = result.scalar_one_or_none()
+        if data_type == 'jsonb':
+            logger.info("chart_data 已是 JSONB 类型,跳过类型转换")
+            await _clear_json_null(conn)
+            return
+
+        logger.info("开始迁移: chart_data 转换为 JSONB...")
+
+        # 无法解析的历史数据(非JSON对象/数组)置空,否则类型转换会失败
+        result = await conn.execute(text(r"""
+            UPDATE sys_conversation_message
+            SET chart_data = NULL
+            WHERE chart_data IS NOT NULL AND chart_data !~ '^\s*[\{\[]'
+        """))
+        logger.info(f"✓ 已清理 {result.rowcount} 条无效图表数据")
+
+        await conn.execute(text("""
+            ALTER TABLE sys_conversation_message
+            ALTER COLUMN chart_data TYPE JSONB USING chart_data::jsonb
+        """))
+        logger.info("✓ 字段类型已转换")
+
+        await conn.execute(text(
+            "COMMENT ON COLUMN sys_conversation_message.chart_data IS '图表数据(JSONB)'"
+        ))
+        logger.info("✓ 字段注释已更新")
+
+        await _clear_json_null(conn)
+        logger.info("迁移完成!")
+
+
+async def _clear_json_null(conn):
+    """把写成 JSON null 的图表数据改为 SQL NULL(否则没有图表的消息也会被当作有图表)"""
+    result = await conn.execute(text("""
+        UPDATE sys_conversation_message
+        SET chart_data = NULL
+        WHERE chart_data = 'null'::jsonb
+    """))
+    logger.info(f"✓ 已将 {result.rowcount} 条 JSON null 图表数据改为 NULL")
+
+
+async def verify():
+    """验证迁移结果"""
+    async with async_session() as session:
+        result = await session.execute(text("""
+            SELECT COUNT(*) AS total, COUNT(chart_data) AS with_chart,
+                   COALESCE(SUM(pg_column_size(chart_data)), 0) AS chart_bytes
+            FROM sys_conversation_message
+        """))
+        row = result.one()
+        logger.info(
+            f"\n验证结果: 消息总数 {row.total}, 含图表数据 {row.with_chart}, "
+            f"图表数据存储大小 {row.chart_bytes} 字节"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
+    asyncio.run(verify())
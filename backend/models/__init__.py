@@ -2,7 +2,7 @@ from models.base import Base
 from models.sys_user import SysUser
 from models.sys_ai_model_config import SysAiModelConfig
 from models.sys_conversation import SysConversation, SysConversationMessage, MessageRoleEnum
-from models.sys_dataset import SysDataset, SysDatasetColumn, SysDatasetAction
+from models.sys_dataset import SysDataset, SysDatasetColumn, SysDatasetChunk, SysDatasetAction
 
 __all__ = [
     'Base',
@@ -13,5 +13,6 @@ __all__ = [
     'MessageRoleEnum',
     'SysDataset',
     'SysDatasetColumn',
+    'SysDatasetChunk',
     'SysDatasetAction',
 ]
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index, Enum as SQLEnum
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import func
 from models.base import Base
 import enum
@@ -20,9 +21,17 @@ class SysConversation(Base):
     title = Column(String(200), comment='会话标题')
     summary = Column(Text, comment='会话摘要')
     message_count = Column(Integer, default=0, nullable=False, comment='消息数量')
+    # 冗余字段: 由save_message/conversation_writer维护,会话列表无需再逐个查询最后一条用户消息
+    last_user_message = Column(Text, comment='最后一条用户消息(截断)')
+    last_message_at = Column(DateTime(timezone=True), comment='最后一条用户消息时间')
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, comment='创建时间')
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False, comment='更新时间')
 
+    __table_args__ = (
+        Index('ix_sys_conversation_user_updated', 'user_id', 'updated_at'),
+    )
+    __mapper_args__ = {'eager_defaults': True}
+
     def __repr__(self):
         return f"<SysConversation(id={self.id}, user_id={self.user_id}, title='{self.title}')>"
 
@@ -35,11 +44,18 @@ class SysConversationMessage(Base):
     conversation_id = Column(Integer, ForeignKey('sys_conversation.id', ondelete='CASCADE'), nullable=False, index=True, comment='会话ID')
     role = Column(SQLEnum(MessageRoleEnum), nullable=False, comment='消息角色')
     content = Column(Text, nullable=False, comment='消息内容')
-    chart_data = Column(Text, comment='图表数据(JSON字符串)')
+    # none_as_null: Python的None写入SQL NULL而不是JSON的null, has_chart 判断依赖这一点
+    chart_data = Column(JSONB(none_as_null=True), comment='图表数据(JSONB)')
     chart_type = Column(String(50), comment='图表类型(bar/line/pie/doughnut)')
     tokens_used = Column(Integer, comment='使用的token数量')
     response_time = Column(Integer, comment='响应时间(毫秒)')
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, comment='创建时间')
 
+    __table_args__ = (
+        Index('ix_sys_conversation_message_conv_role_created', 'conversation_id', 'role', 'created_at'),
+    )
+    # INSERT 时通过 RETURNING 取回 created_at 等服务端默认值,保存后无需 refresh
+    __mapper_args__ = {'eager_defaults': True}
+
     def __repr__(self):
         return f"<SysConversationMessage(id={self.id}, conversation_id={self.conversation_id}, role={self.role})>"
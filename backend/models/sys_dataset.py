@@ -28,6 +28,8 @@ class SysDataset(Base):
     row_count = Column(BigInteger, default=0, comment='行数')
     column_count = Column(Integer, default=0, comment='列数')
     file_size = Column(BigInteger, comment='文件大小(bytes)')
+    # 数据版本: 追加数据后递增, 查询结果缓存、聚合缓存以此为键
+    version = Column(Integer, default=1, server_default='1', nullable=False, comment='数据版本(追加数据后递增)')
 
     # 解析状态
     parse_status = Column(
@@ -99,6 +101,21 @@ class SysDatasetColumn(Base):
         return f"<SysDatasetColumn(dataset_id={self.dataset_id}, col_name='{self.col_name}', type='{self.col_type}')>"
 
 
+class SysDatasetChunk(Base):
+    """数据集原文件分块指纹表(按CSV行的内容定义分块), 用于检测重复上传和只追加了行的文件"""
+    __tablename__ = 'sys_dataset_chunk'
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True, comment='ID')
+    dataset_id = Column(UUID(as_uuid=True), nullable=False, index=True, comment='数据集ID')
+    seq = Column(Integer, nullable=False, comment='分块序号(0-based)')
+    fingerprint = Column(String(32), nullable=False, index=True, comment='分块内容指纹')
+    byte_end = Column(BigInteger, nullable=False, comment='分块结束位置(字节, 不含)')
+    row_end = Column(BigInteger, nullable=False, comment='截至该分块的行数(含表头)')
+
+    def __repr__(self):
+        return f"<SysDatasetChunk(dataset_id={self.dataset_id}, seq={self.seq}, fingerprint='{self.fingerprint}')>"
+
+
 class SysDatasetAction(Base):
     """数据集查询动作记录表"""
     __tablename__ = 'sys_dataset_action'
@@ -0,0 +1,172 @@
+"""
+配置注册表(Config Registry)
+进程内TTL缓存 + Redis pub/sub 失效广播
+
+热路径上的模型配置读取(意图识别LLM配置、Embedding配置、用户选择的对话模型)
+直接命中进程内缓存,不访问Redis/数据库;配置写入时通过Redis频道通知所有worker失效
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_KEY = "default"
+
+
+def config_fingerprint(config: Optional[Dict[str, Any]]) -> str:
+    """
+    计算模型配置指纹(provider + model_name + api_url + api_key)
+
+    用于判断配置是否变化,如重建客户端、切换缓存键
+    """
+    if not config:
+        return "none"
+    identity = {
+        'provider': config.get('provider'),
+        'model_name': config.get('model_name'),
+        'api_url': config.get('api_url'),
+        'api_key': config.get('api_key'),
+    }
+    return hashlib.sha1(json.dumps(identity, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+
+class ConfigRegistry:
+    """进程内配置缓存,支持TTL和跨worker失效"""
+
+    CHANNEL = "config_invalidation"
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._entries: Dict[Tuple[str, str], Tuple[float, Any]] = {}
+        self._locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+        self._listener_task: Optional[asyncio.Task] = None
+        # 每次失效递增,加载期间发生失效时不写入可能过期的结果
+        self._generation = 0
+
+    async def get(
+        self,
+        namespace: str,
+        loader: Callable[[], Awaitable[Any]],
+        key: str = DEFAULT_KEY,
+        cache_none: bool = True
+    ) -> Any:
+        """
+        读取配置,缓存过期或不存在时调用loader加载
+
+        同一配置的并发加载会合并为一次(避免缓存失效瞬间的惊群)
+
+        Args:
+            namespace: 配置命名空间,如 llm_config / embedding_config / user_model
+            loader: 无参异步加载函数
+            key: 命名空间内的键,如用户ID
+            cache_none: loader返回None时是否缓存(加载失败也返回None的场景应设为False)
+        """
+        cache_key = (namespace, key)
+        entry = self._entries.get(cache_key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+
+        lock = self._locks.setdefault(cache_key, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(cache_key)
+            if entry and entry[0] > time.monotonic():
+                return entry[1]
+
+            generation = self._generation
+            value = await loader()
+            if generation == self._generation and (value is not None or cache_none):
+                self._entries[cache_key] = (time.monotonic() + self.ttl, value)
+            return value
+
+    def invalidate_local(self, namespace: Optional[str] = None, key: Optional[str] = None):
+        """
+        清除本进程缓存
+
+        namespace为None时清除全部; key为None时清除整个命名空间
+        """
+        self._generation += 1
+        if namespace is None:
+            self._entries.clear()
+            return
+        for cache_key in list(self._entries):
+            if cache_key[0] == namespace and (key is None or cache_key[1] == key):
+                self._entries.pop(cache_key, None)
+
+    async def invalidate(self, namespace: str, key: Optional[str] = None):
+        """清除本进程缓存并广播给其他worker"""
+        self.invalidate_local(namespace, key)
+        logger.info(f"配置缓存已失效: {namespace}:{key or '*'}")
+
+        try:
+            from api.dependencies.dependencies import redis_client
+            await redis_client.publish(self.CHANNEL, json.dumps({
+                "namespace": namespace,
+                "key": key,
+                "origin": self.worker_id
+            }))
+        except Exception as e:
+            logger.warning(f"广播配置失效消息失败(其他worker将在TTL后刷新): {e}")
+
+    async def _listen(self):
+        """订阅失效频道,断线后重连"""
+        from api.dependencies.dependencies import redis_client
+
+        while True:
+            pubsub = redis_client.pubsub()
+            try:
+                await pubsub.subscribe(self.CHANNEL)
+                # 订阅建立前可能错过了失效消息,清空本地缓存
+                self.invalidate_local()
+                logger.info(f"配置失效监听已启动: worker={self.worker_id}")
+
+                async for message in pubsub.listen():
+                    if message['type'] != 'message':
+                        continue
+                    try:
+                        data = json.loads(message['data'])
+                    except (TypeError, ValueError):
+                        continue
+                    if data.get('origin') == self.worker_id:
+                        continue
+                    self.invalidate_local(data.get('namespace'), data.get('key'))
+                    logger.info(f"收到配置失效通知: {data.get('namespace')}:{data.get('key') or '*'}")
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"配置失效监听中断,5秒后重连: {e}")
+                await asyncio.sleep(5)
+            finally:
+                try:
+                    await pubsub.unsubscribe(self.CHANNEL)
+                    await pubsub.close()
+                except Exception:
+                    pass
+
+    def start_listener(self):
+        """在当前事件循环中启动失效监听(应用启动时调用)"""
+        if self._listener_task is None or self._listener_task.done():
+            self._listener_task = asyncio.create_task(self._listen())
+
+    async def stop_listener(self):
+        """停止失效监听(应用关闭时调用)"""
+        if self._listener_task:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+
+
+# 全局配置注册表实例
+config_registry = ConfigRegistry(ttl=settings.CONFIG_CACHE_TTL)
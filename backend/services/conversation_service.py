@@ -5,9 +5,9 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, update, func
 from models.sys_conversation import SysConversation, SysConversationMessage, MessageRoleEnum
+from services.conversation_writer import conversation_writer, PendingMessage, LAST_USER_MESSAGE_MAX_LENGTH
 from typing import Optional, Dict, Any
 import logging
-import json
 import aiohttp
 
 logger = logging.getLogger(__name__)
@@ -48,7 +48,6 @@ async def get_or_create_conversation(
             )
             session.add(conversation)
             await session.commit()
-            await session.refresh(conversation)
             logger.info(f"创建新对话会话: {conversation.id}")
 
         return conversation
@@ -90,25 +89,30 @@ async def save_message(
             conversation_id=conversation_id,
             role=role,
             content=content,
-            chart_data=json.dumps(chart_data, ensure_ascii=False) if chart_data else None,
+            chart_data=chart_data or None,
             chart_type=chart_type,
             tokens_used=tokens_used,
             response_time=response_time
         )
         session.add(message)
 
-        # 更新会话的消息计数和更新时间
+        # 更新会话的消息计数和更新时间(用户消息同时更新冗余的最后一条用户消息)
+        conversation_values = {
+            'message_count': SysConversation.message_count + 1,
+            'updated_at': func.now()
+        }
+        if role == MessageRoleEnum.USER:
+            conversation_values['last_user_message'] = content[:LAST_USER_MESSAGE_MAX_LENGTH]
+            conversation_values['last_message_at'] = func.now()
+
         await session.execute(
             update(SysConversation)
             .where(SysConversation.id == conversation_id)
-            .values(
-                message_count=SysConversation.message_count + 1,
-                updated_at=func.now()
-            )
+            .values(**conversation_values)
         )
 
+        # created_at 通过 eager_defaults 随 INSERT RETURNING 返回,无需再 refresh
         await session.commit()
-        await session.refresh(message)
 
         logger.info(f"消息已保存: conversation_id={conversation_id}, role={role}, message_id={message.id}")
         return message
@@ -181,6 +185,94 @@ async def save_assistant_message(
     )
 
 
+def queue_message(
+    conversation_id: int,
+    role: MessageRoleEnum,
+    content: str,
+    chart_data: Dict[str, Any] = None,
+    chart_type: str = None,
+    tokens_used: int = None,
+    response_time: int = None
+) -> None:
+    """
+    将消息放入写入队列(不等待数据库提交)
+
+    消息和会话计数器由 conversation_writer 在后台批量写入,适合请求处理的关键路径
+
+    Args:
+        conversation_id: 对话会话ID
+        role: 消息角色(user/assistant)
+        content: 消息内容
+        chart_data: 图表数据(JSON对象)
+        chart_type: 图表类型
+        tokens_used: 使用的token数量
+        response_time: 响应时间(毫秒)
+    """
+    conversation_writer.enqueue(PendingMessage(
+        conversation_id=conversation_id,
+        role=role,
+        content=content,
+        chart_data=chart_data,
+        chart_type=chart_type,
+        tokens_used=tokens_used,
+        response_time=response_time
+    ))
+
+
+async def queue_user_message(
+    session: AsyncSession,
+    user_input: str,
+    user_id: int = 1
+) -> SysConversation:
+    """
+    获取或创建会话,并将用户消息放入写入队列
+
+    Args:
+        session: 数据库会话
+        user_input: 用户输入
+        user_id: 用户ID
+
+    Returns:
+        对话会话(message_count 为入队前的数据库值)
+    """
+    conversation = await get_or_create_conversation(session, user_id)
+    queue_message(conversation.id, MessageRoleEnum.USER, user_input)
+    return conversation
+
+
+def queue_assistant_message(
+    conversation_id: int,
+    content: str,
+    chart_data: Dict[str, Any] = None,
+    chart_type: str = None,
+    response_time: int = None,
+    tokens_used: int = None
+) -> None:
+    """将AI助手回复放入写入队列"""
+    queue_message(
+        conversation_id,
+        MessageRoleEnum.ASSISTANT,
+        content,
+        chart_data=chart_data,
+        chart_type=chart_type,
+        response_time=response_time,
+        tokens_used=tokens_used
+    )
+
+
+def queue_error_message(
+    conversation_id: int,
+    error_message: str,
+    user_input: str = None
+) -> None:
+    """将错误消息放入写入队列"""
+    queue_message(
+        conversation_id,
+        MessageRoleEnum.ASSISTANT,
+        format_error_content(error_message, user_input)
+    )
+
+
 async def get_conversation_history(
     session: AsyncSession,
     conversation_id: int,
@@ -230,18 +322,22 @@ async def save_error_message(
     Returns:
         助手消息对象
     """
-    content = f"抱歉,处理您的请求时出现错误: {error_message}"
-    if user_input:
-        content = f"针对您的问题「{user_input}」,{content}"
-
     return await save_message(
         session,
         conversation_id,
         MessageRoleEnum.ASSISTANT,
-        content
+        format_error_content(error_message, user_input)
     )
 
 
+def format_error_content(error_message: str, user_input: str = None) -> str:
+    """生成错误消息内容"""
+    content = f"抱歉,处理您的请求时出现错误: {error_message}"
+    if user_input:
+        content = f"针对您的问题「{user_input}」,{content}"
+    return content
+
+
 async def generate_conversation_summary(
     session: AsyncSession,
     conversation_id: int,
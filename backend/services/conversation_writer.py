@@ -0,0 +1,219 @@
+"""
+对话消息写缓冲队列(Write-Behind)
+
+请求处理中只把消息放入进程内队列,后台任务每隔 CONVERSATION_FLUSH_INTERVAL_MS 毫秒
+(或积压达到 CONVERSATION_FLUSH_BATCH_SIZE 条时)在一个事务中批量写入:
+    - 批量 INSERT sys_conversation_message
+    - 每个会话一条 UPDATE(消息计数、更新时间、最后一条用户消息)
+
+应用关闭时(main.lifespan)停止后台任务并写入所有剩余消息
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert, update
+from sqlalchemy.exc import DataError, IntegrityError
+
+from core.config import settings
+from db.session import async_session
+from models.sys_conversation import SysConversation, SysConversationMessage, MessageRoleEnum
+
+logger = logging.getLogger(__name__)
+
+# 会话冗余字段 last_user_message 的最大保存长度
+LAST_USER_MESSAGE_MAX_LENGTH = 500
+
+
+@dataclass
+class PendingMessage:
+    """待写入的消息"""
+    conversation_id: int
+    role: MessageRoleEnum
+    content: str
+    chart_data: Optional[Dict[str, Any]] = None
+    chart_type: Optional[str] = None
+    tokens_used: Optional[int] = None
+    response_time: Optional[int] = None
+    # 入队时间作为消息创建时间,保证批量写入后顺序与时间不变
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+    def to_row(self) -> Dict[str, Any]:
+        return {
+            'conversation_id': self.conversation_id,
+            'role': self.role,
+            'content': self.content,
+            # 空图表数据传None, 由列类型 JSONB(none_as_null=True) 写入SQL NULL
+            'chart_data': self.chart_data or None,
+            'chart_type': self.chart_type,
+            'tokens_used': self.tokens_used,
+            'response_time': self.response_time,
+            'created_at': self.created_at,
+        }
+
+
+class ConversationWriteQueue:
+    """对话消息批量写入队列(每个worker进程一个)"""
+
+    def __init__(self, interval_ms: int, batch_size: int, max_pending: int):
+        self.interval = interval_ms / 1000
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self._pending: List[PendingMessage] = []
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {'enqueued': 0, 'written': 0, 'dropped': 0, 'batches': 0, 'failures': 0}
+
+    def enqueue(self, message: PendingMessage):
+        """放入队列,立即返回(不等待数据库)"""
+        self._pending.append(message)
+        self._stats['enqueued'] += 1
+
+        if len(self._pending) > self.max_pending:
+            # 数据库长时间不可用时限制内存占用,丢弃最早的消息
+            overflow = len(self._pending) - self.max_pending
+            del self._pending[:overflow]
+            self._stats['dropped'] += overflow
+            logger.error(f"对话消息写入队列积压超过 {self.max_pending} 条,已丢弃 {overflow} 条最早的消息")
+
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    @staticmethod
+    def _conversation_updates(batch: List[PendingMessage]) -> Dict[int, Dict[str, Any]]:
+        """合并同一会话的计数器更新"""
+        updates: Dict[int, Dict[str, Any]] = {}
+        for message in batch:
+            values = updates.setdefault(message.conversation_id, {'count': 0, 'updated_at': message.created_at})
+            values['count'] += 1
+            values['updated_at'] = max(values['updated_at'], message.created_at)
+            if message.role == MessageRoleEnum.USER:
+                values['last_user_message'] = message.content[:LAST_USER_MESSAGE_MAX_LENGTH]
+                values['last_message_at'] = message.created_at
+        return updates
+
+    async def _write(self, batch: List[PendingMessage]):
+        """在一个事务中写入一批消息"""
+        async with async_session() as session:
+            async with session.begin():
+                await session.execute(
+                    insert(SysConversationMessage),
+                    [message.to_row() for message in batch]
+                )
+                for conversation_id, values in self._conversation_updates(batch).items():
+                    conversation_values = {
+                        'message_count': SysConversation.message_count + values.pop('count'),
+                        **values
+                    }
+                    await session.execute(
+                        update(SysConversation)
+                        .where(SysConversation.id == conversation_id)
+                        .values(**conversation_values)
+                    )
+
+    async def flush(self) -> int:
+        """
+        写入当前队列中的所有消息
+
+        批量写入失败时逐条重试: 数据本身有问题(如会话已删除)的消息被丢弃,
+        数据库不可用时剩余消息放回队列,等待下一次写入
+
+        Returns:
+            成功写入的消息数
+        """
+        async with self._flush_lock:
+            written = 0
+            while self._pending:
+                batch = self._pending[:self.batch_size]
+                del self._pending[:len(batch)]
+                try:
+                    await self._write(batch)
+                    written += len(batch)
+                    self._stats['batches'] += 1
+                    continue
+                except Exception as e:
+                    self._stats['failures'] += 1
+                    logger.warning(f"批量写入对话消息失败,改为逐条写入: {e}")
+
+                for index, message in enumerate(batch):
+                    try:
+                        await self._write([message])
+                        written += 1
+                    except (IntegrityError, DataError) as e:
+                        self._stats['dropped'] += 1
+                        logger.error(f"对话消息无法写入,已丢弃: conversation_id={message.conversation_id}, {e}")
+                    except Exception as e:
+                        # 数据库不可用,剩余消息放回队列头部
+                        self._pending[:0] = batch[index:]
+                        self._stats['written'] += written
+                        logger.error(f"对话消息写入失败,稍后重试({len(self._pending)} 条待写入): {e}")
+                        raise
+            self._stats['written'] += written
+            return written
+
+    async def _run(self):
+        """后台定时写入"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if not self._pending:
+                continue
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # 已记录日志,等待一个周期后重试
+                await asyncio.sleep(self.interval)
+
+    def start(self):
+        """在当前事件循环中启动后台写入(应用启动时调用)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"对话消息写入队列已启动: 间隔 {self.interval * 1000:.0f}ms, 批量 {self.batch_size}")
+
+    async def stop(self, retries: int = 3):
+        """停止后台写入并写入剩余消息(应用关闭时调用)"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        for attempt in range(retries):
+            try:
+                await self.flush()
+                break
+            except Exception:
+                if attempt < retries - 1:
+                    await asyncio.sleep(1)
+        if self._pending:
+            logger.error(f"应用关闭时仍有 {len(self._pending)} 条对话消息未能写入")
+        else:
+            logger.info("对话消息写入队列已停止,所有消息已写入")
+
+    def stats(self) -> Dict[str, Any]:
+        """获取队列统计(当前worker进程)"""
+        return {
+            **self._stats,
+            'pending': len(self._pending),
+            'interval_ms': int(self.interval * 1000),
+            'batch_size': self.batch_size,
+            'running': self._task is not None and not self._task.done()
+        }
+
+
+# 全局写入队列实例
+conversation_writer = ConversationWriteQueue(
+    interval_ms=settings.CONVERSATION_FLUSH_INTERVAL_MS,
+    batch_size=settings.CONVERSATION_FLUSH_BATCH_SIZE,
+    max_pending=settings.CONVERSATION_WRITE_MAX_PENDING
+)
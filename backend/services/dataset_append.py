@@ -0,0 +1,194 @@
+"""
+向已有数据集追加数据
+
+追加的文件(CSV/Excel)解析后写成新的Parquet分片, 与已有的Parquet文件放在同一目录下,
+分片列表保存在 SysDataset.extra_metadata["parquet_fragments"], 查询和预览时一起读取(duckdb_query.dataset_parquet_objects)。
+已有的Parquet文件不重写, 本地Parquet缓存中已有的分片继续有效。
+
+列统计增量合并(incremental_parse.merge_schema_info), 唯一值数、中位数只对追加部分有值的列在全部分片上重新计算;
+合并完成后数据版本(SysDataset.version)加1, 查询结果缓存和聚合缓存随之失效;
+之后只对新增或类型变化的列重新生成向量(embedding_service.refresh_column_vectors)
+"""
+import logging
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List
+
+import pyarrow.parquet as pq
+from sqlalchemy import select
+
+from core.minio_client import async_minio, minio_client, object_name_from_path
+from db.session import async_session
+from models.sys_dataset import SysDataset, SysDatasetColumn
+from services.duckdb_query import column_exact_stats, dataset_parquet_objects
+from services.incremental_parse import AppendMismatchError, merge_schema_info, to_base_schema, upload_parquet_table
+from services.parquet_cache import parquet_cache
+from services.parse_pool import run_in_pool
+
+logger = logging.getLogger(__name__)
+
+# 合并统计时数据集被其他追加任务修改后的最大重试次数
+MAX_MERGE_ATTEMPTS = 3
+
+
+def fragment_object_name(dataset_id) -> str:
+    """追加分片在MinIO中的路径"""
+    return f"parquet/{dataset_id}_part_{uuid.uuid4().hex[:12]}.parquet"
+
+
+def load_append_fragment(
+    file_path: str,
+    filename: str,
+    base_parquet_path: str,
+    fragment_object: str
+) -> Dict[str, Any]:
+    """
+    解析进程池任务: 解析追加的文件, 按数据集的Arrow Schema写入Parquet分片
+
+    Args:
+        file_path: 追加文件路径
+        filename: 追加文件名(用于判断格式)
+        base_parquet_path: 数据集第一个Parquet文件的本地路径(读取Schema)
+        fragment_object: 分片对象名
+
+    Returns:
+        rows, fragment_path, appended_schema(追加部分的schema_info)
+    """
+    from services.dataset_parser import clean_column_name, infer_schema, read_dataframe
+
+    file_data = minio_client.download_file(object_name_from_path(file_path, "uploads"))
+    df = read_dataframe(file_data, filename)
+    del file_data
+    df.columns = [clean_column_name(col) for col in df.columns]
+
+    table = to_base_schema(df, pq.read_schema(base_parquet_path))
+    appended_schema = infer_schema(df)
+    del df
+
+    return {
+        'rows': table.num_rows,
+        'fragment_path': upload_parquet_table(table, fragment_object),
+        'appended_schema': appended_schema
+    }
+
+
+async def _load_columns(session, dataset_id) -> List[SysDatasetColumn]:
+    result = await session.execute(
+        select(SysDatasetColumn)
+        .where(SysDatasetColumn.dataset_id == dataset_id)
+        .order_by(SysDatasetColumn.col_index)
+    )
+    return list(result.scalars().all())
+
+
+def _column_info(columns: List[SysDatasetColumn]) -> List[Dict[str, Any]]:
+    return [
+        {'name': col.col_name, 'type': col.col_type, 'stats': col.stats, 'samples': col.sample_values}
+        for col in columns
+    ]
+
+
+async def append_to_dataset(dataset_id: str, file_path: str, filename: str) -> Dict[str, Any]:
+    """
+    追加数据到数据集
+
+    Args:
+        dataset_id: 数据集ID
+        file_path: 已上传的追加文件路径
+        filename: 追加文件名
+
+    Returns:
+        {"version", "appended_rows", "row_count", "schema_info", "fragment_path"}
+
+    Raises:
+        AppendMismatchError: 追加文件的列与数据集不一致或类型不兼容
+        ValueError: 数据集不存在或未解析完成
+    """
+    async with async_session() as session:
+        dataset = await session.get(SysDataset, uuid.UUID(str(dataset_id)))
+        if dataset is None or dataset.parse_status != 'parsed' or not dataset.parsed_path:
+            raise ValueError(f"数据集 {dataset_id} 不存在或未解析完成")
+        base_object = object_name_from_path(dataset.parsed_path, "parquet")
+
+    # 1. 解析追加的文件并写入分片(不修改数据集, 失败时数据集保持不变)
+    fragment_object = fragment_object_name(dataset_id)
+    loaded = await run_in_pool(
+        load_append_fragment,
+        file_path,
+        filename,
+        await parquet_cache.get_path(base_object),
+        fragment_object
+    )
+    if loaded['rows'] == 0:
+        await async_minio.delete_file(fragment_object)
+        raise AppendMismatchError("追加的文件没有数据行")
+
+    appended_schema = loaded['appended_schema']
+    changed = [col['name'] for col in appended_schema if col['stats']['null_count'] < col['stats']['total_count']]
+    numeric = [col['name'] for col in appended_schema if col['type'] in ('int', 'float')]
+    fragment = {
+        'path': loaded['fragment_path'],
+        'rows': loaded['rows'],
+        'source': file_path,
+        'appended_at': datetime.now().isoformat()
+    }
+
+    # 2. 合并列统计并登记分片; 期间有其他追加任务完成时(版本变化)重新计算
+    for _ in range(MAX_MERGE_ATTEMPTS):
+        async with async_session() as session:
+            dataset = await session.get(SysDataset, uuid.UUID(str(dataset_id)))
+            if dataset is None:
+                await async_minio.delete_file(fragment_object)
+                raise ValueError(f"数据集 {dataset_id} 已删除")
+            version = dataset.version or 1
+            objects = dataset_parquet_objects(dataset) + [object_name_from_path(fragment['path'], "parquet")]
+            base_columns = _column_info(await _load_columns(session, dataset_id))
+            await session.commit()
+
+            # 唯一值数、中位数只在追加部分有值的列上重新计算(只读取这些列)
+            exact_stats = await column_exact_stats(objects, changed, numeric)
+            try:
+                schema_info = merge_schema_info(base_columns, appended_schema, exact_stats)
+            except KeyError as e:
+                await async_minio.delete_file(fragment_object)
+                raise AppendMismatchError(f"列不存在: {e}")
+
+            # 锁定数据集行, 确认期间没有其他追加任务提交
+            dataset = (await session.execute(
+                select(SysDataset)
+                .where(SysDataset.id == uuid.UUID(str(dataset_id)))
+                .with_for_update()
+                .execution_options(populate_existing=True)
+            )).scalar_one()
+            if (dataset.version or 1) != version:
+                await session.rollback()
+                logger.info(f"数据集 {dataset_id} 在合并统计期间被修改, 重新计算")
+                continue
+
+            for col, col_info in zip(await _load_columns(session, dataset_id), schema_info):
+                col.col_type = col_info['type']
+                col.stats = col_info['stats']
+                col.sample_values = col_info['samples']
+
+            metadata = dict(dataset.extra_metadata or {})
+            metadata['parquet_fragments'] = (metadata.get('parquet_fragments') or []) + [{**fragment, 'version': version + 1}]
+            # JSONB整体赋值, 保证变更被SQLAlchemy检测到
+            dataset.extra_metadata = metadata
+            dataset.row_count = (dataset.row_count or 0) + loaded['rows']
+            dataset.version = version + 1
+            await session.commit()
+
+            logger.info(
+                f"数据集 {dataset_id} 追加 {loaded['rows']} 行, 版本 {version} -> {version + 1}, "
+                f"重新计算唯一值的列: {changed}"
+            )
+            return {
+                'version': version + 1,
+                'appended_rows': loaded['rows'],
+                'row_count': dataset.row_count,
+                'schema_info': schema_info,
+                'fragment_path': fragment['path']
+            }
+
+    await async_minio.delete_file(fragment_object)
+    raise RuntimeError(f"数据集 {dataset_id} 并发追加冲突, 请稍后重试")
@@ -0,0 +1,300 @@
+"""
+数据集后台任务
+
+由任务队列(services/job_queue.py)的worker执行, 数据集处理拆分为可独立重试的任务:
+    parse -> chunk -> vectorize
+    embedding (单独重试列embedding)
+    append (向已解析的数据集追加数据, 之后只刷新新增或类型变化的列向量)
+    rollup (按查询记录规划并物化聚合结果, 追加数据后按新版本重建)
+
+每个任务在成功后提交下一步任务; 失败时更新数据集的对应状态字段并抛出异常,由任务队列按退避策略重试
+"""
+import logging
+from typing import Any, Dict, List
+
+from sqlalchemy import select
+
+from core.config import settings
+from db.session import async_session
+from models.sys_dataset import SysDataset, SysDatasetColumn
+from services.job_queue import PRIORITY_LOW, PRIORITY_NORMAL, job_queue
+
+logger = logging.getLogger(__name__)
+
+# 任务类型
+JOB_PARSE = "parse"
+JOB_CHUNK = "chunk"
+JOB_VECTORIZE = "vectorize"
+JOB_EMBEDDING = "embedding"
+JOB_APPEND = "append"
+JOB_ROLLUP = "rollup"
+
+
+async def enqueue_dataset_job(job_type: str, dataset_id: str, priority: int = PRIORITY_NORMAL, **payload) -> str:
+    """提交数据集相关任务"""
+    return await job_queue.enqueue(
+        job_type,
+        {"dataset_id": str(dataset_id), "priority": priority, **payload},
+        priority=priority,
+        dataset_id=str(dataset_id)
+    )
+
+
+async def _load_schema_info(session, dataset_id: str) -> List[Dict[str, Any]]:
+    """从列信息构造schema_info"""
+    result = await session.execute(
+        select(SysDatasetColumn)
+        .where(SysDatasetColumn.dataset_id == dataset_id)
+        .order_by(SysDatasetColumn.col_index)
+    )
+    return [
+        {
+            'name': col.col_name,
+            'type': col.col_type,
+            'stats': col.stats or {},
+            'samples': col.sample_values or []
+        }
+        for col in result.scalars().all()
+    ]
+
+
+async def _get_dataset(session, dataset_id: str):
+    result = await session.execute(select(SysDataset).where(SysDataset.id == dataset_id))
+    return result.scalar_one_or_none()
+
+
+async def parse_job(payload: Dict[str, Any]):
+    """解析文件, 成功后提交分片任务"""
+    from services.dataset_parser import parse_dataset_task
+
+    dataset_id = payload["dataset_id"]
+    async with async_session() as session:
+        dataset = await _get_dataset(session, dataset_id)
+        if dataset is None:
+            logger.warning(f"数据集 {dataset_id} 已删除,跳过解析任务")
+            return
+        # 上一次执行已解析成功(如提交后续任务时失败),不重复解析
+        already_parsed = dataset.parse_status == 'parsed'
+
+    if not already_parsed:
+        await parse_dataset_task(
+            dataset_id,
+            payload["file_path"],
+            payload["filename"],
+            run_chunking=False,
+            raise_on_error=True,
+            append_base=payload.get("append_base")
+        )
+
+    await enqueue_dataset_job(JOB_CHUNK, dataset_id, payload.get("priority", PRIORITY_NORMAL))
+
+
+async def chunk_job(payload: Dict[str, Any]):
+    """为每一列构造描述文本, 成功后提交向量化任务"""
+    from services.embedding_service import build_column_description
+
+    dataset_id = payload["dataset_id"]
+    async with async_session() as session:
+        ds = await _get_dataset(session, dataset_id)
+        if ds is None:
+            logger.warning(f"数据集 {dataset_id} 已删除,跳过分片任务")
+            return
+
+        schema_info = await _load_schema_info(session, dataset_id)
+        if not schema_info:
+            logger.error(f"数据集 {dataset_id} 没有列信息")
+            ds.chunk_status = 'failed'
+            ds.chunk_error = "数据集没有列信息"
+            await session.commit()
+            return
+
+        try:
+            ds.chunk_status = 'chunking'
+            ds.chunk_progress = 0
+            await session.commit()
+
+            for idx, col_info in enumerate(schema_info):
+                build_column_description(col_info)
+                ds.chunk_progress = int((idx + 1) / len(schema_info) * 100)
+                await session.commit()
+
+            ds.chunk_status = 'completed'
+            ds.chunk_progress = 100
+            ds.chunk_error = None
+            ds.vectorize_status = 'pending'
+            ds.vectorize_progress = 0
+            await session.commit()
+            logger.info(f"数据集 {dataset_id} 分片完成，共 {len(schema_info)} 个列")
+
+        except Exception as e:
+            logger.error(f"数据集 {dataset_id} 分片失败: {e}")
+            ds.chunk_status = 'failed'
+            ds.chunk_error = str(e)
+            await session.commit()
+            raise
+
+    await enqueue_dataset_job(JOB_VECTORIZE, dataset_id, payload.get("priority", PRIORITY_NORMAL))
+
+
+async def vectorize_job(payload: Dict[str, Any]):
+    """根据列描述生成向量并写入向量库"""
+    from services.embedding_service import build_column_description, vectorize_columns
+
+    dataset_id = payload["dataset_id"]
+    async with async_session() as session:
+        ds = await _get_dataset(session, dataset_id)
+        if ds is None:
+            logger.warning(f"数据集 {dataset_id} 已删除,跳过向量化任务")
+            return
+
+        schema_info = await _load_schema_info(session, dataset_id)
+        if not schema_info:
+            logger.error(f"数据集 {dataset_id} 没有列信息")
+            ds.vectorize_status = 'failed'
+            ds.vectorize_error = "数据集没有列信息"
+            await session.commit()
+            return
+
+        chunked_data = [
+            {
+                'index': idx,
+                'col_info': col_info,
+                'description': build_column_description(col_info)
+            }
+            for idx, col_info in enumerate(schema_info)
+        ]
+
+        try:
+            ds.vectorize_status = 'vectorizing'
+            ds.vectorize_progress = 0
+            await session.commit()
+
+            # 追加上传的数据集复用基础数据集中描述未变化的列向量
+            append_base = (ds.extra_metadata or {}).get("append_base") or {}
+            await vectorize_columns(str(dataset_id), chunked_data, reuse_from=append_base.get("dataset_id"))
+
+            ds.vectorize_status = 'completed'
+            ds.vectorize_progress = 100
+            ds.vectorize_error = None
+            await session.commit()
+            logger.info(f"数据集 {dataset_id} 向量化完成")
+
+        except Exception as e:
+            logger.error(f"数据集 {dataset_id} 向量化失败: {e}")
+            ds.vectorize_status = 'failed'
+            ds.vectorize_error = str(e)
+            await session.commit()
+            raise
+
+
+async def embedding_job(payload: Dict[str, Any]):
+    """重新生成列embedding"""
+    from services.embedding_service import generate_column_embeddings
+
+    dataset_id = payload["dataset_id"]
+    async with async_session() as session:
+        ds = await _get_dataset(session, dataset_id)
+        if ds is None:
+            logger.warning(f"数据集 {dataset_id} 已删除,跳过embedding任务")
+            return
+
+        schema_info = await _load_schema_info(session, dataset_id)
+        if not schema_info:
+            logger.error(f"数据集 {dataset_id} 没有列信息")
+            ds.embedding_status = 'failed'
+            ds.embedding_error = "数据集没有列信息"
+            await session.commit()
+            return
+
+        try:
+            ds.embedding_status = 'embedding'
+            ds.embedding_progress = 0
+            await session.commit()
+
+            await generate_column_embeddings(str(dataset_id), schema_info)
+
+            ds.embedding_status = 'completed'
+            ds.embedding_progress = 100
+            ds.embedding_error = None
+            await session.commit()
+            logger.info(f"数据集 {dataset_id} embedding生成成功")
+
+        except Exception as e:
+            logger.error(f"数据集 {dataset_id} embedding生成失败: {e}")
+            ds.embedding_status = 'failed'
+            ds.embedding_error = str(e)
+            await session.commit()
+            raise
+
+
+async def append_job(payload: Dict[str, Any]):
+    """追加数据到数据集, 完成后刷新列向量"""
+    from services.dataset_append import append_to_dataset
+    from services.embedding_service import build_column_description, refresh_column_vectors
+
+    dataset_id = payload["dataset_id"]
+    async with async_session() as session:
+        ds = await _get_dataset(session, dataset_id)
+        if ds is None:
+            logger.warning(f"数据集 {dataset_id} 已删除,跳过追加任务")
+            return
+        # 上一次执行已追加成功(刷新向量时失败), 不重复追加
+        fragments = (ds.extra_metadata or {}).get("parquet_fragments") or []
+        already_appended = any(fragment.get("source") == payload["file_path"] for fragment in fragments)
+
+    if not already_appended:
+        await append_to_dataset(dataset_id, payload["file_path"], payload["filename"])
+        # 数据版本变化后旧的物化结果失效, 按新版本重建
+        if settings.ROLLUP_ENABLED:
+            await enqueue_dataset_job(JOB_ROLLUP, dataset_id, PRIORITY_LOW)
+
+    async with async_session() as session:
+        ds = await _get_dataset(session, dataset_id)
+        if ds is None:
+            return
+        schema_info = await _load_schema_info(session, dataset_id)
+        chunked_data = [
+            {
+                'index': idx,
+                'col_info': col_info,
+                'description': build_column_description(col_info)
+            }
+            for idx, col_info in enumerate(schema_info)
+        ]
+
+        try:
+            ds.vectorize_status = 'vectorizing'
+            ds.vectorize_progress = 0
+            await session.commit()
+
+            await refresh_column_vectors(str(dataset_id), chunked_data)
+
+            ds.vectorize_status = 'completed'
+            ds.vectorize_progress = 100
+            ds.vectorize_error = None
+            await session.commit()
+
+        except Exception as e:
+            logger.error(f"数据集 {dataset_id} 追加后刷新向量失败: {e}")
+            ds.vectorize_status = 'failed'
+            ds.vectorize_error = str(e)
+            await session.commit()
+            raise
+
+
+async def rollup_job(payload: Dict[str, Any]):
+    """规划并物化数据集的聚合结果"""
+    from services.rollup_cache import refresh_rollups
+
+    await refresh_rollups(payload["dataset_id"])
+
+
+# 任务类型 -> 处理函数
+JOB_HANDLERS = {
+    JOB_PARSE: parse_job,
+    JOB_CHUNK: chunk_job,
+    JOB_VECTORIZE: vectorize_job,
+    JOB_EMBEDDING: embedding_job,
+    JOB_APPEND: append_job,
+    JOB_ROLLUP: rollup_job,
+}
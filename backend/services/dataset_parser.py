@@ -8,17 +8,32 @@ import pyarrow.parquet as pq
 from sqlalchemy import select
 from models.sys_dataset import SysDataset, SysDatasetColumn
 from db.session import async_session
-from core.minio_client import minio_client
+from core.minio_client import minio_client, object_name_from_path
+from core.config import settings
+from services.incremental_parse import parse_appended
+from services.parse_pool import run_in_pool
+from services.text_format import SNIFF_BYTES, csv_read_options, ensure_text_format, sniff_text_format
+import asyncio
 import io
 import logging
-from typing import List, Dict, Any
+import os
+import shutil
+import tempfile
+from typing import List, Dict, Any, Optional
 from datetime import datetime
 import numpy as np
 
 logger = logging.getLogger(__name__)
 
 
-async def parse_dataset_task(dataset_id: str, file_path: str, filename: str):
+async def parse_dataset_task(
+    dataset_id: str,
+    file_path: str,
+    filename: str,
+    run_chunking: bool = True,
+    raise_on_error: bool = False,
+    append_base: Optional[Dict[str, Any]] = None
+):
     """
     后台任务: 解析上传的CSV/Excel文件
 
@@ -26,6 +41,9 @@ async def parse_dataset_task(dataset_id: str, file_path: str, filename: str):
         dataset_id: 数据集ID
         file_path: MinIO文件路径
         filename: 原始文件名
+        run_chunking: 解析完成后是否直接执行分片和向量化(任务队列中由后续任务执行)
+        raise_on_error: 解析失败时记录状态后是否抛出异常(供任务队列重试)
+        append_base: 文件是已有数据集追加行的结果时(services.dedup_index), 只解析追加的行
 
     流程:
         1. 从MinIO下载文件
@@ -48,183 +66,61 @@ async def parse_dataset_task(dataset_id: str, file_path: str, filename: str):
 
             logger.info(f"开始解析数据集: {dataset_id}")
 
-            # 2. 从MinIO下载文件
-            object_name = file_path.split('/')[-1]
-            file_data = minio_client.download_file(f"uploads/{object_name}")
-            logger.info(f"文件已下载: {len(file_data)} bytes")
-
-            dataset.parse_progress = 20
-            await session.commit()
+            # CSV编码和分隔符(上传后首次使用时识别, 预览和重新解析复用)
+            text_format = None
+            if filename.endswith('.csv'):
+                text_format = await ensure_text_format(
+                    session, dataset, object_name_from_path(file_path, "uploads")
+                )
 
-            # 3. 根据格式解析文件
-            try:
-                if filename.endswith('.csv'):
-                    df = pd.read_csv(
-                        io.BytesIO(file_data),
-                        encoding='utf-8',
-                        low_memory=False
+            # 2-7. 下载、解析文件、推断Schema、写入Parquet(在解析进程池中执行)
+            parquet_object = f"parquet/{dataset_id}.parquet"
+            appended = None
+            if append_base:
+                appended = await parse_appended(session, file_path, append_base, parquet_object, text_format)
+
+            if appended is not None:
+                row_count = appended['row_count']
+                column_count = appended['column_count']
+                schema_info = appended['schema_info']
+                parquet_path = appended['parquet_path']
+            else:
+                work_dir = tempfile.mkdtemp(prefix=f"parse_{dataset_id}_", dir=settings.PARSE_TMP_DIR or None)
+                try:
+                    loaded = await run_in_pool(
+                        load_dataset_file,
+                        file_path,
+                        filename,
+                        parquet_object,
+                        work_dir,
+                        settings.PARSE_COLUMN_BATCH_SIZE,
+                        text_format
                     )
-                elif filename.endswith(('.xlsx', '.xls', '.et')):
-                    # Excel/WPS文件,尝试多种引擎
-                    df = None
-                    errors = []
-
-                    # 尝试顺序: openpyxl -> xlrd (for .et files, try both)
-                    engines_to_try = []
-                    if filename.endswith('.xlsx'):
-                        engines_to_try = ['openpyxl']
-                    elif filename.endswith('.xls'):
-                        engines_to_try = ['xlrd']
-                    elif filename.endswith('.et'):
-                        # .et文件尝试所有可用引擎
-                        engines_to_try = ['openpyxl', 'xlrd']
-
-                    for engine in engines_to_try:
-                        try:
-                            # 尝试直接读取
-                            df = pd.read_excel(
-                                io.BytesIO(file_data),
-                                engine=engine
-                            )
-                            logger.info(f"使用{engine}引擎解析成功")
-                            break
-                        except Exception as e:
-                            error_msg = str(e)
-                            errors.append(f"{engine}: {error_msg}")
-                            logger.warning(f"{engine}解析失败: {e}")
-
-                            # 如果是 DataValidation 错误，尝试多种降级策略
-                            if "DataValidation" in error_msg and engine == "openpyxl":
-                                # 策略1: 使用 openpyxl 底层 API 跳过验证
-                                try:
-                                    import openpyxl
-                                    from openpyxl.worksheet.datavalidation import DataValidation as DV
-
-                                    # 临时禁用 DataValidation 的参数检查
-                                    original_init = DV.__init__
-                                    def patched_init(self, *args, **kwargs):
-                                        # 移除不兼容的参数
-                                        kwargs.pop('id', None)
-                                        original_init(self, *args, **kwargs)
-
-                                    DV.__init__ = patched_init
-
-                                    try:
-                                        wb = openpyxl.load_workbook(io.BytesIO(file_data), data_only=True)
-                                        ws = wb.active
-                                        data = list(ws.values)
-
-                                        if data and len(data) > 0:
-                                            # 获取列名（第一行）
-                                            cols = data[0]
-
-                                            # 确保列名是字符串列表
-                                            cols = [str(col) if col is not None else f'Column_{i}' for i, col in enumerate(cols)]
-
-                                            # 获取数据行（从第二行开始）
-                                            rows = data[1:]
-
-                                            # 确保每行数据长度与列数一致
-                                            clean_rows = []
-                                            for row in rows:
-                                                # 转换为列表，确保长度与列数一致
-                                                row_list = list(row) if row else []
-                                                # 填充或截断到正确的列数
-                                                if len(row_list) < len(cols):
-                                                    row_list.extend([None] * (len(cols) - len(row_list)))
-                                                elif len(row_list) > len(cols):
-                                                    row_list = row_list[:len(cols)]
-                                                clean_rows.append(row_list)
-
-                                            # 创建 DataFrame
-                                            df = pd.DataFrame(clean_rows, columns=cols)
-
-                                        wb.close()
-                                        logger.info(f"使用{engine}引擎(补丁模式)解析成功")
-                                        break
-                                    finally:
-                                        # 恢复原始方法
-                                        DV.__init__ = original_init
-
-                                except Exception as e2:
-                                    errors.append(f"{engine}(补丁模式): {str(e2)}")
-                                    logger.warning(f"{engine}补丁模式失败: {e2}")
-
-                                # 策略2: 尝试使用 pyxlsb (如果是 xlsb 格式)
-                                try:
-                                    import pyxlsb
-                                    from pyxlsb import open_workbook
-                                    with open_workbook(io.BytesIO(file_data)) as wb:
-                                        with wb.get_sheet(1) as sheet:
-                                            data = [[item.v if item else None for item in row] for row in sheet.rows()]
-                                            if data:
-                                                cols = data[0]
-                                                df = pd.DataFrame(data[1:], columns=cols)
-                                    logger.info(f"使用 pyxlsb 引擎解析成功")
-                                    break
-                                except (ImportError, Exception) as e3:
-                                    errors.append(f"pyxlsb: {str(e3)}")
-                                    logger.warning(f"pyxlsb 解析失败: {e3}")
-
-                            continue
-
-                    if df is None:
-                        # 如果所有引擎都失败
-                        if filename.endswith('.et'):
-                            raise ValueError(
-                                f".et文件解析失败。WPS .et格式与Excel不完全兼容，所有解析引擎均失败。"
-                                f"请将文件另存为 .xlsx 或 .csv 格式后重新上传。"
-                            )
-                        else:
-                            raise ValueError(f"Excel文件解析失败: {'; '.join(errors)}")
-                else:
-                    raise ValueError(f"不支持的文件格式: {filename}")
-
-                logger.info(f"文件解析成功: {len(df)} 行, {len(df.columns)} 列")
-            except Exception as e:
-                raise ValueError(f"文件解析失败: {str(e)}")
+                    row_count = loaded['row_count']
+                    column_count = loaded['column_count']
 
-            dataset.parse_progress = 40
-            await session.commit()
-
-            # 4. 清理列名(移除特殊字符)
-            df.columns = [clean_column_name(col) for col in df.columns]
+                    if loaded['batches'] is None:
+                        # 窄表: 子进程中已完成全部步骤
+                        schema_info = loaded['schema_info']
+                        parquet_path = loaded['parquet_path']
+                    else:
+                        # 宽表: 按列分批并行推断Schema并清理数据类型
+                        dataset.parse_progress = 40
+                        await session.commit()
 
-            # 5. 推断Schema并生成统计信息
-            schema_info = infer_schema(df)
-            logger.info(f"Schema推断完成: {len(schema_info)} 列")
+                        batch_schemas = await asyncio.gather(
+                            *(run_in_pool(prepare_column_batch, batch) for batch in loaded['batches'])
+                        )
+                        schema_info = [col_info for batch in batch_schemas for col_info in batch]
 
-            dataset.parse_progress = 60
-            await session.commit()
+                        dataset.parse_progress = 60
+                        await session.commit()
 
-            # 6. 清理数据类型,确保PyArrow能够正确转换
-            df = clean_dataframe_for_parquet(df)
-            logger.info("数据类型清理完成")
+                        parquet_path = await run_in_pool(write_parquet_batches, loaded['batches'], parquet_object)
+                finally:
+                    shutil.rmtree(work_dir, ignore_errors=True)
 
-            # 7. 转换为Parquet并上传MinIO
-            parquet_filename = f"{dataset_id}.parquet"
-            parquet_buffer = io.BytesIO()
-
-            # 使用pyarrow写入Parquet
-            try:
-                table = pa.Table.from_pandas(df)
-                pq.write_table(
-                    table,
-                    parquet_buffer,
-                    compression='snappy',
-                    use_dictionary=True
-                )
-            except Exception as e:
-                logger.error(f"PyArrow转换失败: {e}")
-                raise ValueError(f"数据格式转换失败，请检查文件中是否有混合类型的列: {str(e)}")
-
-            parquet_data = parquet_buffer.getvalue()
-            parquet_path = minio_client.upload_file(
-                parquet_data,
-                f"parquet/{parquet_filename}",
-                content_type="application/x-parquet"
-            )
-            logger.info(f"Parquet文件已上传: {parquet_path}")
+            logger.info(f"Schema推断完成: {len(schema_info)} 列, Parquet文件已上传: {parquet_path}")
 
             dataset.parse_progress = 80
             await session.commit()
@@ -243,14 +139,17 @@ async def parse_dataset_task(dataset_id: str, file_path: str, filename: str):
 
             # 9. 更新数据集状态
             dataset.parsed_path = parquet_path
-            dataset.row_count = len(df)
-            dataset.column_count = len(df.columns)
+            dataset.row_count = row_count
+            dataset.column_count = column_count
             dataset.parse_status = 'parsed'
             dataset.parse_progress = 100
             await session.commit()
 
             logger.info(f"数据集 {dataset_id} 解析成功")
 
+            if not run_chunking:
+                return
+
             # 10. 数据分片准备(构造列描述)
             try:
                 dataset.chunk_status = 'chunking'
@@ -313,6 +212,234 @@ async def parse_dataset_task(dataset_id: str, file_path: str, filename: str):
                 await session.commit()
             except:
                 pass
+            if raise_on_error:
+                raise
+
+
+def read_dataframe(file_data: bytes, filename: str, text_format: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    """
+    根据文件格式解析为DataFrame(CSV/Excel/WPS)
+
+    Args:
+        file_data: 文件内容
+        filename: 原始文件名(用于判断格式)
+        text_format: CSV的编码和分隔符(services.text_format), 未提供时从文件开头识别
+
+    Returns:
+        pandas DataFrame
+    """
+    try:
+        if filename.endswith('.csv'):
+            if text_format is None:
+                text_format = sniff_text_format(file_data[:SNIFF_BYTES])
+            df = pd.read_csv(
+                io.BytesIO(file_data),
+                low_memory=False,
+                **csv_read_options(text_format)
+            )
+        elif filename.endswith(('.xlsx', '.xls', '.et')):
+            # Excel/WPS文件,尝试多种引擎
+            df = None
+            errors = []
+
+            # 尝试顺序: openpyxl -> xlrd (for .et files, try both)
+            engines_to_try = []
+            if filename.endswith('.xlsx'):
+                engines_to_try = ['openpyxl']
+            elif filename.endswith('.xls'):
+                engines_to_try = ['xlrd']
+            elif filename.endswith('.et'):
+                # .et文件尝试所有可用引擎
+                engines_to_try = ['openpyxl', 'xlrd']
+
+            for engine in engines_to_try:
+                try:
+                    # 尝试直接读取
+                    df = pd.read_excel(
+                        io.BytesIO(file_data),
+                        engine=engine
+                    )
+                    logger.info(f"使用{engine}引擎解析成功")
+                    break
+                except Exception as e:
+                    error_msg = str(e)
+                    errors.append(f"{engine}: {error_msg}")
+                    logger.warning(f"{engine}解析失败: {e}")
+
+                    # 如果是 DataValidation 错误，尝试多种降级策略
+                    if "DataValidation" in error_msg and engine == "openpyxl":
+                        # 策略1: 使用 openpyxl 底层 API 跳过验证
+                        try:
+                            import openpyxl
+                            from openpyxl.worksheet.datavalidation import DataValidation as DV
+
+                            # 临时禁用 DataValidation 的参数检查
+                            original_init = DV.__init__
+                            def patched_init(self, *args, **kwargs):
+                                # 移除不兼容的参数
+                                kwargs.pop('id', None)
+                                original_init(self, *args, **kwargs)
+
+                            DV.__init__ = patched_init
+
+                            try:
+                                wb = openpyxl.load_workbook(io.BytesIO(file_data), data_only=True)
+                                ws = wb.active
+                                data = list(ws.values)
+
+                                if data and len(data) > 0:
+                                    # 获取列名（第一行）
+                                    cols = data[0]
+
+                                    # 确保列名是字符串列表
+                                    cols = [str(col) if col is not None else f'Column_{i}' for i, col in enumerate(cols)]
+
+                                    # 获取数据行（从第二行开始）
+                                    rows = data[1:]
+
+                                    # 确保每行数据长度与列数一致
+                                    clean_rows = []
+                                    for row in rows:
+                                        # 转换为列表，确保长度与列数一致
+                                        row_list = list(row) if row else []
+                                        # 填充或截断到正确的列数
+                                        if len(row_list) < len(cols):
+                                            row_list.extend([None] * (len(cols) - len(row_list)))
+                                        elif len(row_list) > len(cols):
+                                            row_list = row_list[:len(cols)]
+                                        clean_rows.append(row_list)
+
+                                    # 创建 DataFrame
+                                    df = pd.DataFrame(clean_rows, columns=cols)
+
+                                wb.close()
+                                logger.info(f"使用{engine}引擎(补丁模式)解析成功")
+                                break
+                            finally:
+                                # 恢复原始方法
+                                DV.__init__ = original_init
+
+                        except Exception as e2:
+                            errors.append(f"{engine}(补丁模式): {str(e2)}")
+                            logger.warning(f"{engine}补丁模式失败: {e2}")
+
+                        # 策略2: 尝试使用 pyxlsb (如果是 xlsb 格式)
+                        try:
+                            import pyxlsb
+                            from pyxlsb import open_workbook
+                            with open_workbook(io.BytesIO(file_data)) as wb:
+                                with wb.get_sheet(1) as sheet:
+                                    data = [[item.v if item else None for item in row] for row in sheet.rows()]
+                                    if data:
+                                        cols = data[0]
+                                        df = pd.DataFrame(data[1:], columns=cols)
+                            logger.info(f"使用 pyxlsb 引擎解析成功")
+                            break
+                        except (ImportError, Exception) as e3:
+                            errors.append(f"pyxlsb: {str(e3)}")
+                            logger.warning(f"pyxlsb 解析失败: {e3}")
+
+                    continue
+
+            if df is None:
+                # 如果所有引擎都失败
+                if filename.endswith('.et'):
+                    raise ValueError(
+                        f".et文件解析失败。WPS .et格式与Excel不完全兼容，所有解析引擎均失败。"
+                        f"请将文件另存为 .xlsx 或 .csv 格式后重新上传。"
+                    )
+                else:
+                    raise ValueError(f"Excel文件解析失败: {'; '.join(errors)}")
+        else:
+            raise ValueError(f"不支持的文件格式: {filename}")
+
+        logger.info(f"文件解析成功: {len(df)} 行, {len(df.columns)} 列")
+    except MemoryError:
+        raise
+    except Exception as e:
+        raise ValueError(f"文件解析失败: {str(e)}")
+    return df
+
+
+def write_parquet(df: pd.DataFrame, object_name: str) -> str:
+    """转换为Parquet并上传MinIO, 返回文件路径"""
+    parquet_buffer = io.BytesIO()
+
+    # 使用pyarrow写入Parquet
+    try:
+        table = pa.Table.from_pandas(df)
+        pq.write_table(
+            table,
+            parquet_buffer,
+            compression='snappy',
+            use_dictionary=True
+        )
+    except Exception as e:
+        logger.error(f"PyArrow转换失败: {e}")
+        raise ValueError(f"数据格式转换失败，请检查文件中是否有混合类型的列: {str(e)}")
+
+    return minio_client.upload_file(
+        parquet_buffer.getvalue(),
+        object_name,
+        content_type="application/x-parquet"
+    )
+
+
+def load_dataset_file(
+    file_path: str,
+    filename: str,
+    parquet_object: str,
+    work_dir: str,
+    batch_size: int,
+    text_format: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    解析进程池任务: 下载并解析文件
+
+    列数不超过 batch_size 时在当前子进程中完成Schema推断和Parquet写入;
+    否则按列切分为多个批次保存到 work_dir, 由 prepare_column_batch 在多个子进程中并行处理
+
+    Returns:
+        row_count, column_count, 以及 schema_info + parquet_path(窄表) 或 batches(宽表批次文件列表)
+    """
+    object_name = file_path.split('/')[-1]
+    file_data = minio_client.download_file(f"uploads/{object_name}")
+    logger.info(f"文件已下载: {len(file_data)} bytes")
+
+    df = read_dataframe(file_data, filename, text_format)
+    del file_data
+
+    # 清理列名(移除特殊字符)
+    df.columns = [clean_column_name(col) for col in df.columns]
+    result = {'row_count': len(df), 'column_count': len(df.columns), 'batches': None}
+
+    if len(df.columns) <= batch_size:
+        result['schema_info'] = infer_schema(df)
+        # 清理数据类型,确保PyArrow能够正确转换
+        result['parquet_path'] = write_parquet(clean_dataframe_for_parquet(df), parquet_object)
+        return result
+
+    batches = []
+    for start in range(0, len(df.columns), batch_size):
+        batch_path = os.path.join(work_dir, f"columns_{start // batch_size:04d}.pkl")
+        df.iloc[:, start:start + batch_size].to_pickle(batch_path)
+        batches.append(batch_path)
+    result['batches'] = batches
+    return result
+
+
+def prepare_column_batch(batch_path: str) -> List[Dict[str, Any]]:
+    """解析进程池任务: 推断一批列的Schema, 并将清理后的数据写回批次文件"""
+    df = pd.read_pickle(batch_path)
+    schema_info = infer_schema(df)
+    clean_dataframe_for_parquet(df).to_pickle(batch_path)
+    return schema_info
+
+
+def write_parquet_batches(batch_paths: List[str], object_name: str) -> str:
+    """解析进程池任务: 按列合并清理后的批次并写入Parquet"""
+    df = pd.concat([pd.read_pickle(path) for path in batch_paths], axis=1)
+    return write_parquet(df, object_name)
 
 
 def clean_column_name(col_name: str) -> str:
@@ -0,0 +1,214 @@
+"""
+数据集分块指纹去重索引
+
+上传CSV时按行做内容定义分块(CDC): 一行结束后, 根据该行内容的哈希决定是否在此处切分,
+切分点只取决于行的内容, 与行在文件中的位置无关。文件末尾追加行后, 之前的分块保持不变
+(只有原来的最后一个分块会延续到新的切分点), 因此可以通过分块指纹:
+    - 在上传流读完的同时得到整个文件的分块列表(与MD5在同一次读取中计算)
+    - 找到"新文件 = 已有数据集的原文件 + 追加的行"的基础数据集, 只解析追加的行
+
+分块指纹保存在 sys_dataset_chunk 表中(指纹列有索引), 查找时只按首个分块的指纹定位候选数据集
+"""
+import hashlib
+import logging
+import zlib
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from core.minio_client import async_minio
+from models.sys_dataset import SysDataset, SysDatasetChunk
+
+logger = logging.getLogger(__name__)
+
+# 最多比较的候选数据集数量
+MAX_CANDIDATES = 20
+
+
+def chunk_digest(data) -> str:
+    """分块内容指纹"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def supports_fingerprint(filename: str) -> bool:
+    """只有按行存储的文本格式可以按行分块"""
+    return filename.lower().endswith('.csv')
+
+
+class RowChunker:
+    """
+    按行的内容定义分块
+
+    一行结束且当前分块不小于 min_size 时, 若 crc32(行) < 行长度 * 2^32 / avg_size 则切分
+    (每个字节的切分概率约为 1/avg_size, 与行长无关); 分块达到 max_size 时在行尾强制切分
+    """
+
+    def __init__(
+        self,
+        min_size: Optional[int] = None,
+        avg_size: Optional[int] = None,
+        max_size: Optional[int] = None
+    ):
+        self.min_size = min_size or settings.DEDUP_CHUNK_MIN_BYTES
+        self.max_size = max_size or settings.DEDUP_CHUNK_MAX_BYTES
+        self._cut_per_byte = (1 << 32) / (avg_size or settings.DEDUP_CHUNK_AVG_BYTES)
+        self.chunks: List[Dict[str, Any]] = []
+        self._hasher = hashlib.blake2b(digest_size=16)
+        self._chunk_size = 0
+        self._offset = 0
+        self._rows = 0
+        self._pending = b""
+
+    def feed(self, data: bytes):
+        """处理一段数据(行可以跨越多次调用)"""
+        buf = self._pending + data if self._pending else data
+        view = memoryview(buf)
+        find = buf.find
+        line_start = 0
+        # buf中尚未计入分块指纹的起始位置
+        hashed = 0
+
+        while True:
+            line_end = find(b"\n", line_start) + 1
+            if line_end == 0:
+                break
+            line_len = line_end - line_start
+            self._chunk_size += line_len
+            self._rows += 1
+            if self._chunk_size >= self.max_size or (
+                self._chunk_size >= self.min_size
+                and zlib.crc32(view[line_start:line_end]) < line_len * self._cut_per_byte
+            ):
+                self._hasher.update(view[hashed:line_end])
+                hashed = line_end
+                self._close_chunk()
+            line_start = line_end
+
+        self._hasher.update(view[hashed:line_start])
+        self._pending = bytes(view[line_start:])
+
+    def _close_chunk(self):
+        self._offset += self._chunk_size
+        self.chunks.append({
+            "fingerprint": self._hasher.hexdigest(),
+            "byte_end": self._offset,
+            "row_end": self._rows
+        })
+        self._hasher = hashlib.blake2b(digest_size=16)
+        self._chunk_size = 0
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """结束输入(最后一行可以没有换行符), 返回分块列表"""
+        if self._pending:
+            self._hasher.update(self._pending)
+            self._chunk_size += len(self._pending)
+            self._rows += 1
+            self._pending = b""
+        if self._chunk_size:
+            self._close_chunk()
+        return self.chunks
+
+
+def save_chunks(session: AsyncSession, dataset_id, chunks: List[Dict[str, Any]]):
+    """写入数据集的分块指纹(随调用方的事务提交)"""
+    session.add_all([
+        SysDatasetChunk(dataset_id=dataset_id, seq=seq, **chunk)
+        for seq, chunk in enumerate(chunks)
+    ])
+
+
+async def delete_chunks(session: AsyncSession, dataset_id):
+    """删除数据集的分块指纹(随调用方的事务提交)"""
+    await session.execute(delete(SysDatasetChunk).where(SysDatasetChunk.dataset_id == dataset_id))
+
+
+async def _load_chunks(session: AsyncSession, dataset_id) -> List[SysDatasetChunk]:
+    result = await session.execute(
+        select(SysDatasetChunk)
+        .where(SysDatasetChunk.dataset_id == dataset_id)
+        .order_by(SysDatasetChunk.seq)
+    )
+    return list(result.scalars().all())
+
+
+async def find_append_base(
+    session: AsyncSession,
+    chunks: List[Dict[str, Any]],
+    object_name: str
+) -> Optional[Dict[str, Any]]:
+    """
+    查找新文件只在末尾追加了行的已解析数据集
+
+    条件: 基础文件的前 n-1 个分块与新文件相同, 且新文件在相同位置的字节与基础文件最后一个分块相同,
+    其后紧跟行边界。有多个匹配时选择最长的基础文件
+
+    Args:
+        session: 数据库会话
+        chunks: 新文件的分块列表(RowChunker.finish)
+        object_name: 新文件的对象名(校验最后一个分块时读取一段字节)
+
+    Returns:
+        {"dataset_id", "offset"(追加行在新文件中的起始字节), "base_size"}; 没有时返回None
+    """
+    if not chunks:
+        return None
+    new_size = chunks[-1]["byte_end"]
+
+    result = await session.execute(
+        select(SysDataset)
+        .join(SysDatasetChunk, SysDatasetChunk.dataset_id == SysDataset.id)
+        .where(
+            SysDatasetChunk.seq == 0,
+            SysDatasetChunk.fingerprint == chunks[0]["fingerprint"],
+            SysDataset.parse_status == 'parsed'
+        )
+        .limit(MAX_CANDIDATES)
+    )
+    candidates = result.scalars().all()
+
+    best = None
+    for dataset in candidates:
+        metadata = dataset.extra_metadata or {}
+        # 按行分块只适用于ASCII兼容的编码
+        encoding = (metadata.get("text_format") or {}).get("encoding", "")
+        if encoding.startswith(("utf-16", "utf-32")):
+            continue
+        # 通过追加接口加入过数据的数据集, 其Parquet与原文件不再对应
+        if metadata.get("parquet_fragments"):
+            continue
+
+        base_chunks = await _load_chunks(session, dataset.id)
+        base_size = base_chunks[-1].byte_end
+        if base_size >= new_size or (best and base_size <= best["base_size"]):
+            continue
+        if len(base_chunks) > len(chunks) or any(
+            base.fingerprint != new["fingerprint"]
+            for base, new in zip(base_chunks[:-1], chunks)
+        ):
+            continue
+
+        # 基础文件的最后一个分块在新文件中被延续, 读取这一段比较(多读1个字节检查行边界)
+        start = base_chunks[-2].byte_end if len(base_chunks) > 1 else 0
+        data = await async_minio.read_range(object_name, start, base_size - start + 1)
+        tail = data[:base_size - start]
+        if chunk_digest(tail) != base_chunks[-1].fingerprint:
+            continue
+
+        if tail.endswith(b"\n"):
+            offset = base_size
+        elif data[-1:] == b"\n":
+            # 基础文件最后一行没有换行符
+            offset = base_size + 1
+        else:
+            # 最后一行被修改, 不是追加
+            continue
+        if offset >= new_size:
+            continue
+
+        best = {"dataset_id": str(dataset.id), "offset": offset, "base_size": base_size}
+
+    if best:
+        logger.info(f"检测到追加上传: 基础数据集 {best['dataset_id']}, 追加内容从第 {best['offset']} 字节开始")
+    return best
@@ -4,37 +4,96 @@ DuckDB查询服务
 """
 import duckdb
 import pandas as pd
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Set
 import logging
-import tempfile
-import os
 import re
-from core.minio_client import minio_client
+import time
+import asyncio
+from core.config import settings
+from core.minio_client import object_name_from_path
 from sqlalchemy import select
 from models.sys_dataset import SysDataset
 from db.session import async_session
+from services.parquet_cache import parquet_cache
+from services.query_cache import query_cache
+from services.rollup_cache import find_rollup, record_dataset_query, schedule_rollup_refresh
 
 logger = logging.getLogger(__name__)
 
+# 后台执行中的查询记录任务
+_record_tasks: Set[asyncio.Task] = set()
+
+
+def dataset_parquet_objects(dataset) -> List[str]:
+    """
+    数据集的全部Parquet对象名: 解析生成的文件 + 追加数据的分片(extra_metadata.parquet_fragments)
+    """
+    fragments = (dataset.extra_metadata or {}).get("parquet_fragments") or []
+    paths = [dataset.parsed_path] + [fragment["path"] for fragment in fragments]
+    return [object_name_from_path(path, "parquet") for path in paths if path]
+
+
+async def get_parquet_paths(object_names: List[str]) -> List[str]:
+    """获取Parquet对象的本地缓存路径(未缓存的分片并发下载)"""
+    return list(await asyncio.gather(*(parquet_cache.get_path(name) for name in object_names)))
+
+
+def parquet_source(parquet_paths: List[str]) -> str:
+    """DuckDB读取多个Parquet文件的表函数"""
+    files = ', '.join("'" + path.replace("'", "''") + "'" for path in parquet_paths)
+    return f"read_parquet([{files}])"
+
+
+def _execute_query(parquet_paths: List[str], table_name: str, sql_query: str, limit: Optional[int]) -> pd.DataFrame:
+    """在DuckDB中把Parquet文件注册为表并执行查询"""
+    con = duckdb.connect()
+    try:
+        # 注册Parquet文件为表
+        con.execute(f"CREATE TABLE {table_name} AS SELECT * FROM {parquet_source(parquet_paths)}")
+
+        # 执行查询
+        # 注意: 这里需要替换SQL中的表名
+        # 使用正则表达式替换，支持多行和空白字符
+        # 匹配 "FROM dataset" 或 "FROM\n    dataset" 等各种情况
+        modified_sql = re.sub(
+            r'FROM\s+dataset\b',
+            f'FROM {table_name}',
+            sql_query,
+            flags=re.IGNORECASE
+        )
+
+        # 添加LIMIT保护
+        if limit and 'LIMIT' not in modified_sql.upper():
+            modified_sql += f" LIMIT {limit}"
+
+        logger.info(f"执行DuckDB查询: {modified_sql}")
+        return con.execute(modified_sql).df()
+    finally:
+        con.close()
+
 
 async def query_parquet_with_duckdb(
     dataset_id: str,
     sql_query: str,
-    limit: Optional[int] = 1000
+    limit: Optional[int] = 1000,
+    question: Optional[str] = None
 ) -> Optional[pd.DataFrame]:
     """
     使用DuckDB查询Parquet文件
 
+    能由聚合物化结果回答的GROUP BY查询改写后在物化结果上执行(rollup_cache);
+    传入 question 的查询(由用户问题生成的SQL)会记录到 SysDatasetAction, 作为物化规划的依据
+
     Args:
         dataset_id: 数据集ID
         sql_query: SQL查询语句
         limit: 最大返回行数
+        question: 生成该SQL的用户问题, 为None时(内部查询)不记录
 
     Returns:
         查询结果DataFrame,失败返回None
     """
-    temp_file = None
-
+    start_time = time.time()
     try:
         # 1. 从数据库获取数据集信息
         async with async_session() as session:
@@ -55,59 +114,178 @@ async def query_parquet_with_duckdb(
                 logger.error(f"数据集Parquet路径为空")
                 return None
 
-        # 2. 从MinIO下载Parquet文件到临时文件
-        parquet_filename = dataset_info.parsed_path.split('/')[-1]
-        parquet_data = minio_client.download_file(f"parquet/{parquet_filename}")
-
-        # 创建临时文件
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.parquet')
-        temp_file.write(parquet_data)
-        temp_file.close()
-
-        logger.info(f"Parquet文件已下载到临时路径: {temp_file.name}")
+        # 同一数据版本的相同查询直接返回缓存结果
+        version = dataset_info.version or 1
+        cached = await query_cache.get(dataset_id, version, sql_query, limit)
+        if cached is not None:
+            logger.info(f"查询缓存命中: 数据集 {dataset_id} 版本 {version}, {len(cached)} 行")
+            _record_query(dataset_id, sql_query, question, start_time, True)
+            return cached
 
-        # 3. 使用DuckDB执行查询
-        con = duckdb.connect()
-
-        # 注册Parquet文件为表
         table_name = f"dataset_{dataset_id.replace('-', '_')}"
-        con.execute(f"CREATE TABLE {table_name} AS SELECT * FROM read_parquet('{temp_file.name}')")
-
-        # 执行查询
-        # 注意: 这里需要替换SQL中的表名
-        # 使用正则表达式替换，支持多行和空白字符
-        # 匹配 "FROM dataset" 或 "FROM\n    dataset" 等各种情况
-        modified_sql = re.sub(
-            r'FROM\s+dataset\b',
-            f'FROM {table_name}',
-            sql_query,
-            flags=re.IGNORECASE
-        )
-
-        # 添加LIMIT保护
-        if limit and 'LIMIT' not in modified_sql.upper():
-            modified_sql += f" LIMIT {limit}"
-
-        logger.info(f"执行DuckDB查询: {modified_sql}")
+        df = None
 
-        df = con.execute(modified_sql).df()
-        con.close()
+        # 2. 优先使用同一数据版本的聚合物化结果, 失败时回退到原始数据
+        rollup = find_rollup(dataset_info, sql_query) if settings.ROLLUP_ENABLED else None
+        if rollup:
+            try:
+                rollup_paths = await get_parquet_paths([rollup["object"]])
+                df = await asyncio.to_thread(_execute_query, rollup_paths, table_name, rollup["sql"], limit)
+                logger.info(f"聚合物化命中: 数据集 {dataset_id} 版本 {version}, 物化结果 {rollup['key']}")
+            except Exception as e:
+                logger.warning(f"聚合物化查询失败, 回退到原始数据: {e}")
+                df = None
+
+        if df is None:
+            # 3. 获取本地缓存的Parquet文件(未缓存时从MinIO流式下载), 追加过数据的数据集有多个分片
+            parquet_paths = await get_parquet_paths(dataset_parquet_objects(dataset_info))
+            df = await asyncio.to_thread(_execute_query, parquet_paths, table_name, sql_query, limit)
 
         logger.info(f"查询成功,返回 {len(df)} 行数据")
+        await query_cache.set(dataset_id, version, sql_query, limit, df)
+        _record_query(dataset_id, sql_query, question, start_time, True)
         return df
 
     except Exception as e:
         logger.error(f"DuckDB查询失败: {e}", exc_info=True)
+        _record_query(dataset_id, sql_query, question, start_time, False, str(e))
         return None
 
+
+def _record_query(
+    dataset_id: str,
+    sql_query: str,
+    question: Optional[str],
+    start_time: float,
+    is_success: bool,
+    error_message: Optional[str] = None
+):
+    """在后台记录查询并按需提交物化规划任务(不阻塞查询结果返回)"""
+    if question is None:
+        return
+    execution_time = int((time.time() - start_time) * 1000)
+    task = asyncio.create_task(
+        _record_and_schedule(dataset_id, sql_query, question, execution_time, is_success, error_message)
+    )
+    # 保留引用, 避免任务执行完之前被回收
+    _record_tasks.add(task)
+    task.add_done_callback(_record_tasks.discard)
+
+
+async def _record_and_schedule(
+    dataset_id: str,
+    sql_query: str,
+    question: str,
+    execution_time: int,
+    is_success: bool,
+    error_message: Optional[str]
+):
+    await record_dataset_query(dataset_id, sql_query, question, execution_time, is_success, error_message)
+    if is_success:
+        await schedule_rollup_refresh(dataset_id)
+
+
+def _quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _read_parquet_page(
+    parquet_paths: List[str],
+    columns: Optional[List[str]],
+    limit: int,
+    offset: int
+) -> Dict[str, Any]:
+    """在DuckDB中读取Parquet的一页(只读取选中的列和行组)"""
+    con = duckdb.connect()
+    try:
+        source = parquet_source(parquet_paths)
+        all_columns = [row[0] for row in con.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()]
+
+        if columns:
+            unknown = [col for col in columns if col not in all_columns]
+            if unknown:
+                raise ValueError(f"列不存在: {', '.join(unknown)}")
+            cols_str = ', '.join(_quote_identifier(col) for col in columns)
+        else:
+            cols_str = '*'
+
+        # 行数来自Parquet文件元数据,不扫描数据
+        total_rows = con.execute(f"SELECT COUNT(*) FROM {source}").fetchone()[0]
+        df = con.execute(
+            f"SELECT {cols_str} FROM {source} LIMIT ? OFFSET ?",
+            [limit, offset]
+        ).df()
+        return {"df": df, "all_columns": all_columns, "total_rows": total_rows}
     finally:
-        # 清理临时文件
-        if temp_file and os.path.exists(temp_file.name):
-            try:
-                os.unlink(temp_file.name)
-                logger.debug(f"临时文件已删除: {temp_file.name}")
-            except:
-                pass
+        con.close()
+
+
+async def preview_parquet(
+    parquet_objects: List[str],
+    columns: Optional[List[str]] = None,
+    limit: int = 100,
+    offset: int = 0
+) -> Dict[str, Any]:
+    """
+    分页预览已解析数据集的Parquet文件
+
+    Args:
+        parquet_objects: 数据集的Parquet对象名(dataset_parquet_objects)
+        columns: 只返回这些列, None表示所有列
+        limit: 返回行数
+        offset: 起始行
+
+    Returns:
+        {"df": 当前页DataFrame, "all_columns": 全部列名, "total_rows": 总行数}
+
+    Raises:
+        FileNotFoundError: Parquet文件不存在
+        ValueError: 列名不存在
+    """
+    parquet_paths = await get_parquet_paths(parquet_objects)
+    return await asyncio.to_thread(_read_parquet_page, parquet_paths, columns, limit, offset)
+
+
+def _column_exact_stats(
+    parquet_paths: List[str],
+    columns: List[str],
+    numeric_columns: List[str]
+) -> Dict[str, Dict[str, Any]]:
+    con = duckdb.connect()
+    try:
+        exprs = []
+        for col in columns:
+            exprs.append(f"COUNT(DISTINCT {_quote_identifier(col)})")
+            if col in numeric_columns:
+                exprs.append(f"MEDIAN({_quote_identifier(col)})")
+        row = list(con.execute(f"SELECT {', '.join(exprs)} FROM {parquet_source(parquet_paths)}").fetchone())
+    finally:
+        con.close()
+
+    stats = {}
+    for col in columns:
+        stats[col] = {'unique_count': int(row.pop(0))}
+        if col in numeric_columns:
+            median = row.pop(0)
+            stats[col]['median'] = float(median) if median is not None else None
+    return stats
+
+
+async def column_exact_stats(
+    parquet_objects: List[str],
+    columns: List[str],
+    numeric_columns: List[str]
+) -> Dict[str, Dict[str, Any]]:
+    """
+    在数据集全部分片上计算无法增量合并的列统计(只读取指定列)
+
+    Returns:
+        {列名: {"unique_count", "median"(数值列)}}
+    """
+    if not columns:
+        return {}
+    parquet_paths = await get_parquet_paths(parquet_objects)
+    return await asyncio.to_thread(_column_exact_stats, parquet_paths, columns, numeric_columns)
 
 
 async def get_dataset_sample(dataset_id: str, limit: int = 10) -> Optional[pd.DataFrame]:
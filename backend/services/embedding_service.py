@@ -9,13 +9,16 @@ from qdrant_client.models import Distance, VectorParams, PointStruct, Filter, Fi
 from core.config import settings
 import logging
 from typing import List, Dict, Any, Optional
-from uuid import UUID
+from uuid import NAMESPACE_URL, UUID, uuid5
 import httpx
+from services.config_registry import config_registry, config_fingerprint
 
 logger = logging.getLogger(__name__)
 
-# 全局embedding配置缓存
-_embedding_config_cache = None
+# 配置注册表命名空间
+EMBEDDING_CONFIG_NAMESPACE = "embedding_config"
+
+# 全局客户端缓存: (配置指纹, 客户端), 配置变化时重建
 _openai_client_cache = None
 
 # 初始化Qdrant客户端
@@ -27,14 +30,22 @@ except Exception as e:
     logger.error(f"Qdrant客户端初始化失败: {e}")
 
 
+def _point_id(string_id: str) -> str:
+    """
+    列向量的Qdrant point ID(由字符串ID确定的UUID)
+
+    Python的字符串hash按进程随机化, 不能作为ID: 重新向量化时无法覆盖原有的点
+    """
+    return str(uuid5(NAMESPACE_URL, string_id))
+
+
 async def _get_embedding_config():
-    """从数据库获取embedding模型配置"""
-    global _embedding_config_cache
+    """获取embedding模型配置(进程内TTL缓存,配置写入时跨worker失效)"""
+    return await config_registry.get(EMBEDDING_CONFIG_NAMESPACE, _load_embedding_config)
 
-    # 使用缓存(5分钟有效)
-    if _embedding_config_cache:
-        return _embedding_config_cache
 
+async def _load_embedding_config():
+    """从数据库加载embedding模型配置"""
     try:
         from sqlalchemy import select
         from models.sys_ai_model_config import SysAiModelConfig
@@ -52,30 +63,28 @@ async def _get_embedding_config():
             config = result.scalar_one_or_none()
 
             if config:
-                _embedding_config_cache = {
+                logger.info(f"从数据库加载embedding配置: {config.model_name}")
+                return {
                     'provider': config.provider,
                     'model_name': config.model_name,
                     'api_url': config.api_url,
                     'api_key': config.api_key,
                     'model_params': config.model_params or {}
                 }
-                logger.info(f"从数据库加载embedding配置: {config.model_name}")
-                return _embedding_config_cache
 
     except Exception as e:
         logger.warning(f"从数据库加载embedding配置失败: {e}")
 
     # 回退到环境变量配置
     if settings.OPENAI_API_KEY:
-        _embedding_config_cache = {
+        logger.info("使用环境变量中的OpenAI配置")
+        return {
             'provider': 'openai',
             'model_name': settings.EMBEDDING_MODEL,
             'api_url': 'https://api.openai.com/v1',
             'api_key': settings.OPENAI_API_KEY,
             'model_params': {}
         }
-        logger.info("使用环境变量中的OpenAI配置")
-        return _embedding_config_cache
 
     logger.warning("未找到有效的embedding配置")
     return None
@@ -85,13 +94,14 @@ async def _get_openai_client():
     """获取OpenAI客户端(支持多种API提供商)"""
     global _openai_client_cache
 
-    if _openai_client_cache:
-        return _openai_client_cache
-
     config = await _get_embedding_config()
     if not config:
         return None
 
+    fingerprint = config_fingerprint(config)
+    if _openai_client_cache and _openai_client_cache[0] == fingerprint:
+        return _openai_client_cache[1]
+
     try:
         # 根据provider类型处理API URL
         # OpenAI SDK的行为: base_url + endpoint路径
@@ -133,12 +143,13 @@ async def _get_openai_client():
             elif not base_url.endswith('/v1') and not base_url.endswith('/api'):
                 base_url = base_url + '/v1'
 
-        _openai_client_cache = AsyncOpenAI(
+        client = AsyncOpenAI(
             api_key=config['api_key'],
             base_url=base_url
         )
+        _openai_client_cache = (fingerprint, client)
         logger.info(f"Embedding客户端初始化成功: provider={provider}, base_url={base_url}")
-        return _openai_client_cache
+        return client
 
     except Exception as e:
         logger.error(f"Embedding客户端初始化失败: {e}")
@@ -218,9 +229,8 @@ async def generate_column_embeddings(dataset_id: str, schema_info: List[Dict[str
 
                 # 构造Qdrant point
                 # Qdrant要求point ID必须是unsigned integer或UUID
-                # 使用字符串ID的hash值转换为正整数(32位,避免溢出)
                 string_id = f"{dataset_id}_{col_info['name']}_{idx}"
-                point_id = abs(hash(string_id)) % (2**31)  # 确保是正整数且在32位范围内
+                point_id = _point_id(string_id)
 
                 point = PointStruct(
                     id=point_id,
@@ -233,7 +243,8 @@ async def generate_column_embeddings(dataset_id: str, schema_info: List[Dict[str
                         "description": description,
                         "stats": col_info.get('stats', {}),
                         "sample_values": col_info.get('samples', []),
-                        "string_id": string_id  # 保存原始字符串ID用于调试
+                        "string_id": string_id,  # 保存原始字符串ID用于调试
+                        "embedding_model": config['model_name']
                     }
                 )
                 points.append(point)
@@ -299,13 +310,45 @@ def build_column_description(col_info: Dict[str, Any]) -> str:
     return ', '.join(parts)
 
 
-async def vectorize_columns(dataset_id: str, chunked_data: List[Dict[str, Any]]):
+def _load_reusable_vectors(dataset_id: str, model_name: str) -> Dict[str, List[float]]:
+    """读取数据集已有的列向量: 描述文本 -> 向量(只取同一embedding模型生成的)"""
+    try:
+        points, _ = qdrant_client.scroll(
+            collection_name=settings.QDRANT_COLLECTION_NAME,
+            scroll_filter=Filter(
+                must=[
+                    FieldCondition(
+                        key="dataset_id",
+                        match=MatchValue(value=str(dataset_id))
+                    )
+                ]
+            ),
+            limit=1000,
+            with_vectors=True
+        )
+    except Exception as e:
+        logger.warning(f"读取数据集 {dataset_id} 的已有向量失败, 全部重新生成: {e}")
+        return {}
+
+    return {
+        point.payload['description']: point.vector
+        for point in points
+        if point.payload.get('embedding_model') == model_name and point.vector
+    }
+
+
+async def vectorize_columns(
+    dataset_id: str,
+    chunked_data: List[Dict[str, Any]],
+    reuse_from: Optional[str] = None
+):
     """
     对已分片的列数据进行向量化并存入Qdrant
 
     Args:
         dataset_id: 数据集ID
         chunked_data: 分片数据列表，每项包含 {index, col_info, description}
+        reuse_from: 可复用向量的数据集ID(追加上传的基础数据集), 描述文本未变化的列直接复用其向量
 
     Raises:
         Exception: 向量化失败时抛出异常
@@ -332,56 +375,67 @@ async def vectorize_columns(dataset_id: str, chunked_data: List[Dict[str, Any]])
         from models.sys_dataset import SysDataset
         from sqlalchemy import select
 
-        points = []
-        for item in chunked_data:
-            idx = item['index']
-            col_info = item['col_info']
-            description = item['description']
-
-            try:
-                # 调用Embedding API
-                response = await client.embeddings.create(
-                    model=config['model_name'],
-                    input=description
-                )
-                embedding = response.data[0].embedding
-
-                # 构造Qdrant point
-                string_id = f"{dataset_id}_{col_info['name']}_{idx}"
-                point_id = abs(hash(string_id)) % (2**31)
-
-                point = PointStruct(
-                    id=point_id,
-                    vector=embedding,
-                    payload={
-                        "dataset_id": str(dataset_id),
-                        "col_name": col_info['name'],
-                        "col_type": col_info.get('type'),
-                        "col_index": idx,
-                        "description": description,
-                        "stats": col_info.get('stats', {}),
-                        "sample_values": col_info.get('samples', []),
-                        "string_id": string_id
-                    }
-                )
-                points.append(point)
+        reusable = _load_reusable_vectors(reuse_from, config['model_name']) if reuse_from else {}
+        reused = 0
 
-                # 更新向量化进度
-                progress = int((idx + 1) / len(chunked_data) * 100)
-                async with async_session() as session:
-                    result = await session.execute(
-                        select(SysDataset).where(SysDataset.id == dataset_id)
+        points = []
+        # 整个向量化过程复用同一个会话更新进度(提交后连接即归还连接池,调用Embedding API期间不占用连接)
+        async with async_session() as session:
+            result = await session.execute(
+                select(SysDataset).where(SysDataset.id == dataset_id)
+            )
+            dataset = result.scalar_one_or_none()
+            await session.commit()  # 结束只读事务,归还连接
+
+            for item in chunked_data:
+                idx = item['index']
+                col_info = item['col_info']
+                description = item['description']
+
+                try:
+                    embedding = reusable.get(description)
+                    if embedding is not None:
+                        reused += 1
+                    else:
+                        # 调用Embedding API
+                        response = await client.embeddings.create(
+                            model=config['model_name'],
+                            input=description
+                        )
+                        embedding = response.data[0].embedding
+
+                    # 构造Qdrant point
+                    string_id = f"{dataset_id}_{col_info['name']}_{idx}"
+                    point_id = _point_id(string_id)
+
+                    point = PointStruct(
+                        id=point_id,
+                        vector=embedding,
+                        payload={
+                            "dataset_id": str(dataset_id),
+                            "col_name": col_info['name'],
+                            "col_type": col_info.get('type'),
+                            "col_index": idx,
+                            "description": description,
+                            "stats": col_info.get('stats', {}),
+                            "sample_values": col_info.get('samples', []),
+                            "string_id": string_id,
+                            "embedding_model": config['model_name']
+                        }
                     )
-                    dataset = result.scalar_one_or_none()
+                    points.append(point)
+
+                    # 更新向量化进度
+                    progress = int((idx + 1) / len(chunked_data) * 100)
                     if dataset:
                         dataset.vectorize_progress = progress
                         await session.commit()
 
-                logger.debug(f"列 '{col_info['name']}' 向量化完成 ({idx+1}/{len(chunked_data)})")
+                    logger.debug(f"列 '{col_info['name']}' 向量化完成 ({idx+1}/{len(chunked_data)})")
 
-            except Exception as e:
-                logger.error(f"向量化列 '{col_info['name']}' 失败: {e}")
-                raise  # 向量化失败应该中断流程
+                except Exception as e:
+                    logger.error(f"向量化列 '{col_info['name']}' 失败: {e}")
+                    raise  # 向量化失败应该中断流程
 
         # 批量插入Qdrant
         if points:
@@ -389,7 +443,7 @@ async def vectorize_columns(dataset_id: str, chunked_data: List[Dict[str, Any]])
                 collection_name=settings.QDRANT_COLLECTION_NAME,
                 points=points
             )
-            logger.info(f"数据集 {dataset_id} 的 {len(points)} 个列向量已存入Qdrant")
+            logger.info(f"数据集 {dataset_id} 的 {len(points)} 个列向量已存入Qdrant(复用 {reused} 个)")
         else:
             raise Exception("没有成功生成任何向量")
 
@@ -398,6 +452,101 @@ async def vectorize_columns(dataset_id: str, chunked_data: List[Dict[str, Any]])
         raise
 
 
+async def refresh_column_vectors(dataset_id: str, chunked_data: List[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    数据集追加数据后刷新列向量
+
+    描述文本中的统计值和示例值几乎每次追加都会变化, 不作为重新生成向量的依据:
+    列名和类型未变化的列只更新Qdrant中的统计信息和示例值(不调用Embedding API, 保留生成向量时的描述文本),
+    类型变化的列重新生成向量并覆盖原有的点, 新增的列写入新点
+
+    Args:
+        dataset_id: 数据集ID
+        chunked_data: 分片数据列表，每项包含 {index, col_info, description}
+
+    Returns:
+        {"reembedded": 重新生成向量的列数, "updated": 只更新统计信息的列数}
+    """
+    client = await _get_openai_client()
+    config = await _get_embedding_config()
+
+    if not client or not config:
+        raise Exception("Embedding客户端或配置未初始化")
+
+    if not qdrant_client:
+        raise Exception("Qdrant客户端未初始化")
+
+    if not _ensure_collection():
+        raise Exception("Qdrant collection不可用")
+
+    existing_points, _ = qdrant_client.scroll(
+        collection_name=settings.QDRANT_COLLECTION_NAME,
+        scroll_filter=Filter(
+            must=[
+                FieldCondition(
+                    key="dataset_id",
+                    match=MatchValue(value=str(dataset_id))
+                )
+            ]
+        ),
+        limit=1000
+    )
+    existing = {point.payload.get('col_name'): point for point in existing_points}
+
+    points = []
+    updated = 0
+    for item in chunked_data:
+        idx = item['index']
+        col_info = item['col_info']
+        description = item['description']
+        string_id = f"{dataset_id}_{col_info['name']}_{idx}"
+        payload = {
+            "dataset_id": str(dataset_id),
+            "col_name": col_info['name'],
+            "col_type": col_info.get('type'),
+            "col_index": idx,
+            "description": description,
+            "stats": col_info.get('stats', {}),
+            "sample_values": col_info.get('samples', []),
+            "string_id": string_id,
+            "embedding_model": config['model_name']
+        }
+
+        point = existing.get(col_info['name'])
+        if (
+            point is not None
+            and point.payload.get('col_type') == col_info.get('type')
+            and point.payload.get('embedding_model') == config['model_name']
+        ):
+            # description 保持为生成该向量的文本(按描述复用向量时依赖这一点)
+            payload['description'] = point.payload.get('description', description)
+            qdrant_client.set_payload(
+                collection_name=settings.QDRANT_COLLECTION_NAME,
+                payload=payload,
+                points=[point.id]
+            )
+            updated += 1
+            continue
+
+        response = await client.embeddings.create(
+            model=config['model_name'],
+            input=description
+        )
+        points.append(PointStruct(
+            id=point.id if point is not None else _point_id(string_id),
+            vector=response.data[0].embedding,
+            payload=payload
+        ))
+
+    if points:
+        qdrant_client.upsert(
+            collection_name=settings.QDRANT_COLLECTION_NAME,
+            points=points
+        )
+    logger.info(f"数据集 {dataset_id} 列向量已刷新: 重新生成 {len(points)} 个, 只更新统计信息 {updated} 个")
+    return {"reembedded": len(points), "updated": updated}
+
+
 async def search_relevant_columns(
     query: str,
     top_k: int = 5,
@@ -560,3 +709,8 @@ async def delete_dataset_embeddings(dataset_id: str):
 
     except Exception as e:
         logger.error(f"删除embeddings失败: {e}")
+
+
+async def invalidate_embedding_config():
+    """使embedding配置缓存失效(本进程及其他worker)"""
+    await config_registry.invalidate(EMBEDDING_CONFIG_NAMESPACE)
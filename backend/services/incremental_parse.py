@@ -0,0 +1,290 @@
+"""
+增量解析: 只解析追加的行
+
+新上传的CSV是已有数据集原文件追加若干行的结果时(services/dedup_index.py), 解析任务:
+    1. 只读取并解析追加部分(加上表头), 推断这部分的统计信息
+    2. 与基础数据集的Parquet合并, 写入新数据集的Parquet
+    3. 列统计增量合并: 计数、最值、均值、标准差直接合并;
+       唯一值数、中位数无法合并, 只对追加部分有非空值的列在合并后的数据上重新计算
+列名或类型与基础数据集不兼容时抛出 AppendMismatchError, 由调用方改为完整解析
+"""
+import io
+import logging
+import math
+import uuid
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from sqlalchemy import select
+
+from core.minio_client import minio_client, object_name_from_path
+from models.sys_dataset import SysDataset, SysDatasetColumn
+from services.parse_pool import run_in_pool
+from services.text_format import SNIFF_BYTES, csv_read_options
+
+logger = logging.getLogger(__name__)
+
+
+class AppendMismatchError(ValueError):
+    """追加部分与基础数据集的列结构不兼容"""
+
+
+def read_parquet_table(object_names: List[str]) -> pa.Table:
+    """从MinIO读取数据集的Parquet(多个分片时按顺序合并)为Arrow表"""
+    tables = [pq.read_table(io.BytesIO(minio_client.download_file(name))) for name in object_names]
+    return pa.concat_tables(tables) if len(tables) > 1 else tables[0]
+
+
+def upload_parquet_table(table: pa.Table, object_name: str) -> str:
+    """Arrow表写入Parquet并上传MinIO, 返回文件路径"""
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression='snappy', use_dictionary=True)
+    return minio_client.upload_file(buffer.getvalue(), object_name, content_type="application/x-parquet")
+
+
+def read_appended_frame(
+    object_name: str,
+    offset: int,
+    text_format: Optional[Dict[str, Any]],
+    length: Optional[int] = None
+) -> pd.DataFrame:
+    """读取CSV中从 offset 开始的行(使用文件的表头), 列名已清理"""
+    from services.dataset_parser import clean_column_name
+
+    head = minio_client.read_range(object_name, 0, SNIFF_BYTES)
+    header_end = head.find(b"\n")
+    if header_end < 0:
+        raise AppendMismatchError("无法读取表头")
+    appended = minio_client.read_range(object_name, offset, length)
+
+    df = pd.read_csv(
+        io.BytesIO(head[:header_end + 1] + appended),
+        low_memory=False,
+        **csv_read_options(text_format)
+    )
+    df.columns = [clean_column_name(col) for col in df.columns]
+    return df
+
+
+def to_base_schema(df: pd.DataFrame, base_schema: pa.Schema) -> pa.Table:
+    """追加部分转换为基础数据集的Arrow Schema(列顺序可以不同)"""
+    from services.dataset_parser import clean_dataframe_for_parquet
+
+    if len(df.columns) != len(base_schema.names) or set(df.columns) != set(base_schema.names):
+        raise AppendMismatchError(f"列结构不一致: {list(df.columns)} != {base_schema.names}")
+    df = df[base_schema.names]
+    try:
+        table = pa.Table.from_pandas(clean_dataframe_for_parquet(df), preserve_index=False)
+        return table.cast(base_schema.remove_metadata()).replace_schema_metadata(base_schema.metadata)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError) as e:
+        raise AppendMismatchError(f"列类型不兼容: {e}")
+
+
+def exact_column_stats(table: pa.Table, columns: List[str], numeric_columns: List[str]) -> Dict[str, Dict[str, Any]]:
+    """在完整数据上计算无法增量合并的统计(唯一值数、中位数)"""
+    exact = {}
+    for col in columns:
+        stats = {'unique_count': pc.count_distinct(table[col]).as_py()}
+        if col in numeric_columns:
+            median = pc.quantile(table[col], q=0.5)
+            stats['median'] = float(median[0].as_py()) if len(median) and median[0].is_valid else None
+        exact[col] = stats
+    return exact
+
+
+def load_appended_rows(
+    file_path: str,
+    offset: int,
+    base_parquet_objects: List[str],
+    parquet_object: str,
+    text_format: Optional[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """
+    解析进程池任务: 解析追加的行并与基础数据集合并写入Parquet
+
+    Returns:
+        row_count, column_count, parquet_path, appended_rows,
+        appended_schema(追加部分的schema_info), exact_stats(需重新计算的列的唯一值数/中位数)
+    """
+    from services.dataset_parser import infer_schema
+
+    df = read_appended_frame(object_name_from_path(file_path, "uploads"), offset, text_format)
+    base_table = read_parquet_table(base_parquet_objects)
+    appended_table = to_base_schema(df, base_table.schema)
+    appended_schema = infer_schema(df)
+    del df
+
+    table = pa.concat_tables([base_table, appended_table])
+    parquet_path = upload_parquet_table(table, parquet_object)
+
+    # 只有追加部分有非空值的列, 唯一值数和中位数才可能变化
+    changed = [col['name'] for col in appended_schema if col['stats']['null_count'] < col['stats']['total_count']]
+    numeric = [col['name'] for col in appended_schema if col['type'] in ('int', 'float')]
+
+    return {
+        'row_count': table.num_rows,
+        'column_count': table.num_columns,
+        'parquet_path': parquet_path,
+        'appended_rows': appended_table.num_rows,
+        'appended_schema': appended_schema,
+        'exact_stats': exact_column_stats(table, changed, numeric)
+    }
+
+
+def _combine(a, b, func):
+    values = [v for v in (a, b) if v is not None]
+    return func(values) if values else None
+
+
+def merge_column_stats(old: Dict[str, Any], new: Dict[str, Any], dtype: str) -> Dict[str, Any]:
+    """
+    合并两部分数据的列统计(与 dataset_parser.generate_column_stats 的字段一致)
+
+    唯一值数、中位数无法由两部分合并, 保留原值, 由调用方用 exact_column_stats 的结果覆盖
+    """
+    merged = dict(old)
+    n_old = old.get('total_count', 0)
+    n_new = new.get('total_count', 0)
+    merged['total_count'] = n_old + n_new
+    merged['null_count'] = old.get('null_count', 0) + new.get('null_count', 0)
+
+    if dtype in ('int', 'float'):
+        merged['min'] = _combine(old.get('min'), new.get('min'), min)
+        merged['max'] = _combine(old.get('max'), new.get('max'), max)
+
+        # 非空值个数加权合并均值, 按并行方差公式合并(样本)标准差
+        c_old = n_old - old.get('null_count', 0)
+        c_new = n_new - new.get('null_count', 0)
+        mean_old, mean_new = old.get('mean'), new.get('mean')
+        if mean_old is None or c_old == 0:
+            merged['mean'], merged['std'] = mean_new, new.get('std')
+        elif mean_new is not None and c_new > 0:
+            count = c_old + c_new
+            delta = mean_new - mean_old
+            merged['mean'] = mean_old + delta * c_new / count
+            m2 = (old.get('std') or 0) ** 2 * (c_old - 1) + (new.get('std') or 0) ** 2 * (c_new - 1)
+            m2 += delta ** 2 * c_old * c_new / count
+            merged['std'] = math.sqrt(m2 / (count - 1)) if count > 1 else None
+
+    elif dtype == 'string':
+        if 'max_length' in old and 'max_length' in new:
+            merged['max_length'] = max(old['max_length'], new['max_length'])
+            merged['min_length'] = min(old['min_length'], new['min_length'])
+            if merged['total_count']:
+                merged['avg_length'] = (
+                    old['avg_length'] * n_old + new['avg_length'] * n_new
+                ) / merged['total_count']
+
+    elif dtype == 'date':
+        merged['min_date'] = _combine(old.get('min_date'), new.get('min_date'), min)
+        merged['max_date'] = _combine(old.get('max_date'), new.get('max_date'), max)
+
+    return merged
+
+
+def merge_schema_info(
+    base_columns: List[Dict[str, Any]],
+    appended_schema: List[Dict[str, Any]],
+    exact_stats: Dict[str, Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    合并基础数据集的列信息与追加部分的列信息
+
+    Args:
+        base_columns: 基础数据集的列信息 [{name, type, stats, samples}], 按列顺序
+        appended_schema: 追加部分的列信息
+        exact_stats: 重新计算的唯一值数/中位数
+
+    Returns:
+        合并后的schema_info
+    """
+    appended = {col['name']: col for col in appended_schema}
+    merged = []
+    for base in base_columns:
+        new = appended[base['name']]
+        dtype = base['type']
+        if dtype != new['type'] and {dtype, new['type']} == {'int', 'float'}:
+            dtype = 'float'
+
+        stats = merge_column_stats(base['stats'] or {}, new['stats'], dtype)
+        stats.update(exact_stats.get(base['name'], {}))
+
+        # 示例值取前5个不同的值, 基础数据不足5个时才会用到追加部分
+        samples = list(base['samples'] or [])
+        for value in new['samples']:
+            if len(samples) >= 5:
+                break
+            if value not in samples:
+                samples.append(value)
+
+        merged.append({'name': base['name'], 'type': dtype, 'stats': stats, 'samples': samples})
+    return merged
+
+
+async def parse_appended(
+    session,
+    file_path: str,
+    append_base: Dict[str, Any],
+    parquet_object: str,
+    text_format: Optional[Dict[str, Any]]
+) -> Optional[Dict[str, Any]]:
+    """
+    增量解析追加上传的文件
+
+    Args:
+        session: 数据库会话
+        file_path: 新文件路径
+        append_base: dedup_index.find_append_base 的结果
+        parquet_object: 新数据集的Parquet对象名
+        text_format: 新文件的文本格式
+
+    Returns:
+        {row_count, column_count, schema_info, parquet_path};
+        基础数据集已删除或与追加部分不兼容时返回None(调用方改为完整解析)
+    """
+    base = await session.get(SysDataset, uuid.UUID(append_base["dataset_id"]))
+    if (
+        base is None or base.parse_status != 'parsed' or not base.parsed_path
+        or (base.extra_metadata or {}).get("parquet_fragments")
+    ):
+        logger.info(f"基础数据集 {append_base['dataset_id']} 不可用, 改为完整解析")
+        return None
+
+    result = await session.execute(
+        select(SysDatasetColumn)
+        .where(SysDatasetColumn.dataset_id == base.id)
+        .order_by(SysDatasetColumn.col_index)
+    )
+    base_columns = [
+        {'name': col.col_name, 'type': col.col_type, 'stats': col.stats, 'samples': col.sample_values}
+        for col in result.scalars().all()
+    ]
+
+    try:
+        loaded = await run_in_pool(
+            load_appended_rows,
+            file_path,
+            append_base["offset"],
+            [object_name_from_path(base.parsed_path, "parquet")],
+            parquet_object,
+            text_format
+        )
+        schema_info = merge_schema_info(base_columns, loaded['appended_schema'], loaded['exact_stats'])
+    except (AppendMismatchError, KeyError) as e:
+        logger.info(f"追加内容与基础数据集 {base.id} 不兼容, 改为完整解析: {e}")
+        return None
+
+    logger.info(
+        f"增量解析完成: 基础数据集 {base.id} {base.row_count} 行, 追加 {loaded['appended_rows']} 行, "
+        f"重新计算唯一值的列: {list(loaded['exact_stats'])}"
+    )
+    return {
+        'row_count': loaded['row_count'],
+        'column_count': loaded['column_count'],
+        'schema_info': schema_info,
+        'parquet_path': loaded['parquet_path']
+    }
@@ -0,0 +1,104 @@
+"""
+意图分类结果缓存服务 - 使用Redis在多个worker之间共享 规范化文本 -> 意图 的映射
+"""
+import hashlib
+import json
+import logging
+from typing import Optional, Dict, Any
+from api.dependencies.dependencies import redis_client
+from core.config import settings
+from services.intent_classifier import normalize_text
+
+logger = logging.getLogger(__name__)
+
+
+class IntentCacheService:
+    """意图分类结果缓存服务"""
+
+    CACHE_KEY_PREFIX = "intent_cache"
+    STATS_KEY = "intent_cache_stats"
+
+    @classmethod
+    def _get_cache_key(cls, user_input: str, fingerprint: str) -> str:
+        """获取Redis缓存键(文本取哈希,避免超长键)"""
+        text_hash = hashlib.sha1(normalize_text(user_input).encode('utf-8')).hexdigest()
+        return f"{cls.CACHE_KEY_PREFIX}:{fingerprint}:{text_hash}"
+
+    @classmethod
+    async def get(cls, user_input: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """
+        读取缓存的意图分类结果,同时累计命中/未命中计数
+
+        Returns:
+            意图分类结果,未命中返回None
+        """
+        try:
+            cached = await redis_client.get(cls._get_cache_key(user_input, fingerprint))
+            await redis_client.hincrby(cls.STATS_KEY, "hits" if cached else "misses", 1)
+            if cached:
+                return json.loads(cached)
+        except Exception as e:
+            logger.warning(f"读取意图缓存失败: {e}")
+        return None
+
+    @classmethod
+    async def set(cls, user_input: str, fingerprint: str, intent_result: Dict[str, Any]) -> bool:
+        """写入意图分类结果"""
+        try:
+            await redis_client.setex(
+                cls._get_cache_key(user_input, fingerprint),
+                settings.INTENT_CACHE_TTL,
+                json.dumps(intent_result, ensure_ascii=False)
+            )
+            return True
+        except Exception as e:
+            logger.warning(f"写入意图缓存失败: {e}")
+            return False
+
+    @classmethod
+    async def clear(cls) -> int:
+        """
+        清除所有意图缓存(LLM配置变更时调用)
+
+        Returns:
+            删除的键数量
+        """
+        deleted = 0
+        try:
+            batch = []
+            async for key in redis_client.scan_iter(match=f"{cls.CACHE_KEY_PREFIX}:*", count=500):
+                batch.append(key)
+                if len(batch) >= 500:
+                    deleted += await redis_client.delete(*batch)
+                    batch = []
+            if batch:
+                deleted += await redis_client.delete(*batch)
+            logger.info(f"已清除 {deleted} 条意图缓存")
+        except Exception as e:
+            logger.error(f"清除意图缓存失败: {e}")
+        return deleted
+
+    @classmethod
+    async def get_stats(cls) -> Dict[str, Any]:
+        """获取命中率统计(所有worker累计)"""
+        stats = await redis_client.hgetall(cls.STATS_KEY)
+        hits = int(stats.get(b"hits", 0))
+        misses = int(stats.get(b"misses", 0))
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "total": total,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "ttl_seconds": settings.INTENT_CACHE_TTL
+        }
+
+    @classmethod
+    async def reset_stats(cls) -> bool:
+        """重置命中率统计"""
+        try:
+            await redis_client.delete(cls.STATS_KEY)
+            return True
+        except Exception as e:
+            logger.error(f"重置意图缓存统计失败: {e}")
+            return False
@@ -0,0 +1,271 @@
+"""
+本地意图分类器(Local Intent Classifier)
+关键词特征 + 字符n-gram哈希向量 + 线性softmax模型
+用于在调用LLM之前快速完成意图分类,只有置信度不足时才回退到LLM
+
+训练数据来源: SysDatasetAction.input_text / SysDatasetAction.intent
+训练与离线评估脚本: train_intent_classifier.py
+"""
+import json
+import logging
+import math
+import random
+import zlib
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 模型文件格式版本
+MODEL_VERSION = 1
+
+# 字符n-gram哈希桶数量(哈希技巧,避免维护词表)
+HASH_DIM = 4096
+NGRAM_RANGE = (1, 3)
+
+# 模型文件默认路径(相对backend目录)
+BACKEND_DIR = Path(__file__).parent.parent
+
+
+def normalize_text(text: str) -> str:
+    """规范化用户输入: 小写、去首尾空白、合并连续空白、统一全角问号"""
+    return ' '.join(text.lower().replace('？', '?').split())
+
+
+def _stable_bucket(token: str) -> int:
+    """稳定哈希(进程间一致,不受PYTHONHASHSEED影响)"""
+    return zlib.crc32(token.encode('utf-8')) % HASH_DIM
+
+
+@lru_cache(maxsize=4096)
+def _ngram_vector(text: str) -> Tuple[Tuple[str, float], ...]:
+    """
+    计算文本的字符n-gram哈希向量(L2归一化)
+
+    结果按规范化文本缓存,相同问题重复出现时无需重新计算
+    """
+    counts: Dict[int, int] = {}
+    padded = f"^{text}$"
+    for n in range(NGRAM_RANGE[0], NGRAM_RANGE[1] + 1):
+        for i in range(len(padded) - n + 1):
+            bucket = _stable_bucket(padded[i:i + n])
+            counts[bucket] = counts.get(bucket, 0) + 1
+
+    norm = math.sqrt(sum(c * c for c in counts.values())) or 1.0
+    return tuple((f"h:{bucket}", count / norm) for bucket, count in counts.items())
+
+
+def extract_features(text: str, keyword_groups: Dict[str, List[str]]) -> Dict[str, float]:
+    """
+    提取稀疏特征
+
+    Args:
+        text: 规范化后的用户输入
+        keyword_groups: 意图 -> 关键词列表
+
+    Returns:
+        特征名 -> 特征值
+    """
+    features: Dict[str, float] = dict(_ngram_vector(text))
+
+    # 关键词命中特征
+    for intent, keywords in keyword_groups.items():
+        hits = sum(1 for kw in keywords if kw in text)
+        if hits:
+            features[f"kw:{intent}"] = float(min(hits, 3))
+
+    # 结构特征
+    length = len(text)
+    if length < 8:
+        features['len:short'] = 1.0
+    elif length < 20:
+        features['len:medium'] = 1.0
+    else:
+        features['len:long'] = 1.0
+    if '?' in text:
+        features['punct:question'] = 1.0
+    if any(ch.isdigit() for ch in text):
+        features['has_digit'] = 1.0
+
+    features['bias'] = 1.0
+    return features
+
+
+class LocalIntentClassifier:
+    """线性softmax意图分类器(纯Python稀疏实现,单次预测为微秒级)"""
+
+    def __init__(
+        self,
+        classes: List[str],
+        weights: Optional[Dict[str, List[float]]] = None,
+        keyword_groups: Optional[Dict[str, List[str]]] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ):
+        self.classes = list(classes)
+        self.weights: Dict[str, List[float]] = weights or {}
+        self.keyword_groups = keyword_groups or {}
+        self.metadata = metadata or {}
+
+    def _scores(self, features: Dict[str, float]) -> List[float]:
+        scores = [0.0] * len(self.classes)
+        for name, value in features.items():
+            row = self.weights.get(name)
+            if row is None:
+                continue
+            for k in range(len(scores)):
+                scores[k] += row[k] * value
+        return scores
+
+    @staticmethod
+    def _softmax(scores: List[float]) -> List[float]:
+        top = max(scores)
+        exps = [math.exp(s - top) for s in scores]
+        total = sum(exps)
+        return [e / total for e in exps]
+
+    def predict_proba(self, text: str) -> Dict[str, float]:
+        """返回各意图的概率"""
+        features = extract_features(normalize_text(text), self.keyword_groups)
+        probs = self._softmax(self._scores(features))
+        return dict(zip(self.classes, probs))
+
+    def predict(self, text: str) -> Dict[str, Any]:
+        """
+        预测意图
+
+        Returns:
+            与intent_router.classify_intent一致的结果格式
+        """
+        probs = self.predict_proba(text)
+        intent = max(probs, key=probs.get)
+        return {
+            "intent": intent,
+            "confidence": round(probs[intent], 4),
+            "reason": "本地分类器"
+        }
+
+    def fit(
+        self,
+        samples: List[Tuple[str, str]],
+        epochs: int = 15,
+        learning_rate: float = 0.2,
+        l2: float = 1e-4,
+        seed: int = 42
+    ) -> 'LocalIntentClassifier':
+        """
+        使用SGD训练softmax回归
+
+        Args:
+            samples: (input_text, intent) 列表
+            epochs: 训练轮数
+            learning_rate: 初始学习率(按轮次衰减)
+            l2: L2正则系数
+            seed: 随机种子,保证训练可复现
+        """
+        class_index = {c: i for i, c in enumerate(self.classes)}
+        data = [
+            (extract_features(normalize_text(text), self.keyword_groups), class_index[intent])
+            for text, intent in samples
+            if intent in class_index
+        ]
+        if not data:
+            raise ValueError("没有可用的训练样本")
+
+        rng = random.Random(seed)
+        n_classes = len(self.classes)
+        for epoch in range(epochs):
+            rng.shuffle(data)
+            lr = learning_rate / (1 + epoch * 0.5)
+            for features, label in data:
+                probs = self._softmax(self._scores(features))
+                for name, value in features.items():
+                    row = self.weights.get(name)
+                    if row is None:
+                        row = self.weights[name] = [0.0] * n_classes
+                    for k in range(n_classes):
+                        grad = (probs[k] - (1.0 if k == label else 0.0)) * value + l2 * row[k]
+                        row[k] -= lr * grad
+
+        self.metadata.update({
+            'trained_at': datetime.now().isoformat(),
+            'sample_count': len(data)
+        })
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'version': MODEL_VERSION,
+            'classes': self.classes,
+            'keyword_groups': self.keyword_groups,
+            'weights': {
+                name: [round(w, 6) for w in row]
+                for name, row in self.weights.items()
+                if any(abs(w) > 1e-6 for w in row)
+            },
+            'metadata': self.metadata
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'LocalIntentClassifier':
+        if data.get('version') != MODEL_VERSION:
+            raise ValueError(f"不支持的模型版本: {data.get('version')}")
+        return cls(
+            classes=data['classes'],
+            weights=data['weights'],
+            keyword_groups=data.get('keyword_groups', {}),
+            metadata=data.get('metadata', {})
+        )
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        logger.info(f"本地意图分类器已保存: {path} ({len(self.weights)} 个特征)")
+
+    @classmethod
+    def load(cls, path: Path) -> 'LocalIntentClassifier':
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+def get_model_path() -> Path:
+    """获取模型文件路径"""
+    path = Path(settings.INTENT_CLASSIFIER_PATH)
+    return path if path.is_absolute() else BACKEND_DIR / path
+
+
+# 全局分类器缓存(None表示尚未尝试加载, False表示模型文件不可用)
+_local_classifier = None
+
+
+def get_local_classifier() -> Optional[LocalIntentClassifier]:
+    """获取本地分类器(首次调用时从磁盘加载)"""
+    global _local_classifier
+
+    if _local_classifier is None:
+        path = get_model_path()
+        try:
+            _local_classifier = LocalIntentClassifier.load(path)
+            logger.info(
+                f"本地意图分类器加载成功: {path} "
+                f"(样本数: {_local_classifier.metadata.get('sample_count')})"
+            )
+        except FileNotFoundError:
+            logger.info(f"未找到本地意图分类器模型文件: {path},将直接使用LLM分类")
+            _local_classifier = False
+        except Exception as e:
+            logger.warning(f"加载本地意图分类器失败: {e}")
+            _local_classifier = False
+
+    return _local_classifier or None
+
+
+def reload_local_classifier() -> Optional[LocalIntentClassifier]:
+    """重新加载本地分类器(训练脚本写入新模型后调用)"""
+    global _local_classifier
+    _local_classifier = None
+    return get_local_classifier()
@@ -8,21 +8,24 @@ from core.config import settings
 import logging
 import json
 from typing import Dict, Any, Optional
+from services.config_registry import config_registry, config_fingerprint
 
 logger = logging.getLogger(__name__)
 
-# 全局客户端和配置缓存
+# 配置注册表命名空间
+LLM_CONFIG_NAMESPACE = "llm_config"
+
+# 全局客户端缓存: (配置指纹, 客户端), 配置变化时重建
 _llm_client_cache = None
-_llm_config_cache = None
 
 
 async def _get_llm_config() -> Optional[Dict[str, Any]]:
-    """从数据库获取用于意图识别的LLM配置"""
-    global _llm_config_cache
+    """获取用于意图识别的LLM配置(进程内TTL缓存,配置写入时跨worker失效)"""
+    return await config_registry.get(LLM_CONFIG_NAMESPACE, _load_llm_config)
 
-    if _llm_config_cache:
-        return _llm_config_cache
 
+async def _load_llm_config() -> Optional[Dict[str, Any]]:
+    """从数据库加载用于意图识别的LLM配置"""
     try:
         from sqlalchemy import select
         from models.sys_ai_model_config import SysAiModelConfig
@@ -40,30 +43,28 @@ async def _get_llm_config() -> Optional[Dict[str, Any]]:
             config = result.scalar_one_or_none()
 
             if config:
-                _llm_config_cache = {
+                logger.info(f"从数据库加载意图识别模型配置: {config.model_name}")
+                return {
                     'provider': config.provider,
                     'model_name': config.model_name,
                     'api_url': config.api_url,
                     'api_key': config.api_key,
                     'model_params': config.model_params or {}
                 }
-                logger.info(f"从数据库加载意图识别模型配置: {config.model_name}")
-                return _llm_config_cache
 
     except Exception as e:
         logger.warning(f"从数据库加载LLM配置失败: {e}")
 
     # 回退到环境变量配置
     if settings.OPENAI_API_KEY:
-        _llm_config_cache = {
+        logger.info("使用环境变量中的OpenAI配置")
+        return {
             'provider': 'openai',
             'model_name': 'gpt-4o-mini',
             'api_url': 'https://api.openai.com/v1',
             'api_key': settings.OPENAI_API_KEY,
             'model_params': {}
         }
-        logger.info("使用环境变量中的OpenAI配置")
-        return _llm_config_cache
 
     logger.warning("未找到有效的LLM配置,意图识别将使用规则匹配")
     return None
@@ -73,13 +74,14 @@ async def _get_llm_client() -> Optional[AsyncOpenAI]:
     """获取LLM客户端(支持多种API提供商)"""
     global _llm_client_cache
 
-    if _llm_client_cache:
-        return _llm_client_cache
-
     config = await _get_llm_config()
     if not config:
         return None
 
+    fingerprint = config_fingerprint(config)
+    if _llm_client_cache and _llm_client_cache[0] == fingerprint:
+        return _llm_client_cache[1]
+
     try:
         # 根据provider类型处理API URL
         # OpenAI SDK的行为: base_url + endpoint路径
@@ -121,18 +123,36 @@ async def _get_llm_client() -> Optional[AsyncOpenAI]:
             elif not base_url.endswith('/v1') and not base_url.endswith('/api'):
                 base_url = base_url + '/v1'
 
-        _llm_client_cache = AsyncOpenAI(
+        client = AsyncOpenAI(
             api_key=config['api_key'],
             base_url=base_url
         )
+        _llm_client_cache = (fingerprint, client)
         logger.info(f"LLM客户端初始化成功: provider={provider}, base_url={base_url}")
-        return _llm_client_cache
+        return client
 
     except Exception as e:
         logger.error(f"LLM客户端初始化失败: {e}")
         return None
 
 
+async def invalidate_llm_config():
+    """
+    使意图识别的LLM配置缓存失效(本进程及其他worker)
+
+    配置指纹发生变化时同时清除意图分类结果缓存
+    """
+    from services.intent_cache import IntentCacheService
+
+    old_fingerprint = config_fingerprint(await _get_llm_config())
+    await config_registry.invalidate(LLM_CONFIG_NAMESPACE)
+
+    new_fingerprint = config_fingerprint(await _get_llm_config())
+    if new_fingerprint != old_fingerprint:
+        logger.info(f"意图识别LLM配置已变更: {old_fingerprint} -> {new_fingerprint}")
+        await IntentCacheService.clear()
+
+
 # 意图类型定义
 class IntentType:
     CHITCHAT = "chitchat"  # 闲聊
@@ -166,6 +186,17 @@ VIZ_KEYWORDS = [
     'bar', 'line', 'pie', 'scatter'
 ]
 
+# 帮助关键词
+HELP_KEYWORDS = ['帮助', 'help', '怎么用', '如何使用']
+
+# 意图 -> 关键词列表(供本地分类器提取关键词特征)
+KEYWORD_GROUPS = {
+    IntentType.CHITCHAT: CHITCHAT_KEYWORDS,
+    IntentType.QUERY: QUERY_KEYWORDS,
+    IntentType.VISUALIZATION: VIZ_KEYWORDS,
+    IntentType.HELP: HELP_KEYWORDS,
+}
+
 
 async def classify_intent(user_input: str) -> Dict[str, Any]:
     """
@@ -178,34 +209,59 @@ async def classify_intent(user_input: str) -> Dict[str, Any]:
         {
             "intent": "chitchat/query/visualization/help",
             "confidence": 0.9,
-            "reason": "匹配原因"
+            "reason": "匹配原因",
+            "source": "rules/local/cache/llm/rules_fallback/default"
         }
     """
+    from services.intent_classifier import get_local_classifier
+    from services.intent_cache import IntentCacheService
+
     # 首先尝试规则匹配(快速路径)
     rule_result = classify_by_rules(user_input)
     if rule_result and rule_result['confidence'] > 0.8:
         logger.info(f"规则匹配意图: {rule_result['intent']} (confidence: {rule_result['confidence']})")
-        return rule_result
+        return {**rule_result, "source": "rules"}
+
+    # 尝试本地分类器(微秒级),置信度足够时跳过LLM调用
+    local_classifier = get_local_classifier()
+    if local_classifier:
+        try:
+            local_result = local_classifier.predict(user_input)
+            if local_result['confidence'] >= settings.INTENT_CLASSIFIER_THRESHOLD:
+                logger.info(f"本地分类器意图: {local_result['intent']} (confidence: {local_result['confidence']})")
+                return {**local_result, "source": "local"}
+            logger.debug(f"本地分类器置信度不足({local_result['confidence']}),回退到LLM")
+        except Exception as e:
+            logger.warning(f"本地意图分类失败: {e}")
 
     # 尝试使用LLM分类(从数据库读取配置)
     llm_client = await _get_llm_client()
     if llm_client:
+        # 先查Redis缓存,相同问题(规范化后)不重复调用LLM
+        fingerprint = config_fingerprint(await _get_llm_config())
+        cached_result = await IntentCacheService.get(user_input, fingerprint)
+        if cached_result:
+            logger.info(f"意图缓存命中: {cached_result['intent']} (confidence: {cached_result['confidence']})")
+            return {**cached_result, "source": "cache"}
+
         try:
             llm_result = await classify_by_llm(user_input, llm_client)
             logger.info(f"LLM分类意图: {llm_result['intent']} (confidence: {llm_result['confidence']})")
-            return llm_result
+            await IntentCacheService.set(user_input, fingerprint, llm_result)
+            return {**llm_result, "source": "llm"}
         except Exception as e:
             logger.warning(f"LLM意图分类失败,回退到规则匹配: {e}")
 
-    # 回退到规则匹配
+    # 回退到规则匹配(低置信度的猜测, 单独标记来源, 不作为分类器训练数据)
     if rule_result:
-        return rule_result
+        return {**rule_result, "source": "rules_fallback"}
 
     # 默认返回query意图
     return {
         "intent": IntentType.QUERY,
         "confidence": 0.5,
-        "reason": "默认query意图"
+        "reason": "默认query意图",
+        "source": "default"
     }
 
 
@@ -231,7 +287,7 @@ def classify_by_rules(user_input: str) -> Dict[str, Any]:
         }
 
     # 检查帮助
-    if any(kw in user_input_lower for kw in ['帮助', 'help', '怎么用', '如何使用']):
+    if any(kw in user_input_lower for kw in HELP_KEYWORDS):
         return {
             "intent": IntentType.HELP,
             "confidence": 0.9,
@@ -0,0 +1,511 @@
+"""
+基于Redis的后台任务队列
+
+数据集解析、分片、向量化等耗时任务不再作为 FastAPI BackgroundTasks 在API进程中执行,
+而是写入Redis队列,由独立的worker进程(job_worker.py)消费:
+    - 按任务类型分队列,队列内按优先级(数值越小越优先)和入队时间排序
+    - 每种任务类型的全局并发上限(所有worker进程合计, JOB_CONCURRENCY)
+    - 失败后按指数退避重试,超过最大次数后标记为failed
+    - 执行中的任务持有租约并定期续租; worker崩溃或重启后租约过期,任务重新入队
+    - 每次取出任务生成新的租约标识, 续租失败(租约已过期被重新入队)的worker放弃执行, 避免同一任务被执行两次
+    - 任务状态保存在Redis哈希中,可按任务ID或数据集ID查询
+
+Redis键:
+    job:{id}                 任务详情(哈希)
+    job_queue:{type}         待执行任务(有序集合, score=优先级+入队时间)
+    job_running:{type}       执行中任务(有序集合, score=租约到期时间)
+    job_delayed:{type}       等待重试的任务(有序集合, score=可执行时间)
+    job_dataset:{dataset_id} 数据集相关的任务ID(列表,最新在前)
+
+本地开发可将 JOB_QUEUE_REDIS_URL 设为 memory:// 使用进程内的fakeredis替代Redis
+(需要 pip install "fakeredis[lua]",并设置 JOB_WORKER_EMBEDDED=true 在API进程内消费)
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import redis.asyncio as aioredis
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_RETRYING = "retrying"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+# 优先级(数值越小越优先)
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 9
+
+# 优先级权重,保证不同优先级的score区间不重叠(毫秒时间戳约为1.7e12)
+_PRIORITY_WEIGHT = 10 ** 13
+
+# 每个数据集保留的任务记录数
+_DATASET_JOB_HISTORY = 20
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class JobLeaseLost(Exception):
+    """任务租约已失效(过期后被重新入队或已由其他worker完成), 当前worker放弃执行"""
+
+
+def create_job_redis(url: str):
+    """创建任务队列使用的Redis客户端, memory:// 使用fakeredis(仅限本地开发)"""
+    if url.startswith("memory://"):
+        try:
+            from fakeredis import aioredis as fake_aioredis
+        except ImportError as e:
+            raise RuntimeError('JOB_QUEUE_REDIS_URL=memory:// 需要安装 fakeredis: pip install "fakeredis[lua]"') from e
+        return fake_aioredis.FakeRedis()
+    return aioredis.from_url(url)
+
+
+def parse_concurrency(spec: str) -> Dict[str, int]:
+    """解析并发配置,如 "parse=2,chunk=2,vectorize=2" """
+    limits = {}
+    for item in spec.split(","):
+        if "=" in item:
+            job_type, limit = item.split("=", 1)
+            limits[job_type.strip()] = int(limit)
+    return limits
+
+
+class JobQueue:
+    """Redis任务队列"""
+
+    JOB_KEY_PREFIX = "job:"
+
+    # 取出优先级最高的任务并登记租约(达到全局并发上限时不取)
+    _DEQUEUE_SCRIPT = """
+    local limit = tonumber(ARGV[1])
+    if limit > 0 and redis.call('ZCARD', KEYS[2]) >= limit then
+        return false
+    end
+    local popped = redis.call('ZPOPMIN', KEYS[1])
+    if #popped == 0 then
+        return false
+    end
+    local id = popped[1]
+    local key = ARGV[4] .. id
+    redis.call('ZADD', KEYS[2], ARGV[2], id)
+    redis.call('HSET', key, 'status', 'running', 'started_at', ARGV[3], 'updated_at', ARGV[3], 'lease', ARGV[5])
+    redis.call('HINCRBY', key, 'attempts', 1)
+    return id
+    """
+
+    # 续租: 租约标识一致且仍在执行中集合时延长租约, 返回1; 否则返回0
+    _HEARTBEAT_SCRIPT = """
+    if redis.call('HGET', KEYS[2], 'lease') ~= ARGV[2] or not redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+        return 0
+    end
+    redis.call('ZADD', KEYS[1], 'XX', ARGV[3], ARGV[1])
+    return 1
+    """
+
+    # 到期的重试任务和租约过期的任务重新入队(清除租约标识, 原worker续租时发现租约丢失)
+    _MAINTAIN_SCRIPT = """
+    local moved = 0
+    local function requeue(id, reason)
+        local key = ARGV[2] .. id
+        local score = redis.call('HGET', key, 'score')
+        redis.call('HDEL', key, 'lease')
+        if score then
+            redis.call('ZADD', KEYS[1], score, id)
+            redis.call('HSET', key, 'status', 'queued', 'updated_at', ARGV[1])
+            if reason ~= '' then
+                redis.call('HSET', key, 'error', reason)
+            end
+            moved = moved + 1
+        end
+    end
+    for _, id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', ARGV[1])) do
+        redis.call('ZREM', KEYS[3], id)
+        requeue(id, '')
+    end
+    for _, id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])) do
+        redis.call('ZREM', KEYS[2], id)
+        local key = ARGV[2] .. id
+        local attempts = tonumber(redis.call('HGET', key, 'attempts') or '0')
+        local max_attempts = tonumber(redis.call('HGET', key, 'max_attempts') or '0')
+        if attempts >= max_attempts then
+            -- 反复导致worker崩溃的任务不再重新入队
+            redis.call('HSET', key, 'status', 'failed', 'error', 'worker租约过期且已达到最大执行次数',
+                       'finished_at', ARGV[1], 'updated_at', ARGV[1])
+            redis.call('EXPIRE', key, ARGV[3])
+        else
+            requeue(id, 'worker租约过期,任务已重新入队')
+        end
+    end
+    return moved
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        concurrency: Dict[str, int],
+        max_attempts: int,
+        retry_backoff: float,
+        lease_seconds: int,
+        result_ttl: int
+    ):
+        self.redis = redis_client
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.lease_seconds = lease_seconds
+        self.result_ttl = result_ttl
+        self._dequeue_script = redis_client.register_script(self._DEQUEUE_SCRIPT)
+        self._heartbeat_script = redis_client.register_script(self._HEARTBEAT_SCRIPT)
+        self._maintain_script = redis_client.register_script(self._MAINTAIN_SCRIPT)
+
+    @staticmethod
+    def _queue_key(job_type: str) -> str:
+        return f"job_queue:{job_type}"
+
+    @staticmethod
+    def _running_key(job_type: str) -> str:
+        return f"job_running:{job_type}"
+
+    @staticmethod
+    def _delayed_key(job_type: str) -> str:
+        return f"job_delayed:{job_type}"
+
+    @staticmethod
+    def _dataset_key(dataset_id: str) -> str:
+        return f"job_dataset:{dataset_id}"
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self.JOB_KEY_PREFIX}{job_id}"
+
+    async def enqueue(
+        self,
+        job_type: str,
+        payload: Dict[str, Any],
+        priority: int = PRIORITY_NORMAL,
+        dataset_id: Optional[str] = None,
+        max_attempts: Optional[int] = None
+    ) -> str:
+        """
+        提交任务
+
+        Args:
+            job_type: 任务类型, 如 parse / chunk / vectorize / embedding
+            payload: 任务参数(需可JSON序列化)
+            priority: 优先级, 数值越小越优先
+            dataset_id: 关联的数据集ID(用于按数据集查询任务状态)
+            max_attempts: 最大执行次数(默认 JOB_MAX_ATTEMPTS)
+
+        Returns:
+            任务ID
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        score = priority * _PRIORITY_WEIGHT + int(now * 1000)
+        job = {
+            "id": job_id,
+            "type": job_type,
+            "payload": json.dumps(payload, ensure_ascii=False),
+            "priority": priority,
+            "score": score,
+            "status": JOB_QUEUED,
+            "attempts": 0,
+            "max_attempts": max_attempts or self.max_attempts,
+            "dataset_id": dataset_id or "",
+            "error": "",
+            "created_at": now,
+            "updated_at": now,
+        }
+
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hset(self._job_key(job_id), mapping=job)
+        pipe.zadd(self._queue_key(job_type), {job_id: score})
+        if dataset_id:
+            pipe.lpush(self._dataset_key(dataset_id), job_id)
+            pipe.ltrim(self._dataset_key(dataset_id), 0, _DATASET_JOB_HISTORY - 1)
+            pipe.expire(self._dataset_key(dataset_id), self.result_ttl)
+        await pipe.execute()
+
+        logger.info(f"任务已入队: {job_type} {job_id} (优先级 {priority}, 数据集 {dataset_id})")
+        return job_id
+
+    async def dequeue(self, job_type: str) -> Optional[Dict[str, Any]]:
+        """取出一个待执行任务(达到并发上限或队列为空时返回None)"""
+        now = time.time()
+        job_id = await self._dequeue_script(
+            keys=[self._queue_key(job_type), self._running_key(job_type)],
+            args=[
+                self.concurrency.get(job_type, 0), now + self.lease_seconds, now, self.JOB_KEY_PREFIX,
+                uuid.uuid4().hex
+            ]
+        )
+        if not job_id:
+            return None
+        return await self.get_job(job_id.decode() if isinstance(job_id, bytes) else job_id)
+
+    async def heartbeat(self, job: Dict[str, Any]) -> bool:
+        """
+        续租(执行时间较长的任务定期调用)
+
+        Returns:
+            租约是否仍然有效; False 表示租约已过期被重新入队(或任务已结束), 当前worker应放弃执行
+        """
+        renewed = await self._heartbeat_script(
+            keys=[self._running_key(job["type"]), self._job_key(job["id"])],
+            args=[job["id"], job.get("lease", ""), time.time() + self.lease_seconds]
+        )
+        return bool(renewed)
+
+    def _remove_from_queues(self, pipe, job: Dict[str, Any]):
+        """从执行中、待执行、等待重试集合中移除任务(租约过期后被重新入队的副本一并移除)"""
+        pipe.zrem(self._running_key(job["type"]), job["id"])
+        pipe.zrem(self._queue_key(job["type"]), job["id"])
+        pipe.zrem(self._delayed_key(job["type"]), job["id"])
+        pipe.hdel(self._job_key(job["id"]), "lease")
+
+    async def complete(self, job: Dict[str, Any]):
+        """标记任务完成"""
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=True)
+        self._remove_from_queues(pipe, job)
+        pipe.hset(self._job_key(job["id"]), mapping={
+            "status": JOB_COMPLETED,
+            "error": "",
+            "finished_at": now,
+            "updated_at": now,
+        })
+        pipe.expire(self._job_key(job["id"]), self.result_ttl)
+        await pipe.execute()
+
+    async def fail(self, job: Dict[str, Any], error: str) -> bool:
+        """
+        标记任务失败, 未超过最大次数时按指数退避安排重试
+
+        Returns:
+            是否会重试
+        """
+        now = time.time()
+        attempts = job["attempts"]
+        retry = attempts < job["max_attempts"]
+
+        pipe = self.redis.pipeline(transaction=True)
+        self._remove_from_queues(pipe, job)
+        if retry:
+            delay = self.retry_backoff * (2 ** (attempts - 1))
+            pipe.zadd(self._delayed_key(job["type"]), {job["id"]: now + delay})
+            pipe.hset(self._job_key(job["id"]), mapping={
+                "status": JOB_RETRYING,
+                "error": error,
+                "retry_at": now + delay,
+                "updated_at": now,
+            })
+        else:
+            pipe.hset(self._job_key(job["id"]), mapping={
+                "status": JOB_FAILED,
+                "error": error,
+                "finished_at": now,
+                "updated_at": now,
+            })
+            pipe.expire(self._job_key(job["id"]), self.result_ttl)
+        await pipe.execute()
+        return retry
+
+    async def release(self, job: Dict[str, Any]):
+        """worker关闭时把未完成的任务放回队列(不计入重试次数)"""
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.zrem(self._running_key(job["type"]), job["id"])
+        pipe.zadd(self._queue_key(job["type"]), {job["id"]: job["score"]})
+        pipe.hdel(self._job_key(job["id"]), "lease")
+        pipe.hincrby(self._job_key(job["id"]), "attempts", -1)
+        pipe.hset(self._job_key(job["id"]), mapping={"status": JOB_QUEUED, "updated_at": time.time()})
+        await pipe.execute()
+
+    async def maintain(self, job_types: List[str]) -> int:
+        """到期重试任务和租约过期任务重新入队, 返回移动的任务数"""
+        moved = 0
+        now = time.time()
+        for job_type in job_types:
+            moved += await self._maintain_script(
+                keys=[self._queue_key(job_type), self._running_key(job_type), self._delayed_key(job_type)],
+                args=[now, self.JOB_KEY_PREFIX, self.result_ttl]
+            )
+        return moved
+
+    @staticmethod
+    def _decode_job(raw: Dict[bytes, bytes]) -> Dict[str, Any]:
+        job = {k.decode(): v.decode() for k, v in raw.items()}
+        job["payload"] = json.loads(job.get("payload") or "{}")
+        for field in ("priority", "attempts", "max_attempts"):
+            job[field] = int(job.get(field) or 0)
+        for field in ("score", "created_at", "updated_at", "started_at", "finished_at", "retry_at"):
+            if job.get(field):
+                job[field] = float(job[field])
+        return job
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """获取任务详情"""
+        raw = await self.redis.hgetall(self._job_key(job_id))
+        return self._decode_job(raw) if raw else None
+
+    async def get_dataset_jobs(self, dataset_id: str) -> List[Dict[str, Any]]:
+        """获取数据集相关的任务(最新在前)"""
+        job_ids = await self.redis.lrange(self._dataset_key(dataset_id), 0, -1)
+        if not job_ids:
+            return []
+        pipe = self.redis.pipeline(transaction=False)
+        for job_id in job_ids:
+            pipe.hgetall(self._job_key(job_id.decode()))
+        return [self._decode_job(raw) for raw in await pipe.execute() if raw]
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """各任务类型的排队/执行/等待重试数量"""
+        pipe = self.redis.pipeline(transaction=False)
+        job_types = list(self.concurrency)
+        for job_type in job_types:
+            pipe.zcard(self._queue_key(job_type))
+            pipe.zcard(self._running_key(job_type))
+            pipe.zcard(self._delayed_key(job_type))
+        counts = await pipe.execute()
+        return {
+            job_type: {
+                "queued": counts[i * 3],
+                "running": counts[i * 3 + 1],
+                "retrying": counts[i * 3 + 2],
+                "concurrency": self.concurrency[job_type],
+            }
+            for i, job_type in enumerate(job_types)
+        }
+
+    async def close(self):
+        await self.redis.close()
+
+
+class JobWorker:
+    """
+    任务消费者
+
+    每种任务类型启动 concurrency 个消费协程, 另有一个维护协程负责重试任务和过期租约
+    """
+
+    def __init__(self, queue: JobQueue, handlers: Dict[str, JobHandler], job_types: Optional[List[str]] = None):
+        self.queue = queue
+        self.handlers = handlers
+        self.job_types = [t for t in (job_types or list(handlers)) if t in handlers]
+        self._tasks: List[asyncio.Task] = []
+        self._running: Dict[str, Dict[str, Any]] = {}
+        self._stopping = asyncio.Event()
+
+    async def _execute(self, job: Dict[str, Any]):
+        """
+        执行任务并定期续租
+
+        Raises:
+            JobLeaseLost: 租约已失效, 任务已被取消(由重新入队后取得租约的worker执行)
+        """
+        handler = asyncio.create_task(self.handlers[job["type"]](job["payload"]))
+        interval = max(self.queue.lease_seconds / 3, 1)
+        try:
+            while True:
+                done, _ = await asyncio.wait({handler}, timeout=interval)
+                if done:
+                    return handler.result()
+                try:
+                    alive = await self.queue.heartbeat(job)
+                except Exception as e:
+                    logger.warning(f"任务续租失败: {job['type']} {job['id']}, {e}")
+                    continue
+                if not alive:
+                    raise JobLeaseLost(f"任务租约已失效: {job['type']} {job['id']}")
+        finally:
+            if not handler.done():
+                handler.cancel()
+                await asyncio.gather(handler, return_exceptions=True)
+
+    async def _consume(self, job_type: str):
+        idle = settings.JOB_POLL_INTERVAL
+        while not self._stopping.is_set():
+            try:
+                job = await self.queue.dequeue(job_type)
+            except Exception as e:
+                logger.warning(f"获取任务失败: {job_type}, {e}")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=idle)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._running[job["id"]] = job
+            logger.info(f"开始执行任务: {job_type} {job['id']} (第 {job['attempts']} 次)")
+            try:
+                await self._execute(job)
+                await self.queue.complete(job)
+                logger.info(f"任务完成: {job_type} {job['id']}")
+            except JobLeaseLost as e:
+                # 任务已重新入队, 不标记完成/失败, 也不放回队列
+                logger.warning(f"{e}, 放弃执行")
+            except asyncio.CancelledError:
+                await self.queue.release(job)
+                raise
+            except Exception as e:
+                retry = await self.queue.fail(job, str(e))
+                logger.error(f"任务失败: {job_type} {job['id']}, {'稍后重试' if retry else '不再重试'}: {e}")
+            finally:
+                self._running.pop(job["id"], None)
+
+    async def _maintain(self):
+        while not self._stopping.is_set():
+            try:
+                moved = await self.queue.maintain(self.job_types)
+                if moved:
+                    logger.info(f"{moved} 个任务重新入队")
+            except Exception as e:
+                logger.warning(f"任务队列维护失败: {e}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=1)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        """在当前事件循环中启动消费"""
+        if self._tasks:
+            return
+        self._stopping.clear()
+        for job_type in self.job_types:
+            for _ in range(max(self.queue.concurrency.get(job_type, 1), 1)):
+                self._tasks.append(asyncio.create_task(self._consume(job_type)))
+        self._tasks.append(asyncio.create_task(self._maintain()))
+        logger.info(f"任务worker已启动: {', '.join(f'{t}x{self.queue.concurrency.get(t, 1)}' for t in self.job_types)}")
+
+    async def stop(self, timeout: float = 30):
+        """停止接收新任务,等待执行中的任务完成; 超时后取消并放回队列"""
+        self._stopping.set()
+        if not self._tasks:
+            return
+        done, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+        logger.info("任务worker已停止")
+
+
+# 全局任务队列实例
+job_queue = JobQueue(
+    create_job_redis(settings.JOB_QUEUE_REDIS_URL),
+    concurrency=parse_concurrency(settings.JOB_CONCURRENCY),
+    max_attempts=settings.JOB_MAX_ATTEMPTS,
+    retry_backoff=settings.JOB_RETRY_BACKOFF,
+    lease_seconds=settings.JOB_LEASE_SECONDS,
+    result_ttl=settings.JOB_RESULT_TTL
+)
@@ -8,6 +8,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from models.sys_ai_model_config import SysAiModelConfig
 from api.dependencies.dependencies import redis_client
+from services.config_registry import config_registry
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +18,7 @@ class ModelCacheService:
 
     CACHE_KEY_PREFIX = "user_selected_model"
     CACHE_EXPIRE_SECONDS = 3600 * 24  # 24小时过期
+    REGISTRY_NAMESPACE = "user_model"
 
     @staticmethod
     def _get_cache_key(user_id: int) -> str:
@@ -92,6 +94,36 @@ class ModelCacheService:
             logger.error(f"获取用户{user_id}的模型配置失败: {e}")
             return None
 
+    @classmethod
+    async def get_cached_user_model(cls, user_id: int) -> Optional[Dict[str, Any]]:
+        """
+        获取用户选择的AI模型配置(热路径使用)
+
+        优先命中进程内配置注册表,过期或失效后才访问Redis/数据库
+
+        Args:
+            user_id: 用户ID
+
+        Returns:
+            模型配置字典
+        """
+        async def load():
+            from db.session import async_session
+            async with async_session() as db:
+                return await cls.get_user_selected_model(user_id=user_id, db=db)
+
+        return await config_registry.get(
+            cls.REGISTRY_NAMESPACE,
+            load,
+            key=str(user_id),
+            cache_none=False
+        )
+
+    @classmethod
+    async def invalidate_user_model(cls, user_id: int):
+        """使用户模型配置的进程内缓存失效(本进程及其他worker)"""
+        await config_registry.invalidate(cls.REGISTRY_NAMESPACE, str(user_id))
+
     @classmethod
     async def set_user_selected_model(
         cls,
@@ -173,8 +205,9 @@ class ModelCacheService:
                 'is_default': config_obj.is_default
             }
 
-            # 3. 更新到Redis
+            # 3. 更新到Redis,并通知所有worker刷新进程内缓存
             await cls.set_user_selected_model(user_id, model_config)
+            await cls.invalidate_user_model(user_id)
 
             logger.info(f"用户{user_id}切换到模型: {model_config['config_name']}")
             return model_config
@@ -198,9 +231,53 @@ class ModelCacheService:
 
         try:
             await redis_client.delete(cache_key)
+            await cls.invalidate_user_model(user_id)
             logger.info(f"已清除用户{user_id}的模型缓存")
             return True
 
         except Exception as e:
             logger.error(f"清除用户{user_id}的模型缓存失败: {e}")
             return False
+
+    @classmethod
+    async def sync_model_change(
+        cls,
+        user_id: int,
+        model_id: int,
+        db: AsyncSession,
+        deleted: bool = False
+    ) -> bool:
+        """
+        模型配置被修改或删除后同步用户的模型缓存
+
+        如果用户当前选择的正是该模型,则刷新(或清除)Redis缓存;
+        否则只使进程内缓存失效(默认模型可能已变化)
+
+        Args:
+            user_id: 用户ID
+            model_id: 被修改的模型配置ID
+            db: 数据库会话
+            deleted: 是否为删除操作
+
+        Returns:
+            是否同步成功
+        """
+        try:
+            cached_data = await redis_client.get(cls._get_cache_key(user_id))
+            selected_id = json.loads(cached_data).get('id') if cached_data else None
+
+            if selected_id == model_id:
+                if deleted:
+                    return await cls.clear_user_model_cache(user_id)
+                refreshed = await cls.update_user_selected_model(user_id, model_id, db)
+                if refreshed:
+                    return True
+                # 模型已停用,回退到默认模型
+                return await cls.clear_user_model_cache(user_id)
+
+            await cls.invalidate_user_model(user_id)
+            return True
+
+        except Exception as e:
+            logger.error(f"同步用户{user_id}的模型缓存失败: {e}")
+            return False
@@ -299,7 +299,8 @@ SELECT ...
 
 async def query_multiple_datasets(
     dataset_ids: List[str],
-    sql_queries: Dict[str, str]
+    sql_queries: Dict[str, str],
+    user_query: Optional[str] = None
 ) -> Optional[pd.DataFrame]:
     """
     查询多个数据集并合并结果
@@ -307,6 +308,7 @@ async def query_multiple_datasets(
     Args:
         dataset_ids: 数据集ID列表
         sql_queries: 数据集ID到SQL查询的映射
+        user_query: 用户问题(记录查询用)
 
     Returns:
         合并后的DataFrame，如果所有查询都失败则返回None
@@ -320,7 +322,7 @@ async def query_multiple_datasets(
             continue
 
         try:
-            df = await query_parquet_with_duckdb(dataset_id, sql_query)
+            df = await query_parquet_with_duckdb(dataset_id, sql_query, question=user_query)
             if df is not None and not df.empty:
                 # 添加数据集来源列
                 df['_source_dataset'] = dataset_id
@@ -416,7 +418,7 @@ async def smart_multi_dataset_query(
         return None, "无法生成查询语句"
 
     # 步骤4: 执行查询并合并结果
-    df = await query_multiple_datasets(selected_ids, sql_queries)
+    df = await query_multiple_datasets(selected_ids, sql_queries, user_query)
 
     # 构建数据源描述
     dataset_names = [ds['logical_name'] for ds in selected_metadata]
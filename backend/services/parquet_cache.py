@@ -0,0 +1,114 @@
+"""
+Parquet本地磁盘缓存
+
+预览和DuckDB查询都需要本地Parquet文件, 每次从MinIO下载的代价与文件大小成正比。
+本地缓存按 (对象名, ETag) 保存文件:
+    - 对象被覆盖(ETag变化)后自动使用新文件, 旧文件随淘汰清理
+    - 同一文件的并发请求只下载一次(进程内single-flight)
+    - 总大小超过 PARQUET_CACHE_MAX_BYTES 时按最近访问时间淘汰; 最近 EVICT_GRACE_SECONDS 秒内访问过或正在下载的文件不淘汰,
+      避免刚返回给调用方、尚未被DuckDB/pyarrow打开的文件被删除
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from typing import Dict, Set
+
+from core.config import settings
+from core.minio_client import async_minio
+
+logger = logging.getLogger(__name__)
+
+# 最近访问过的文件在这段时间内不淘汰(秒)
+EVICT_GRACE_SECONDS = 60
+
+
+class ParquetCache:
+    """Parquet文件本地缓存"""
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def _path(self, object_name: str, etag: str) -> str:
+        key = hashlib.sha1(f"{object_name}:{etag}".encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.parquet")
+
+    async def get_path(self, object_name: str) -> str:
+        """
+        获取对象的本地文件路径(不存在时下载)
+
+        Raises:
+            FileNotFoundError: MinIO中不存在该对象
+        """
+        stat = await async_minio.stat(object_name)
+        if stat is None:
+            raise FileNotFoundError(f"Parquet文件不存在: {object_name}")
+
+        path = self._path(object_name, stat.etag)
+        try:
+            os.utime(path)
+            return path
+        except FileNotFoundError:
+            # 未缓存或刚被淘汰, 重新下载
+            pass
+
+        lock = self._locks.setdefault(path, asyncio.Lock())
+        try:
+            async with lock:
+                # 等待期间其他请求可能已下载完成
+                if os.path.exists(path):
+                    return path
+                os.makedirs(self.cache_dir, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+                os.close(fd)
+                try:
+                    await async_minio.download_to_file(object_name, tmp_path)
+                    os.replace(tmp_path, path)
+                except BaseException:
+                    if os.path.exists(tmp_path):
+                        os.unlink(tmp_path)
+                    raise
+                logger.info(f"Parquet文件已缓存: {object_name} -> {path} ({stat.size} 字节)")
+        finally:
+            if not lock.locked():
+                self._locks.pop(path, None)
+
+        await asyncio.to_thread(self._evict, path, set(self._locks))
+        return path
+
+    def _evict(self, keep: str, in_flight: Set[str]):
+        """总大小超过上限时按最近访问时间淘汰(跳过最近访问过和正在下载的文件)"""
+        entries = []
+        protected = 0
+        recent = time.time() - EVICT_GRACE_SECONDS
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".parquet"):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.path == keep or entry.path in in_flight or st.st_mtime >= recent:
+                    protected += st.st_size
+                else:
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries) + protected
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+
+
+# 全局Parquet缓存实例
+parquet_cache = ParquetCache(
+    cache_dir=settings.PARQUET_CACHE_DIR or os.path.join(tempfile.gettempdir(), "chatbi_parquet_cache"),
+    max_bytes=settings.PARQUET_CACHE_MAX_BYTES
+)
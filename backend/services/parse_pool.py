@@ -0,0 +1,88 @@
+"""
+数据集解析进程池
+
+文件解析、类型推断、Parquet编码都是pandas/pyarrow的CPU密集型工作,放在独立进程中执行:
+    - 不阻塞事件循环(API进程或任务worker进程保持响应)
+    - 多个数据集同时解析时利用所有CPU核心(文件级并行)
+    - 宽表按列分批,在多个子进程中并行推断Schema(列级并行)
+
+子进程使用 spawn 方式启动(不继承父进程的连接池和事件循环),
+PARSE_MEMORY_LIMIT_MB > 0 时限制每个子进程的地址空间,超出时该次解析失败而不会拖垮整台机器
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def pool_size() -> int:
+    """解析进程数(PARSE_POOL_WORKERS=0 时等于CPU核数)"""
+    return settings.PARSE_POOL_WORKERS or os.cpu_count() or 1
+
+
+def _init_worker(memory_limit_mb: int):
+    """子进程初始化: 设置内存上限"""
+    if memory_limit_mb <= 0:
+        return
+    try:
+        import resource
+    except ImportError:
+        # Windows不支持resource模块
+        return
+    limit = memory_limit_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """获取进程池(首次使用时创建)"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=pool_size(),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(settings.PARSE_MEMORY_LIMIT_MB,)
+        )
+        logger.info(f"解析进程池已创建: {pool_size()} 个进程, 内存上限 {settings.PARSE_MEMORY_LIMIT_MB or '不限'} MB")
+    return _executor
+
+
+def _reset_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def run_in_pool(func: Callable[..., Any], *args) -> Any:
+    """
+    在解析进程池中执行函数(函数和参数需可pickle)
+
+    子进程超出内存上限时抛出 MemoryError; 子进程被系统杀死时重建进程池并抛出 RuntimeError
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(get_executor(), func, *args)
+    except MemoryError:
+        raise MemoryError(f"解析超出内存上限({settings.PARSE_MEMORY_LIMIT_MB} MB),请拆分文件后重试")
+    except BrokenProcessPool:
+        logger.error("解析子进程异常退出,重建进程池")
+        _reset_executor()
+        raise RuntimeError("解析子进程异常退出(可能超出系统内存)")
+
+
+def shutdown():
+    """关闭进程池(应用或worker退出时调用)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
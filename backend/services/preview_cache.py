@@ -0,0 +1,117 @@
+"""
+文档预览结果缓存
+
+PDF、演示文稿、文本、图片等文档的预览结果按 (对象名, ETag, 预览方法, 页码/行数) 缓存在MinIO中:
+    previews/{对象名哈希}/{ETag+方法+页码/行数 哈希}.json
+    - 原文件被覆盖后ETag变化, 自动生成新的预览
+    - 多页文档按页缓存, 某一页首次被访问时才生成
+    - 同一预览的并发请求只生成一次: 进程内共享同一个生成任务, 跨进程使用Redis锁,
+      未拿到锁的请求等待持有者写入结果(超过 PREVIEW_LOCK_TIMEOUT 秒后自行生成)
+    - 删除数据集时按对象名前缀清理
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import orjson
+
+from api.dependencies.dependencies import redis_client
+from core.config import settings
+from core.minio_client import async_minio
+from services.result_encoding import dumps
+
+logger = logging.getLogger(__name__)
+
+
+class PreviewCache:
+    """文档预览结果缓存"""
+
+    OBJECT_PREFIX = "previews"
+    LOCK_PREFIX = "preview_lock:"
+    POLL_INTERVAL = 0.2
+
+    def __init__(self, lock_timeout: int):
+        self.lock_timeout = lock_timeout
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def object_prefix(self, object_name: str) -> str:
+        """某个原文件的所有预览结果所在前缀"""
+        return f"{self.OBJECT_PREFIX}/{hashlib.sha1(object_name.encode('utf-8')).hexdigest()}/"
+
+    def preview_key(self, object_name: str, etag: str, method: str, **params) -> str:
+        """预览结果的对象名"""
+        variant = ":".join([etag, method] + [f"{k}={params[k]}" for k in sorted(params)])
+        return f"{self.object_prefix(object_name)}{hashlib.sha1(variant.encode('utf-8')).hexdigest()}.json"
+
+    async def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        if await async_minio.stat(key) is None:
+            return None
+        return orjson.loads(await async_minio.download_file(key))
+
+    async def get_or_create(
+        self,
+        key: str,
+        generate: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """
+        读取缓存的预览结果, 不存在时调用 generate 生成并保存
+
+        Returns:
+            预览结果(额外带 cached 字段表示是否命中缓存)
+        """
+        cached = await self._load(key)
+        if cached is not None:
+            return {**cached, "cached": True}
+
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._generate(key, generate))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: 单个请求断开时不取消其他请求共享的生成任务
+        return await asyncio.shield(future)
+
+    async def _generate(
+        self,
+        key: str,
+        generate: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        lock_key = f"{self.LOCK_PREFIX}{key}"
+        locked = await redis_client.set(lock_key, 1, nx=True, ex=self.lock_timeout)
+
+        if not locked:
+            # 其他进程正在生成, 等待结果
+            deadline = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                await asyncio.sleep(self.POLL_INTERVAL)
+                cached = await self._load(key)
+                if cached is not None:
+                    return {**cached, "cached": True}
+                if not await redis_client.exists(lock_key):
+                    break
+            logger.warning(f"等待预览生成超时或生成失败, 当前请求自行生成: {key}")
+
+        try:
+            result = await generate()
+            try:
+                await async_minio.upload_file(dumps(result), key, "application/json")
+            except Exception as e:
+                # 缓存写入失败不影响本次预览
+                logger.warning(f"保存预览缓存失败: {key}: {e}")
+            return {**result, "cached": False}
+        finally:
+            if locked:
+                await redis_client.delete(lock_key)
+
+    async def delete_for_object(self, object_name: str) -> int:
+        """删除原文件的所有预览结果"""
+        files = await async_minio.list_files(self.object_prefix(object_name))
+        if files:
+            await async_minio.delete_files([f['name'] for f in files])
+        return len(files)
+
+
+# 全局预览缓存实例
+preview_cache = PreviewCache(lock_timeout=settings.PREVIEW_LOCK_TIMEOUT)
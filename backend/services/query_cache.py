@@ -0,0 +1,64 @@
+"""
+数据集查询结果缓存
+
+按 (数据集ID, 数据版本, SQL, LIMIT) 缓存DuckDB查询结果(Arrow IPC, 与 result_store 相同的序列化格式)。
+数据集追加数据后版本递增, 旧版本的缓存不再命中, 到期后由Redis自动清理
+"""
+import asyncio
+import hashlib
+import logging
+from typing import Optional
+
+import pandas as pd
+
+from api.dependencies.dependencies import redis_client
+from core.config import settings
+from services.result_store import deserialize_dataframe, serialize_dataframe
+
+logger = logging.getLogger(__name__)
+
+
+class DatasetQueryCache:
+    """数据集查询结果缓存"""
+
+    CACHE_KEY_PREFIX = "dataset_query"
+
+    def __init__(self, ttl: int, max_item_bytes: int):
+        self.ttl = ttl
+        self.max_item_bytes = max_item_bytes
+
+    def _cache_key(self, dataset_id: str, version: int, sql: str, limit: Optional[int]) -> str:
+        sql_hash = hashlib.sha1(f"{sql}\0{limit}".encode('utf-8')).hexdigest()
+        return f"{self.CACHE_KEY_PREFIX}:{dataset_id}:{version}:{sql_hash}"
+
+    async def get(self, dataset_id: str, version: int, sql: str, limit: Optional[int]) -> Optional[pd.DataFrame]:
+        """读取缓存的查询结果, 未命中返回None"""
+        if self.ttl <= 0:
+            return None
+        try:
+            payload = await redis_client.get(self._cache_key(dataset_id, version, sql, limit))
+        except Exception as e:
+            logger.warning(f"读取查询缓存失败: {e}")
+            return None
+        if payload is None:
+            return None
+        return await asyncio.to_thread(deserialize_dataframe, payload)
+
+    async def set(self, dataset_id: str, version: int, sql: str, limit: Optional[int], df: pd.DataFrame):
+        """缓存查询结果(超过单项上限的结果不缓存)"""
+        if self.ttl <= 0:
+            return
+        try:
+            payload = await asyncio.to_thread(serialize_dataframe, df)
+            if len(payload) > self.max_item_bytes:
+                return
+            await redis_client.set(self._cache_key(dataset_id, version, sql, limit), payload, ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"写入查询缓存失败: {e}")
+
+
+# 全局单例
+query_cache = DatasetQueryCache(
+    ttl=settings.DATASET_QUERY_CACHE_TTL,
+    max_item_bytes=settings.RESULT_ARTIFACT_MAX_ITEM_BYTES
+)
@@ -0,0 +1,121 @@
+"""
+查询结果JSON编码
+
+按列(向量化)把 DataFrame 规范为可JSON序列化的值, 再用 orjson 编码:
+    - 日期/时间列 -> YYYY-MM-DD 字符串
+    - NaN / inf / NaT / pd.NA -> null
+    - Decimal 列 -> float
+
+支持两种数据形状:
+    - records: [{"列名": 值, ...}, ...]
+    - columns: {"columns": ["列名", ...], "data": [[值, ...], ...]}  (不重复列名,体积更小)
+"""
+import datetime
+import decimal
+from typing import Any, Dict, List, Union
+
+import numpy as np
+import orjson
+import pandas as pd
+from fastapi.responses import Response
+
+# 返回给前端的数据形状
+DATA_FORMAT_RECORDS = "records"
+DATA_FORMAT_COLUMNS = "columns"
+DATA_FORMATS = (DATA_FORMAT_RECORDS, DATA_FORMAT_COLUMNS)
+
+DATE_FORMAT = "%Y-%m-%d"
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _normalize_column(col: pd.Series) -> pd.Series:
+    """把一列转换为JSON安全的值(整列处理,不逐个单元格判断)"""
+    if pd.api.types.is_datetime64_any_dtype(col):
+        return col.dt.strftime(DATE_FORMAT).astype(object).where(col.notna(), None)
+
+    if pd.api.types.is_float_dtype(col):
+        values = col.to_numpy(dtype=float, na_value=np.nan)
+        return col.astype(object).where(np.isfinite(values), None)
+
+    if isinstance(col.dtype, pd.api.extensions.ExtensionDtype):
+        # 可空整数/布尔/字符串等扩展类型, pd.NA 转为 None
+        return col.astype(object).where(col.notna(), None)
+
+    if col.dtype != object:
+        # 普通整数/布尔列无缺失值, to_dict/tolist 会转换为Python类型
+        return col
+
+    inferred = pd.api.types.infer_dtype(col, skipna=True)
+    if inferred in ("datetime", "datetime64", "date"):
+        try:
+            converted = pd.to_datetime(col, errors="coerce")
+        except (TypeError, ValueError):
+            # 混合时区等无法整列转换的情况,由编码器逐个处理
+            return col.where(col.notna(), None)
+        formatted = converted.dt.strftime(DATE_FORMAT).astype(object)
+        # 无法解析为日期的值保留原值
+        return formatted.where(converted.notna(), col.where(col.notna(), None))
+    if inferred == "decimal":
+        values = pd.to_numeric(col, errors="coerce").astype(float)
+        return values.astype(object).where(np.isfinite(values.to_numpy()), None)
+    return col.where(col.notna(), None)
+
+
+def normalize_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    """按列规范化为JSON安全的值"""
+    return pd.DataFrame(
+        {col: _normalize_column(df[col]) for col in df.columns},
+        index=df.index,
+        columns=df.columns
+    )
+
+
+def to_json_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """转换为可JSON序列化的记录列表"""
+    return normalize_dataframe(df).to_dict(orient="records")
+
+
+def to_json_columns(df: pd.DataFrame) -> Dict[str, Any]:
+    """转换为列式结构 {columns, data}"""
+    normalized = normalize_dataframe(df)
+    return {
+        "columns": [str(col) for col in df.columns],
+        "data": normalized.to_numpy(dtype=object).tolist()
+    }
+
+
+def to_json_data(df: pd.DataFrame, data_format: str = DATA_FORMAT_RECORDS) -> Union[List[Dict[str, Any]], Dict[str, Any]]:
+    """按指定形状转换结果数据"""
+    if data_format == DATA_FORMAT_COLUMNS:
+        return to_json_columns(df)
+    return to_json_records(df)
+
+
+def _default(obj: Any) -> Any:
+    """orjson无法直接编码的类型"""
+    if obj is pd.NA or obj is pd.NaT:
+        return None
+    if isinstance(obj, pd.Timestamp):
+        return obj.strftime(DATE_FORMAT)
+    if isinstance(obj, datetime.date):
+        return obj.isoformat()
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return str(obj)
+
+
+def dumps(obj: Any) -> bytes:
+    """使用orjson编码(支持numpy类型, NaN/inf编码为null)"""
+    return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+
+
+class ResultJSONResponse(Response):
+    """使用orjson编码的JSON响应,跳过FastAPI逐层的jsonable_encoder转换"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
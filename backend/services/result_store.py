@@ -0,0 +1,283 @@
+"""
+查询结果存储(Result Artifact Store)
+
+一次查询的结果 DataFrame 只序列化一次: Arrow IPC(zstd压缩)格式,以内容哈希作为引用(结果句柄)
+    - Redis: 热数据,供洞察分析等短期消费者读取
+      RESULT_ARTIFACT_TTL 未访问后过期, 总大小超过 RESULT_ARTIFACT_MAX_BYTES 时按最近最少访问淘汰
+    - MinIO: 持久化,供对话历史中的图表数据按引用加载
+
+JSON 只在需要返回给前端时按需生成
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+
+from api.dependencies.dependencies import redis_client
+from core.config import settings
+from services.result_encoding import to_json_records
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_CONTENT_TYPE = "application/vnd.apache.arrow.stream"
+
+
+@dataclass
+class ResultArtifact:
+    """结果引用"""
+    digest: str
+    rows: int
+    columns: List[str]
+    size: int
+
+    def to_ref(self) -> Dict[str, Any]:
+        return {
+            'digest': self.digest,
+            'rows': self.rows,
+            'columns': self.columns,
+            'size': self.size
+        }
+
+
+def _to_arrow_table(df: pd.DataFrame) -> pa.Table:
+    """DataFrame转Arrow表,类型无法推断的object列转为字符串"""
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+        df = df.copy()
+        for col in df.columns:
+            if df[col].dtype == object:
+                df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def serialize_dataframe(df: pd.DataFrame) -> bytes:
+    """序列化为zstd压缩的Arrow IPC流"""
+    table = _to_arrow_table(df)
+    sink = pa.BufferOutputStream()
+    options = pa.ipc.IpcWriteOptions(compression='zstd')
+    with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def deserialize_dataframe(payload: bytes) -> pd.DataFrame:
+    """反序列化Arrow IPC流"""
+    with pa.ipc.open_stream(payload) as reader:
+        return reader.read_all().to_pandas()
+
+
+class ResultArtifactStore:
+    """内容寻址的查询结果存储"""
+
+    CACHE_KEY_PREFIX = "result_artifact"
+    OBJECT_PREFIX = "results"
+    # 缓存索引: 有序集合(digest -> 最后访问时间)、哈希(digest -> 字节数)、总字节数
+    INDEX_KEY = "result_artifact_index"
+    SIZES_KEY = "result_artifact_sizes"
+    TOTAL_KEY = "result_artifact_bytes"
+
+    # 登记新结果,清理已过期的索引项,总大小超过上限时按最近最少访问淘汰
+    _CACHE_SCRIPT = """
+    local prefix, digest = ARGV[1], ARGV[2]
+    local size, now, ttl, max_bytes = tonumber(ARGV[3]), tonumber(ARGV[4]), tonumber(ARGV[5]), tonumber(ARGV[6])
+
+    local function forget(d)
+        local s = tonumber(redis.call('HGET', KEYS[2], d) or '0')
+        redis.call('HDEL', KEYS[2], d)
+        redis.call('ZREM', KEYS[1], d)
+        redis.call('DECRBY', KEYS[3], s)
+    end
+
+    for _, d in ipairs(redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now - ttl)) do
+        forget(d)
+    end
+
+    if digest ~= '' then
+        if redis.call('HEXISTS', KEYS[2], digest) == 0 then
+            redis.call('HSET', KEYS[2], digest, size)
+            redis.call('INCRBY', KEYS[3], size)
+        end
+        redis.call('ZADD', KEYS[1], now, digest)
+    end
+
+    local total = tonumber(redis.call('GET', KEYS[3]) or '0')
+    local evicted = 0
+    while total > max_bytes do
+        local oldest = redis.call('ZRANGE', KEYS[1], 0, 0)
+        if #oldest == 0 then break end
+        local s = tonumber(redis.call('HGET', KEYS[2], oldest[1]) or '0')
+        redis.call('DEL', prefix .. oldest[1])
+        forget(oldest[1])
+        total = total - s
+        evicted = evicted + 1
+    end
+    if total < 0 then
+        redis.call('SET', KEYS[3], 0)
+        total = 0
+    end
+    return {total, evicted}
+    """
+
+    def __init__(self, ttl: int, max_bytes: int, max_item_bytes: int):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self._cache_script = redis_client.register_script(self._CACHE_SCRIPT)
+        self._evicted = 0
+
+    def _cache_key(self, digest: str) -> str:
+        return f"{self.CACHE_KEY_PREFIX}:{digest}"
+
+    def _object_name(self, digest: str) -> str:
+        return f"{self.OBJECT_PREFIX}/{digest[:2]}/{digest}.arrow"
+
+    async def _register(self, digest: str = "", size: int = 0) -> int:
+        """登记缓存项并执行淘汰,返回当前缓存总字节数"""
+        total, evicted = await self._cache_script(
+            keys=[self.INDEX_KEY, self.SIZES_KEY, self.TOTAL_KEY],
+            args=[f"{self.CACHE_KEY_PREFIX}:", digest, size, int(time.time()), self.ttl, self.max_bytes]
+        )
+        if evicted:
+            self._evicted += evicted
+            logger.info(f"查询结果缓存超过 {self.max_bytes} 字节,已淘汰 {evicted} 项")
+        return total
+
+    async def _cache(self, digest: str, payload: bytes) -> bool:
+        """写入Redis缓存(超过单项上限的结果不缓存)"""
+        if len(payload) > self.max_item_bytes:
+            return False
+        try:
+            await redis_client.set(self._cache_key(digest), payload, ex=self.ttl)
+            await self._register(digest, len(payload))
+            return True
+        except Exception as e:
+            logger.warning(f"缓存查询结果失败: {digest}, {e}")
+            return False
+
+    async def _upload(self, digest: str, payload: bytes):
+        from core.minio_client import async_minio
+
+        object_name = self._object_name(digest)
+        if not await async_minio.file_exists(object_name):
+            await async_minio.upload_file(payload, object_name, ARTIFACT_CONTENT_TYPE)
+
+    async def put(self, df: pd.DataFrame) -> ResultArtifact:
+        """
+        序列化结果并写入Redis(持久化到MinIO由 persist 在后台完成)
+
+        超过 RESULT_ARTIFACT_MAX_ITEM_BYTES 的结果不进入Redis,直接写入MinIO
+
+        Returns:
+            结果引用,digest 即结果句柄
+        """
+        payload = await asyncio.to_thread(serialize_dataframe, df)
+        digest = hashlib.sha256(payload).hexdigest()
+        artifact = ResultArtifact(
+            digest=digest,
+            rows=len(df),
+            columns=[str(col) for col in df.columns],
+            size=len(payload)
+        )
+
+        if not await self._cache(digest, payload):
+            await self._upload(digest, payload)
+
+        return artifact
+
+    async def persist(self, digest: str) -> bool:
+        """将Redis中的结果持久化到MinIO(相同内容只写一次)"""
+        from core.minio_client import async_minio
+
+        try:
+            if await async_minio.file_exists(self._object_name(digest)):
+                return True
+            payload = await redis_client.get(self._cache_key(digest))
+            if payload is None:
+                logger.warning(f"持久化查询结果失败,缓存已过期或被淘汰: {digest}")
+                return False
+            await self._upload(digest, payload)
+            return True
+        except Exception as e:
+            logger.error(f"持久化查询结果失败: {digest}, {e}")
+            return False
+
+    async def get_bytes(self, digest: str) -> Optional[bytes]:
+        """读取序列化结果: 先读Redis,未命中时从MinIO加载并回填Redis"""
+        from core.minio_client import async_minio
+
+        key = self._cache_key(digest)
+        try:
+            payload = await redis_client.get(key)
+            if payload is not None:
+                # 刷新访问时间和过期时间(最近最少访问淘汰)
+                await redis_client.expire(key, self.ttl)
+                await redis_client.zadd(self.INDEX_KEY, {digest: int(time.time())}, xx=True)
+                return payload
+        except Exception as e:
+            logger.warning(f"读取结果缓存失败: {digest}, {e}")
+
+        try:
+            payload = await async_minio.download_file(self._object_name(digest))
+        except Exception as e:
+            logger.warning(f"查询结果不存在: {digest}, {e}")
+            return None
+
+        await self._cache(digest, payload)
+        return payload
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """缓存占用统计"""
+        total = await self._register()
+        count = await redis_client.zcard(self.INDEX_KEY)
+        return {
+            "cached_items": count,
+            "cached_bytes": total,
+            "max_bytes": self.max_bytes,
+            "max_item_bytes": self.max_item_bytes,
+            "usage_ratio": round(total / self.max_bytes, 4) if self.max_bytes else None,
+            "ttl_seconds": self.ttl,
+            "evicted_by_worker": self._evicted
+        }
+
+    async def get_dataframe(self, digest: str) -> Optional[pd.DataFrame]:
+        """按引用读取结果DataFrame"""
+        payload = await self.get_bytes(digest)
+        if payload is None:
+            return None
+        return await asyncio.to_thread(deserialize_dataframe, payload)
+
+    async def get_records(self, digest: str) -> Optional[List[Dict[str, Any]]]:
+        """按引用读取结果并转换为JSON记录"""
+        payload = await self.get_bytes(digest)
+        if payload is None:
+            return None
+        return await asyncio.to_thread(lambda: to_json_records(deserialize_dataframe(payload)))
+
+    async def hydrate_chart_data(self, chart_data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        为按引用保存的图表数据补全 data 字段
+
+        对话消息中的图表数据只保存结果引用(result_ref),返回给前端前按需加载
+        """
+        if not chart_data or 'data' in chart_data or not chart_data.get('result_ref'):
+            return chart_data
+        records = await self.get_records(chart_data['result_ref']['digest'])
+        hydrated = dict(chart_data)
+        hydrated['data'] = records if records is not None else []
+        if records is None:
+            hydrated['result_missing'] = True
+        return hydrated
+
+
+# 全局结果存储实例
+result_store = ResultArtifactStore(
+    ttl=settings.RESULT_ARTIFACT_TTL,
+    max_bytes=settings.RESULT_ARTIFACT_MAX_BYTES,
+    max_item_bytes=settings.RESULT_ARTIFACT_MAX_ITEM_BYTES
+)
@@ -0,0 +1,456 @@
+"""
+聚合物化缓存(Rollup)
+
+仪表盘式的查询反复对同一数据集做相同维度的 GROUP BY(按月、按地区汇总销售额), 每次都要扫描整个Parquet。
+    1. 记录: 由用户问题生成的数据集查询写入 SysDatasetAction(dataset_id, generated_sql)
+    2. 规划: 后台任务(rollup)统计最近查询的 GROUP BY 形状(维度列集合 + 聚合列集合),
+       出现次数达到 ROLLUP_MIN_QUERIES 的形状预先聚合为小Parquet文件(rollups/ 目录)
+    3. 改写: 查询的维度和聚合被某个物化结果覆盖时, 把聚合函数改写为对物化结果的再聚合
+       (SUM -> SUM(部分和), COUNT -> SUM(部分计数), AVG -> SUM(部分和)/SUM(部分计数), MIN/MAX 不变)
+    4. 失效: 物化结果登记在 extra_metadata["rollups"] 并带有数据版本, 追加数据(版本变化)后不再使用,
+       下一次规划时删除并按新版本重建
+
+只处理单表、无子查询/JOIN/窗口函数/DISTINCT、聚合参数为单列的查询, 其他查询照常扫描原始数据
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from core.config import settings
+from core.minio_client import async_minio
+from db.session import async_session
+from models.sys_dataset import SysDataset, SysDatasetAction, SysDatasetColumn
+
+logger = logging.getLogger(__name__)
+
+# 可以由物化结果再聚合的函数
+AGGREGATES = {"sum", "count", "avg", "min", "max"}
+
+# 出现这些关键字的查询不做改写
+_UNSUPPORTED = {
+    "join", "union", "intersect", "except", "with", "over", "qualify", "window", "distinct",
+    "using", "sample", "tablesample", "pivot", "unpivot", "lateral", "recursive",
+}
+
+# 子句关键字(按出现位置判断标识符所在的子句)
+_CLAUSES = {"select", "from", "where", "group", "having", "order", "limit", "offset"}
+
+_TOKEN_RE = re.compile(
+    r"""
+      (?P<space>\s+|--[^\n]*|/\*.*?\*/)
+    | (?P<string>'(?:[^']|'')*')
+    | (?P<quoted>"(?:[^"]|"")*")
+    | (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+)
+    | (?P<ident>[^\W\d]\w*)
+    | (?P<op>::|<=|>=|<>|!=|\|\||.)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+
+@dataclass
+class _Token:
+    kind: str
+    text: str
+    start: int
+    end: int
+
+    @property
+    def value(self) -> str:
+        """标识符的比较值(DuckDB标识符不区分大小写, 引号标识符去掉引号)"""
+        if self.kind == "quoted":
+            return self.text[1:-1].replace('""', '"').lower()
+        return self.text.lower()
+
+    def is_ident(self, *values: str) -> bool:
+        return self.kind == "ident" and (not values or self.text.lower() in values)
+
+    def is_op(self, text: str) -> bool:
+        return self.kind == "op" and self.text == text
+
+
+@dataclass
+class QueryShape:
+    """GROUP BY查询的形状: 维度列(聚合函数外引用的列) + 聚合(函数, 列)"""
+    dims: FrozenSet[str]
+    measures: FrozenSet[Tuple[str, str]]
+    # 聚合函数调用在原SQL中的位置: (起始, 结束, 函数, 列)
+    calls: List[Tuple[int, int, str, str]] = field(default_factory=list, compare=False)
+
+    @property
+    def key(self) -> str:
+        text = "|".join(sorted(self.dims)) + "#" + "|".join(f"{f}:{c}" for f, c in sorted(self.measures))
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _tokenize(sql: str) -> List[_Token]:
+    return [
+        _Token(match.lastgroup, match.group(), match.start(), match.end())
+        for match in _TOKEN_RE.finditer(sql)
+        if match.lastgroup != "space"
+    ]
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def measure_column(func: str, col: str) -> str:
+    """物化结果中聚合列的列名"""
+    return "__agg_count_star__" if col == "*" else f"__agg_{func}__{col}"
+
+
+def parse_group_by_shape(sql: str, columns: List[str]) -> Optional[QueryShape]:
+    """
+    解析 "SELECT ... FROM dataset [WHERE ...] GROUP BY ..." 查询的形状
+
+    Args:
+        sql: 查询语句(表名为 dataset)
+        columns: 数据集的列名
+
+    Returns:
+        QueryShape; 不是可以由物化结果回答的查询时返回None
+    """
+    try:
+        tokens = _tokenize(sql)
+    except Exception:
+        return None
+    if not tokens or not tokens[0].is_ident("select"):
+        return None
+    if sum(1 for t in tokens if t.is_ident("select")) != 1:
+        return None
+    if any(t.is_ident(*_UNSUPPORTED) or t.is_op(".") for t in tokens):
+        return None
+    if not any(t.is_ident("group") and n.is_ident("by") for t, n in zip(tokens, tokens[1:])):
+        return None
+
+    # 表只能是 FROM dataset(不带别名)
+    table_refs = [i for i, t in enumerate(tokens) if t.is_ident("dataset")]
+    if len(table_refs) != 1 or not tokens[table_refs[0] - 1].is_ident("from"):
+        return None
+    after = tokens[table_refs[0] + 1] if table_refs[0] + 1 < len(tokens) else None
+    if after is not None and not (after.is_ident("where", "group", "order", "limit") or after.is_op(";")):
+        return None
+
+    by_name = {col.lower(): col for col in columns}
+    dims, measures, calls, aliases = set(), set(), [], set()
+    clause, depth = None, 0
+    # SELECT列表中当前项是否含聚合、是否有别名(含聚合的项必须有别名, 改写后列名才不变)
+    item_has_agg = item_has_alias = False
+
+    i = 0
+    while i < len(tokens):
+        tok = tokens[i]
+        nxt = tokens[i + 1] if i + 1 < len(tokens) else None
+
+        if depth == 0 and tok.is_ident(*_CLAUSES):
+            if clause == "select" and item_has_agg and not item_has_alias:
+                return None
+            clause = tok.text.lower()
+            i += 1
+            continue
+
+        if tok.is_op("("):
+            depth += 1
+        elif tok.is_op(")"):
+            depth -= 1
+        elif tok.is_op(","):
+            if clause == "select" and depth == 0:
+                if item_has_agg and not item_has_alias:
+                    return None
+                item_has_agg = item_has_alias = False
+        elif tok.is_op("*"):
+            prev = tokens[i - 1]
+            if prev.is_ident("select") or prev.is_op(","):
+                return None
+        elif tok.is_ident("as") or tok.is_op("::"):
+            # 别名或类型名
+            if nxt is not None and nxt.kind in ("ident", "quoted"):
+                if tok.is_ident("as") and clause == "select" and depth == 0:
+                    aliases.add(nxt.value)
+                    item_has_alias = True
+                i += 2
+                continue
+        elif tok.kind == "ident" and tok.value in AGGREGATES and nxt is not None and nxt.is_op("("):
+            # 聚合函数: 参数只能是单列或 COUNT(*)
+            arg = tokens[i + 2] if i + 2 < len(tokens) else None
+            close = tokens[i + 3] if i + 3 < len(tokens) else None
+            if arg is None or close is None or not close.is_op(")"):
+                return None
+            func = tok.value
+            if arg.is_op("*") and func == "count":
+                col = "*"
+            elif arg.kind in ("ident", "quoted") and arg.value in by_name:
+                col = by_name[arg.value]
+            else:
+                return None
+            calls.append((tok.start, close.end, func, col))
+            if func == "avg":
+                measures.update({("sum", col), ("count", col)})
+            else:
+                measures.add((func, col))
+            if clause == "select":
+                item_has_agg = True
+            i += 4
+            continue
+        elif tok.kind in ("ident", "quoted"):
+            if nxt is not None and nxt.is_op("("):
+                pass  # 函数名
+            elif clause in ("order", "having", "group") and tok.value in aliases:
+                pass  # 引用SELECT中的别名
+            elif tok.value in by_name:
+                dims.add(by_name[tok.value])
+            elif tok.kind == "quoted":
+                # 不存在的列, 查询本身会失败
+                return None
+        i += 1
+
+    if depth != 0 or not measures:
+        return None
+    return QueryShape(frozenset(dims), frozenset(measures), calls)
+
+
+def rewrite_for_rollup(sql: str, shape: QueryShape) -> str:
+    """把聚合函数改写为对物化结果的再聚合(表名仍为 dataset)"""
+    parts = []
+    last = 0
+    for start, end, func, col in sorted(shape.calls):
+        if func == "sum":
+            expr = f"SUM({_quote(measure_column('sum', col))})"
+        elif func == "count":
+            expr = f"CAST(SUM({_quote(measure_column('count', col))}) AS BIGINT)"
+        elif func == "avg":
+            expr = f"(SUM({_quote(measure_column('sum', col))}) / SUM({_quote(measure_column('count', col))}))"
+        else:
+            expr = f"{func.upper()}({_quote(measure_column(func, col))})"
+        parts.append(sql[last:start])
+        parts.append(expr)
+        last = end
+    parts.append(sql[last:])
+    return "".join(parts)
+
+
+def build_rollup_sql(shape: QueryShape, source: str) -> str:
+    """物化查询: 按维度列分组, 每个聚合保存可再聚合的部分结果"""
+    dims = [_quote(col) for col in sorted(shape.dims)]
+    aggs = []
+    for func, col in sorted(shape.measures):
+        arg = "*" if col == "*" else _quote(col)
+        aggs.append(f"{func.upper()}({arg}) AS {_quote(measure_column(func, col))}")
+    sql = f"SELECT {', '.join(dims + aggs)} FROM {source}"
+    if dims:
+        sql += f" GROUP BY {', '.join(dims)}"
+    return sql
+
+
+def find_rollup(dataset, sql: str) -> Optional[Dict[str, Any]]:
+    """
+    查找能回答该查询的物化结果(数据版本一致, 维度和聚合都被覆盖, 行数最少)
+
+    Returns:
+        {"object", "sql"(改写后的查询), "key"}; 没有时返回None
+    """
+    registry = (dataset.extra_metadata or {}).get("rollups")
+    if not registry or registry.get("version") != (dataset.version or 1) or not registry.get("items"):
+        return None
+    shape = parse_group_by_shape(sql, registry.get("columns") or [])
+    if shape is None:
+        return None
+
+    candidates = [
+        item for item in registry["items"]
+        if item.get("object")
+        and shape.dims <= set(item["dims"])
+        and shape.measures <= {tuple(m) for m in item["measures"]}
+    ]
+    if not candidates:
+        return None
+    best = min(candidates, key=lambda item: item["rows"])
+    return {"object": best["object"], "sql": rewrite_for_rollup(sql, shape), "key": best["key"]}
+
+
+async def record_dataset_query(
+    dataset_id: str,
+    sql: str,
+    question: Optional[str],
+    execution_time: int,
+    is_success: bool,
+    error_message: Optional[str] = None
+):
+    """记录数据集查询(物化规划的数据来源), 失败不影响查询"""
+    try:
+        async with async_session() as session:
+            session.add(SysDatasetAction(
+                dataset_id=uuid.UUID(str(dataset_id)),
+                input_text=question or sql,
+                generated_sql=sql,
+                execution_time=execution_time,
+                is_success=is_success,
+                error_message=error_message
+            ))
+            await session.commit()
+    except Exception as e:
+        logger.warning(f"记录数据集查询失败: {e}")
+
+
+async def schedule_rollup_refresh(dataset_id: str):
+    """提交物化规划任务(每个数据集每 ROLLUP_PLAN_INTERVAL 秒最多一次)"""
+    if not settings.ROLLUP_ENABLED:
+        return
+    from api.dependencies.dependencies import redis_client
+    from services.dataset_jobs import JOB_ROLLUP, enqueue_dataset_job
+    from services.job_queue import PRIORITY_LOW
+
+    try:
+        if await redis_client.set(f"rollup_plan:{dataset_id}", 1, nx=True, ex=settings.ROLLUP_PLAN_INTERVAL):
+            await enqueue_dataset_job(JOB_ROLLUP, dataset_id, PRIORITY_LOW)
+    except Exception as e:
+        logger.warning(f"提交物化规划任务失败: {dataset_id}, {e}")
+
+
+def _materialize(parquet_paths: List[str], sql: str, output_path: str) -> int:
+    """在DuckDB中执行物化查询并写入本地Parquet, 返回行数"""
+    import duckdb
+
+    target = "'" + output_path.replace("'", "''") + "'"
+    con = duckdb.connect()
+    try:
+        con.execute(f"COPY ({sql}) TO {target} (FORMAT PARQUET)")
+        return con.execute(f"SELECT COUNT(*) FROM read_parquet({target})").fetchone()[0]
+    finally:
+        con.close()
+
+
+async def _frequent_shapes(session, dataset_id, columns: List[str]) -> List[Tuple[QueryShape, int]]:
+    """最近的查询中出现次数达到阈值的GROUP BY形状(按次数降序)"""
+    result = await session.execute(
+        select(SysDatasetAction.generated_sql)
+        .where(
+            SysDatasetAction.dataset_id == dataset_id,
+            SysDatasetAction.generated_sql.isnot(None),
+            SysDatasetAction.is_success.is_(True)
+        )
+        .order_by(SysDatasetAction.executed_at.desc())
+        .limit(settings.ROLLUP_LOOKBACK)
+    )
+    counts: Dict[str, Tuple[QueryShape, int]] = {}
+    for (sql,) in result.all():
+        shape = parse_group_by_shape(sql, columns)
+        if shape is not None:
+            _, count = counts.get(shape.key, (shape, 0))
+            counts[shape.key] = (shape, count + 1)
+    frequent = [item for item in counts.values() if item[1] >= settings.ROLLUP_MIN_QUERIES]
+    frequent.sort(key=lambda item: item[1], reverse=True)
+    return frequent[:settings.ROLLUP_MAX_PER_DATASET]
+
+
+async def refresh_rollups(dataset_id: str) -> Dict[str, Any]:
+    """
+    规划并物化数据集的聚合结果
+
+    删除旧版本或不再频繁的物化结果, 为新出现的频繁形状生成物化结果
+
+    Returns:
+        {"version", "built", "kept", "removed"}
+    """
+    from services.duckdb_query import dataset_parquet_objects, get_parquet_paths, parquet_source
+
+    async with async_session() as session:
+        dataset = await session.get(SysDataset, uuid.UUID(str(dataset_id)))
+        if dataset is None or dataset.parse_status != 'parsed' or not dataset.parsed_path:
+            return {}
+        version = dataset.version or 1
+        row_count = dataset.row_count or 0
+        objects = dataset_parquet_objects(dataset)
+        registry = (dataset.extra_metadata or {}).get("rollups") or {}
+        result = await session.execute(
+            select(SysDatasetColumn.col_name)
+            .where(SysDatasetColumn.dataset_id == dataset.id)
+            .order_by(SysDatasetColumn.col_index)
+        )
+        columns = list(result.scalars().all())
+        frequent = await _frequent_shapes(session, dataset.id, columns)
+
+    wanted = {shape.key for shape, _ in frequent}
+    current = {item["key"]: item for item in registry.get("items", [])} if registry.get("version") == version else {}
+    kept = [item for key, item in current.items() if key in wanted]
+    removed = [
+        item["object"] for item in registry.get("items", [])
+        if item.get("object") and item not in kept
+    ]
+
+    built = []
+    max_rows = min(settings.ROLLUP_MAX_ROWS, int(row_count * settings.ROLLUP_MAX_RATIO))
+    missing = [shape for shape, _ in frequent if shape.key not in current]
+    if missing:
+        parquet_paths = await get_parquet_paths(objects)
+        for shape in missing:
+            fd, output_path = tempfile.mkstemp(suffix=".parquet", dir=settings.PARSE_TMP_DIR or None)
+            os.close(fd)
+            try:
+                rows = await asyncio.to_thread(
+                    _materialize, parquet_paths, build_rollup_sql(shape, parquet_source(parquet_paths)), output_path
+                )
+                item = {
+                    "key": shape.key,
+                    "dims": sorted(shape.dims),
+                    "measures": sorted([list(m) for m in shape.measures]),
+                    "rows": rows,
+                    "object": None,
+                    "created_at": datetime.now().isoformat()
+                }
+                # 物化结果不比原始数据小很多时不值得保存(仍登记, 避免每次规划重复计算)
+                if rows <= max_rows:
+                    with open(output_path, "rb") as f:
+                        object_name = f"rollups/{dataset_id}/v{version}_{shape.key}.parquet"
+                        await async_minio.upload_file(f.read(), object_name, "application/x-parquet")
+                    item["object"] = object_name
+                built.append(item)
+            except Exception as e:
+                logger.warning(f"数据集 {dataset_id} 物化失败: {sorted(shape.dims)}, {e}")
+            finally:
+                os.unlink(output_path)
+
+    # 登记结果: 期间数据版本变化(追加了数据)时放弃, 由追加后提交的规划任务重建
+    async with async_session() as session:
+        dataset = (await session.execute(
+            select(SysDataset)
+            .where(SysDataset.id == uuid.UUID(str(dataset_id)))
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        )).scalar_one_or_none()
+        if dataset is None or (dataset.version or 1) != version:
+            await session.rollback()
+            stale = [item["object"] for item in built if item["object"]]
+            if stale:
+                await async_minio.delete_files(stale)
+            logger.info(f"数据集 {dataset_id} 在物化期间版本已变化, 放弃本次结果")
+            return {}
+
+        metadata = dict(dataset.extra_metadata or {})
+        metadata["rollups"] = {"version": version, "columns": columns, "items": kept + built}
+        # JSONB整体赋值, 保证变更被SQLAlchemy检测到
+        dataset.extra_metadata = metadata
+        await session.commit()
+
+    if removed:
+        await async_minio.delete_files(removed)
+    logger.info(
+        f"数据集 {dataset_id} 物化规划完成: 版本 {version}, 新建 {len(built)}, 保留 {len(kept)}, 删除 {len(removed)}"
+    )
+    return {"version": version, "built": len(built), "kept": len(kept), "removed": len(removed)}
+
+
+def rollup_objects(dataset) -> List[str]:
+    """数据集的全部物化结果对象名(删除数据集时清理)"""
+    registry = (dataset.extra_metadata or {}).get("rollups") or {}
+    return [item["object"] for item in registry.get("items", []) if item.get("object")]
@@ -0,0 +1,134 @@
+"""
+文本文件编码与CSV格式识别
+
+只读取文件开头的 SNIFF_BYTES 字节, 一次性识别:
+    - BOM (UTF-8/UTF-16/UTF-32)
+    - 字符集: 严格UTF-8校验 -> charset_normalizer(已安装时) -> GB18030(兼容GBK/GB2312) -> latin1
+    - CSV分隔符、引号字符(csv.Sniffer)
+结果保存在 SysDataset.extra_metadata["text_format"], 之后的解析和预览直接使用, 不再逐个编码重试
+"""
+import codecs
+import csv
+import logging
+from typing import Any, Dict, Optional
+
+from core.minio_client import async_minio
+
+logger = logging.getLogger(__name__)
+
+# 识别时读取的字节数
+SNIFF_BYTES = 256 * 1024
+
+# 分隔符候选
+DELIMITERS = ",;\t|"
+
+# 按长度从长到短匹配(UTF-32 LE 的BOM以 UTF-16 LE 的BOM开头)
+_BOMS = [
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+
+def _decodes(sample: bytes, encoding: str) -> bool:
+    """样本能否按该编码解码(忽略样本末尾被截断的多字节字符)"""
+    try:
+        codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def detect_encoding(sample: bytes) -> Dict[str, Any]:
+    """识别字符集"""
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return {"encoding": encoding, "bom": True}
+
+    if _decodes(sample, "utf-8"):
+        return {"encoding": "utf-8", "bom": False}
+
+    try:
+        from charset_normalizer import from_bytes
+        best = from_bytes(sample).best()
+        if best is not None:
+            return {"encoding": best.encoding, "bom": False}
+    except ImportError:
+        pass
+
+    # 中文环境下非UTF-8的文本文件基本是GBK/GB2312, GB18030是它们的超集
+    if _decodes(sample, "gb18030"):
+        return {"encoding": "gb18030", "bom": False}
+    return {"encoding": "latin1", "bom": False}
+
+
+def decode_sample(sample: bytes, encoding: str) -> str:
+    """解码样本(末尾被截断的多字节字符丢弃)"""
+    return codecs.getincrementaldecoder(encoding)(errors="replace").decode(sample, final=False)
+
+
+def detect_dialect(text: str) -> Dict[str, Any]:
+    """识别CSV分隔符和引号字符"""
+    lines = text.splitlines()
+    # 最后一行可能在采样边界被截断
+    if len(lines) > 1 and not text.endswith(("\n", "\r")):
+        lines = lines[:-1]
+    head = "\n".join(lines[:200])
+    try:
+        dialect = csv.Sniffer().sniff(head, delimiters=DELIMITERS)
+        return {"delimiter": dialect.delimiter, "quotechar": dialect.quotechar or '"'}
+    except csv.Error:
+        return {"delimiter": ",", "quotechar": '"'}
+
+
+def sniff_text_format(sample: bytes, is_csv: bool = True) -> Dict[str, Any]:
+    """
+    识别文本文件格式
+
+    Args:
+        sample: 文件开头的字节(不超过 SNIFF_BYTES 即可)
+        is_csv: 是否同时识别CSV分隔符
+
+    Returns:
+        {"encoding", "bom", "delimiter", "quotechar"}
+    """
+    sample = sample[:SNIFF_BYTES]
+    text_format = detect_encoding(sample)
+    if is_csv:
+        text_format.update(detect_dialect(decode_sample(sample, text_format["encoding"])))
+    return text_format
+
+
+def csv_read_options(text_format: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """pandas.read_csv 的编码和分隔符参数"""
+    if not text_format:
+        return {"encoding": "utf-8"}
+    options = {"encoding": text_format["encoding"], "encoding_errors": "replace"}
+    if text_format.get("delimiter"):
+        options["sep"] = text_format["delimiter"]
+        options["quotechar"] = text_format.get("quotechar") or '"'
+    return options
+
+
+async def ensure_text_format(session, dataset, object_name: str) -> Dict[str, Any]:
+    """
+    获取数据集原文件的文本格式, 首次使用时识别并保存到 extra_metadata
+
+    Args:
+        session: 数据库会话(保存识别结果时提交)
+        dataset: SysDataset
+        object_name: 原文件对象名
+    """
+    text_format = (dataset.extra_metadata or {}).get("text_format")
+    if text_format:
+        return text_format
+
+    sample = await async_minio.read_range(object_name, 0, SNIFF_BYTES)
+    text_format = sniff_text_format(sample, is_csv=dataset.name.lower().endswith('.csv'))
+    # JSONB整体赋值, 保证变更被SQLAlchemy检测到
+    dataset.extra_metadata = {**(dataset.extra_metadata or {}), "text_format": text_format}
+    await session.commit()
+    logger.info(f"数据集 {dataset.id} 文本格式: {text_format}")
+    return text_format
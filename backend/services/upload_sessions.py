@@ -0,0 +1,179 @@
+"""
+可续传的分片上传会话
+
+基于MinIO分片上传(multipart upload), 上传进度保存在Redis中:
+    1. init: 客户端声明文件名和总大小, 服务端创建MinIO分片上传并返回分片大小和分片数
+    2. put-part: 客户端按序号上传分片(可并行、可重传), 每个分片在API进程中最多缓冲一次
+    3. complete: 所有分片到齐后合并为一个对象
+连接中断后, 客户端通过会话查询已上传的分片序号, 只需补传缺失的分片
+
+Redis键:
+    upload_session:{upload_id}  会话信息(JSON)
+    upload_parts:{upload_id}    已上传分片(哈希: 分片序号 -> {etag, size, md5})
+"""
+import json
+import logging
+import math
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+from api.dependencies.dependencies import redis_client
+from core.config import settings
+from core.minio_client import MIN_PART_SIZE, async_minio
+
+logger = logging.getLogger(__name__)
+
+# S3协议限制的最大分片数
+MAX_PARTS = 10000
+
+
+class UploadSessionError(ValueError):
+    """分片上传请求不合法(分片序号、大小不匹配等)"""
+
+
+class UploadSessionStore:
+    """分片上传会话管理"""
+
+    SESSION_PREFIX = "upload_session:"
+    PARTS_PREFIX = "upload_parts:"
+    COMPLETE_LOCK_PREFIX = "upload_complete_lock:"
+
+    def __init__(self, ttl: int, part_size: int, max_size: int):
+        self.ttl = ttl
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.max_size = max_size
+
+    def _session_key(self, upload_id: str) -> str:
+        return f"{self.SESSION_PREFIX}{upload_id}"
+
+    def _parts_key(self, upload_id: str) -> str:
+        return f"{self.PARTS_PREFIX}{upload_id}"
+
+    def plan_part_size(self, total_size: int) -> int:
+        """分片大小: 默认 UPLOAD_PART_SIZE, 文件过大时增大分片以保证不超过10000个分片(按MB取整)"""
+        mb = 1024 * 1024
+        required = math.ceil(total_size / MAX_PARTS)
+        return max(self.part_size, math.ceil(required / mb) * mb)
+
+    @staticmethod
+    def expected_part_size(session: Dict[str, Any], part_number: int) -> int:
+        """指定分片应有的字节数(最后一个分片为剩余大小)"""
+        if part_number < session["part_count"]:
+            return session["part_size"]
+        return session["total_size"] - session["part_size"] * (session["part_count"] - 1)
+
+    async def create(
+        self,
+        object_name: str,
+        filename: str,
+        total_size: int,
+        content_type: str,
+        metadata: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """创建上传会话"""
+        if total_size <= 0:
+            raise UploadSessionError("文件为空")
+        if total_size > self.max_size:
+            raise UploadSessionError(f"文件过大: 最大允许 {self.max_size / 1024 / 1024 / 1024:.1f}GB")
+
+        part_size = self.plan_part_size(total_size)
+        minio_upload_id = await async_minio.create_multipart_upload(object_name, content_type)
+
+        session = {
+            "upload_id": uuid.uuid4().hex,
+            "minio_upload_id": minio_upload_id,
+            "object_name": object_name,
+            "filename": filename,
+            "content_type": content_type,
+            "total_size": total_size,
+            "part_size": part_size,
+            "part_count": math.ceil(total_size / part_size),
+            "metadata": metadata,
+            "created_at": time.time(),
+        }
+        await redis_client.set(
+            self._session_key(session["upload_id"]),
+            json.dumps(session, ensure_ascii=False),
+            ex=self.ttl
+        )
+        logger.info(f"分片上传会话已创建: {session['upload_id']} {filename} ({total_size} 字节, {session['part_count']} 个分片)")
+        return session
+
+    async def get(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        payload = await redis_client.get(self._session_key(upload_id))
+        return json.loads(payload) if payload else None
+
+    async def list_parts(self, upload_id: str) -> Dict[int, Dict[str, Any]]:
+        """已上传的分片"""
+        raw = await redis_client.hgetall(self._parts_key(upload_id))
+        return {int(number): json.loads(value) for number, value in raw.items()}
+
+    async def put_part(self, session: Dict[str, Any], part_number: int, data: bytes, md5: str) -> Dict[str, Any]:
+        """上传一个分片到MinIO并记录(重复上传同一序号时覆盖)"""
+        if not 1 <= part_number <= session["part_count"]:
+            raise UploadSessionError(f"分片序号超出范围: 1-{session['part_count']}")
+        expected = self.expected_part_size(session, part_number)
+        if len(data) != expected:
+            raise UploadSessionError(f"分片 {part_number} 大小应为 {expected} 字节, 实际 {len(data)} 字节")
+
+        etag = await async_minio.upload_part(
+            session["object_name"],
+            session["minio_upload_id"],
+            part_number,
+            data
+        )
+        part = {"etag": etag, "size": len(data), "md5": md5}
+
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.hset(self._parts_key(session["upload_id"]), part_number, json.dumps(part))
+        # 有进展的会话延长有效期
+        pipe.expire(self._parts_key(session["upload_id"]), self.ttl)
+        pipe.expire(self._session_key(session["upload_id"]), self.ttl)
+        await pipe.execute()
+        return {"part_number": part_number, **part}
+
+    async def acquire_complete_lock(self, upload_id: str, timeout: int = 600) -> bool:
+        """防止同一会话被并发合并"""
+        return bool(await redis_client.set(f"{self.COMPLETE_LOCK_PREFIX}{upload_id}", 1, nx=True, ex=timeout))
+
+    async def release_complete_lock(self, upload_id: str):
+        await redis_client.delete(f"{self.COMPLETE_LOCK_PREFIX}{upload_id}")
+
+    async def complete(self, session: Dict[str, Any]) -> str:
+        """
+        合并所有分片
+
+        Returns:
+            文件的完整路径
+        """
+        parts = await self.list_parts(session["upload_id"])
+        missing = [n for n in range(1, session["part_count"] + 1) if n not in parts]
+        if missing:
+            raise UploadSessionError(f"还有 {len(missing)} 个分片未上传: {missing[:20]}")
+
+        return await async_minio.complete_multipart_upload(
+            session["object_name"],
+            session["minio_upload_id"],
+            [(n, parts[n]["etag"]) for n in range(1, session["part_count"] + 1)]
+        )
+
+    async def abort(self, session: Dict[str, Any]):
+        """取消上传, 清理MinIO中的分片和会话记录"""
+        await async_minio.abort_multipart_upload(
+            session["object_name"],
+            session["minio_upload_id"]
+        )
+        await self.discard(session["upload_id"])
+
+    async def discard(self, upload_id: str):
+        """删除会话记录"""
+        await redis_client.delete(self._session_key(upload_id), self._parts_key(upload_id))
+
+
+# 全局分片上传会话管理实例
+upload_sessions = UploadSessionStore(
+    ttl=settings.UPLOAD_SESSION_TTL,
+    part_size=settings.UPLOAD_PART_SIZE,
+    max_size=settings.CHUNKED_UPLOAD_MAX_SIZE
+)
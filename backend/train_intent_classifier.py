@@ -0,0 +1,212 @@
+"""
+本地意图分类器训练与离线评估脚本
+
+用途:
+    1. 从 sys_dataset_action 读取已记录的 (input_text, intent) 标注
+    2. 按比例划分训练集/测试集,训练并评估本地分类器
+    3. 报告准确率、各置信度阈值下的覆盖率(可节省的LLM调用比例)和单次预测耗时
+    4. 使用全部数据重新训练并保存模型文件(settings.INTENT_CLASSIFIER_PATH)
+
+执行方式:
+    python train_intent_classifier.py
+    python train_intent_classifier.py --threshold 0.9 --no-save
+    python train_intent_classifier.py --data labeled_intents.jsonl   # 使用导出的JSONL标注数据
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import Counter
+from pathlib import Path
+from typing import List, Tuple
+
+from core.config import settings
+from services.intent_classifier import LocalIntentClassifier, normalize_text, get_model_path
+from services.intent_router import IntentType, KEYWORD_GROUPS, classify_by_rules
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+INTENT_CLASSES = [
+    IntentType.CHITCHAT,
+    IntentType.QUERY,
+    IntentType.VISUALIZATION,
+    IntentType.HELP,
+]
+
+
+async def load_samples_from_db() -> List[Tuple[str, str]]:
+    """从sys_dataset_action读取意图标注"""
+    from sqlalchemy import select
+    from db.session import async_session, engine
+    from models.sys_dataset import SysDatasetAction
+
+    try:
+        async with async_session() as session:
+            result = await session.execute(
+                select(SysDatasetAction.input_text, SysDatasetAction.intent)
+                .where(SysDatasetAction.intent.in_(INTENT_CLASSES))
+                .order_by(SysDatasetAction.executed_at)
+            )
+            return [(row.input_text, row.intent) for row in result if row.input_text]
+    finally:
+        await engine.dispose()
+
+
+def load_samples_from_file(path: Path) -> List[Tuple[str, str]]:
+    """从JSONL文件读取意图标注,每行格式: {"input_text": "...", "intent": "..."}"""
+    samples = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if item.get('intent') in INTENT_CLASSES and item.get('input_text'):
+                samples.append((item['input_text'], item['intent']))
+    return samples
+
+
+def deduplicate(samples: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """按规范化文本去重,同一问题取出现次数最多的标注"""
+    votes = {}
+    for text, intent in samples:
+        votes.setdefault(normalize_text(text), (text, Counter()))[1][intent] += 1
+    return [(text, counter.most_common(1)[0][0]) for text, counter in votes.values()]
+
+
+def evaluate(
+    classifier: LocalIntentClassifier,
+    samples: List[Tuple[str, str]],
+    thresholds: List[float]
+) -> dict:
+    """
+    离线评估
+
+    LLM调用节省比例按线上流程计算:
+        规则匹配置信度>0.8 -> 不调用LLM
+        否则本地分类器置信度>=阈值 -> 不调用LLM
+        否则 -> 调用LLM(假设LLM结果等于标注)
+    """
+    predictions = []
+    start = time.perf_counter()
+    for text, _ in samples:
+        predictions.append(classifier.predict(text))
+    elapsed = time.perf_counter() - start
+
+    correct = sum(1 for (_, label), pred in zip(samples, predictions) if pred['intent'] == label)
+    per_class = {}
+    for intent in INTENT_CLASSES:
+        indices = [i for i, (_, label) in enumerate(samples) if label == intent]
+        if indices:
+            hits = sum(1 for i in indices if predictions[i]['intent'] == intent)
+            per_class[intent] = {'count': len(indices), 'recall': round(hits / len(indices), 4)}
+
+    rule_results = [classify_by_rules(text) for text, _ in samples]
+    rule_fast_path = [r['confidence'] > 0.8 for r in rule_results]
+    baseline_llm_calls = sum(1 for fast in rule_fast_path if not fast)
+
+    threshold_report = []
+    for threshold in thresholds:
+        llm_calls = 0
+        pipeline_correct = 0
+        covered = 0
+        covered_correct = 0
+        for (_, label), pred, rule, fast in zip(samples, predictions, rule_results, rule_fast_path):
+            if fast:
+                pipeline_correct += rule['intent'] == label
+            elif pred['confidence'] >= threshold:
+                covered += 1
+                covered_correct += pred['intent'] == label
+                pipeline_correct += pred['intent'] == label
+            else:
+                llm_calls += 1
+                pipeline_correct += 1
+
+        threshold_report.append({
+            'threshold': threshold,
+            'local_coverage': round(covered / len(samples), 4),
+            'local_precision': round(covered_correct / covered, 4) if covered else None,
+            'llm_calls': llm_calls,
+            'llm_calls_saved': round(1 - llm_calls / baseline_llm_calls, 4) if baseline_llm_calls else None,
+            'pipeline_accuracy': round(pipeline_correct / len(samples), 4)
+        })
+
+    return {
+        'samples': len(samples),
+        'accuracy': round(correct / len(samples), 4),
+        'per_class': per_class,
+        'avg_predict_us': round(elapsed / len(samples) * 1e6, 2),
+        'baseline_llm_calls': baseline_llm_calls,
+        'thresholds': threshold_report
+    }
+
+
+def print_report(report: dict):
+    logger.info("=" * 60)
+    logger.info(f"测试样本数: {report['samples']}")
+    logger.info(f"本地分类器准确率: {report['accuracy']:.2%}")
+    logger.info(f"单次预测平均耗时: {report['avg_predict_us']} μs")
+    for intent, stats in report['per_class'].items():
+        logger.info(f"  - {intent}: 样本 {stats['count']}, 召回率 {stats['recall']:.2%}")
+    logger.info(f"仅规则匹配时需要的LLM调用次数: {report['baseline_llm_calls']}")
+    logger.info("-" * 60)
+    logger.info(f"{'阈值':>6} {'本地覆盖':>8} {'本地精度':>8} {'LLM调用':>8} {'节省':>8} {'整体准确率':>10}")
+    for row in report['thresholds']:
+        precision = f"{row['local_precision']:.2%}" if row['local_precision'] is not None else '-'
+        saved = f"{row['llm_calls_saved']:.2%}" if row['llm_calls_saved'] is not None else '-'
+        logger.info(
+            f"{row['threshold']:>6.2f} {row['local_coverage']:>8.2%} {precision:>8} "
+            f"{row['llm_calls']:>8} {saved:>8} {row['pipeline_accuracy']:>10.2%}"
+        )
+    logger.info("=" * 60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="训练并评估本地意图分类器")
+    parser.add_argument('--data', type=Path, help="JSONL标注文件(默认从数据库读取)")
+    parser.add_argument('--test-ratio', type=float, default=0.2, help="测试集比例")
+    parser.add_argument('--threshold', type=float, default=settings.INTENT_CLASSIFIER_THRESHOLD, help="线上使用的置信度阈值")
+    parser.add_argument('--epochs', type=int, default=15, help="训练轮数")
+    parser.add_argument('--min-samples', type=int, default=50, help="最少样本数,不足时不保存模型")
+    parser.add_argument('--output', type=Path, default=None, help="模型输出路径")
+    parser.add_argument('--no-save', action='store_true', help="只评估,不保存模型")
+    args = parser.parse_args()
+
+    samples = load_samples_from_file(args.data) if args.data else asyncio.run(load_samples_from_db())
+    samples = deduplicate(samples)
+    logger.info(f"去重后标注样本数: {len(samples)}, 分布: {dict(Counter(label for _, label in samples))}")
+
+    if len(samples) < 10:
+        logger.error("标注样本过少,无法训练")
+        return
+
+    # 划分训练集/测试集
+    random.Random(42).shuffle(samples)
+    split = max(1, int(len(samples) * args.test_ratio))
+    test_set, train_set = samples[:split], samples[split:]
+
+    classifier = LocalIntentClassifier(INTENT_CLASSES, keyword_groups=KEYWORD_GROUPS)
+    classifier.fit(train_set, epochs=args.epochs)
+
+    thresholds = sorted({0.6, 0.7, 0.8, 0.9, 0.95, round(args.threshold, 2)})
+    report = evaluate(classifier, test_set, thresholds)
+    print_report(report)
+
+    if args.no_save:
+        return
+    if len(samples) < args.min_samples:
+        logger.warning(f"样本数少于 {args.min_samples},不保存模型")
+        return
+
+    # 使用全部数据重新训练后保存
+    final = LocalIntentClassifier(INTENT_CLASSES, keyword_groups=KEYWORD_GROUPS)
+    final.fit(samples, epochs=args.epochs)
+    final.metadata['evaluation'] = report
+    final.save(args.output or get_model_path())
+    logger.info("✓ 模型已保存,重启服务或调用 reload_local_classifier() 后生效")
+
+
+if __name__ == "__main__":
+    main()
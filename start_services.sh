@@ -69,6 +69,9 @@ echo "📝 下一步操作:"
 echo "  1. 启动后端服务:"
 echo "     cd backend && python main.py"
 echo ""
+echo "     (单进程启动时任务worker在API进程内运行; 生产模式需另开终端启动:"
+echo "      cd backend && python job_worker.py)"
+echo ""
 echo "  2. 启动前端服务 (另开终端):"
 echo "     cd frontend && pnpm dev"
 echo ""